@@ -0,0 +1,192 @@
+"""
+Inbound admission control: an adaptive concurrency limit per route class.
+
+Route classes (app.py maps route rules onto them):
+    upload    large or streamed request bodies (mood frames, voice, imports)
+    auth      bcrypt-bound sign-in/sign-up
+    upstream  routes that wait on TMDb or an LLM
+    default   everything else (cheap local work)
+
+Each class admits up to `limit` concurrent requests, and the limit adapts
+AIMD-style to observed latency. It grows by 1/limit for every request that
+finishes under the class's target latency. It is cut by DECREASE_FACTOR, at
+most once per DECREASE_WINDOW, when requests run slow. Requests over the
+limit wait in a bounded priority queue for at most max_wait seconds, with
+signed-in users ahead of anonymous traffic. Anonymous requests may only
+fill ANON_QUEUE_SHARE of the queue and get 429 past that. A full queue or
+an expired wait gets 503. Both carry Retry-After.
+
+Teardown runs as soon as a view returns, even for streamed responses, so
+a streamed response's slot is released when the server closes its body
+instead; those don't feed the latency signal. ADMISSION_CONTROL=0 turns the limiter off.
+"""
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+from flask import g, jsonify, request, session
+
+import metrics
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+DECREASE_FACTOR = 0.9
+DECREASE_WINDOW = 1.0
+ANON_QUEUE_SHARE = 0.5
+
+PRIORITY_SIGNED_IN = 0
+PRIORITY_ANONYMOUS = 1
+
+# class -> (initial limit, min, max, target latency s, queue size, max wait s)
+CLASS_SETTINGS = {
+    "upload": (4, 1, 16, 2.0, 8, 2.0),
+    "auth": (8, 2, 32, 0.5, 32, 1.0),
+    "upstream": (32, 4, 128, 1.0, 64, 2.0),
+    "default": (64, 16, 256, 0.25, 128, 1.0),
+}
+
+metrics.describe("admission_shed_total", "counter", "Requests turned away by admission control")
+metrics.describe("admission_queue_wait_seconds", "histogram", "Time admitted requests spent queued")
+metrics.describe("admission_limit_decreases_total", "counter", "Multiplicative decreases of a class's concurrency limit")
+
+
+class Shed(Exception):
+    """Request rejected; carries the HTTP status and Retry-After seconds"""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a bounded priority wait queue"""
+
+    def __init__(self, name, initial, min_limit, max_limit, target_latency, queue_size, max_wait):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.inflight = 0
+        self._cond = threading.Condition()
+        self._waiters = []      # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self._avg_latency = target_latency
+
+    def _has_room(self):
+        return self.inflight < int(self.limit)
+
+    def _shed(self, status, reason):
+        metrics.inc("admission_shed_total", route_class=self.name, reason=reason)
+        backlog = len(self._waiters) + 1
+        raise Shed(status, reason, max(1, math.ceil(self._avg_latency * backlog / self.limit)))
+
+    def acquire(self, priority_fn):
+        """Take a slot, queueing if needed; raises Shed. priority_fn is only called when queueing."""
+        with self._cond:
+            if not self._waiters and self._has_room():
+                self.inflight += 1
+                return
+        # Priority may need the session store, so it's looked up outside the lock
+        priority = priority_fn()
+        start = time.monotonic()
+        with self._cond:
+            if not self._waiters and self._has_room():
+                self.inflight += 1
+                return
+            if len(self._waiters) >= self.queue_size:
+                self._shed(503, "queue_full")
+            if priority > PRIORITY_SIGNED_IN and len(self._waiters) >= self.queue_size * ANON_QUEUE_SHARE:
+                self._shed(429, "anonymous")
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            deadline = start + self.max_wait
+            try:
+                while not (self._waiters[0] == ticket and self._has_room()):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._shed(503, "timeout")
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiters)
+                self.inflight += 1
+                self._cond.notify_all()
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+        metrics.observe("admission_queue_wait_seconds", time.monotonic() - start, route_class=self.name)
+
+    def release(self, latency=None):
+        """Free a slot; latency (seconds) adjusts the limit when given"""
+        with self._cond:
+            self.inflight -= 1
+            if latency is not None:
+                self._avg_latency += 0.1 * (latency - self._avg_latency)
+                if latency > self.target_latency:
+                    now = time.monotonic()
+                    if now - self._last_decrease >= DECREASE_WINDOW:
+                        self._last_decrease = now
+                        self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+                        metrics.inc("admission_limit_decreases_total", route_class=self.name)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+limiters = {name: AdaptiveLimiter(name, *settings) for name, settings in CLASS_SETTINGS.items()}
+
+
+def _priority():
+    return PRIORITY_SIGNED_IN if session.get("signed_in") else PRIORITY_ANONYMOUS
+
+
+def init_app(app, route_classes):
+    """Admit every request through its class limiter; route_classes maps
+    route rules to class names (None exempts a route, unlisted is "default")"""
+    if not ADMISSION_CONTROL:
+        return
+
+    @app.before_request
+    def admit_request():
+        rule = request.url_rule.rule if request.url_rule else None
+        route_class = route_classes.get(rule, "default")
+        if route_class is None:
+            return None
+        limiter = limiters[route_class]
+        try:
+            limiter.acquire(_priority)
+        except Shed as e:
+            response = jsonify({"error": "Server is busy, try again shortly"})
+            response.status_code = e.status
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response
+        g.admission = (limiter, time.monotonic())
+        return None
+
+    @app.after_request
+    def measure_admitted(response):
+        admitted = g.get("admission")
+        if admitted is None:
+            return response
+        if response.is_streamed:
+            # The generator does the work; hold the slot until the body is sent
+            g.pop("admission")
+            response.call_on_close(admitted[0].release)
+        else:
+            g.admission_latency = time.monotonic() - admitted[1]
+        return response
+
+    @app.teardown_request
+    def release_admitted(exc):
+        admitted = g.pop("admission", None)
+        if admitted is not None:
+            admitted[0].release(None if exc is not None else g.pop("admission_latency", None))
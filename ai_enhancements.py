@@ -3,6 +3,18 @@ import random
 import json
 from datetime import datetime
 
+import success_model
+from mood_classifier import MoodClassifier
+
+# Plot keyword stems per mood for movie_mood_analyzer
+MOOD_INDICATORS = {
+    "dark": ["death", "murder", "revenge", "betrayal", "war"],
+    "uplifting": ["love", "friendship", "hope", "victory", "family"],
+    "mysterious": ["secret", "hidden", "unknown", "puzzle", "investigation"],
+    "intense": ["chase", "fight", "escape", "survival", "danger"],
+    "emotional": ["loss", "sacrifice", "reunion", "forgiveness", "growth"]
+}
+
 class AIEnhancements:
     def __init__(self):
         self.movie_personalities = {
@@ -11,6 +23,7 @@ class AIEnhancements:
             "villain": ["cunning", "ruthless", "intelligent", "manipulative"],
             "comedy_star": ["funny", "witty", "energetic", "spontaneous"]
         }
+        self._mood_classifier = MoodClassifier(MOOD_INDICATORS)
         
     def generate_movie_trivia(self, movie_title):
         """Generate AI-powered movie trivia"""
@@ -36,22 +49,12 @@ class AIEnhancements:
     
     def predict_movie_success(self, genre, budget_range, cast_popularity):
         """AI prediction of movie success factors"""
-        success_factors = {
-            "high": 85 + random.randint(-10, 10),
-            "medium": 65 + random.randint(-15, 15),
-            "low": 45 + random.randint(-20, 20)
-        }
-        
-        base_score = success_factors.get(cast_popularity, 50)
-        
-        # Genre multipliers
-        genre_boost = {
-            "action": 1.1, "comedy": 1.05, "drama": 0.95,
-            "horror": 1.15, "sci-fi": 1.2, "romance": 0.9
-        }
-        
-        final_score = min(100, base_score * genre_boost.get(genre, 1.0))
-        return round(final_score, 1)
+        return float(success_model.predict_success([genre], [budget_range], [cast_popularity],
+                                                   model="ai", fold_case=False)[0])
+    
+    def predict_movie_success_batch(self, genres, budget_ranges, cast_popularity, seed=None):
+        """Vectorized predict_movie_success over whole columns; seed makes it reproducible"""
+        return success_model.predict_success(genres, budget_ranges, cast_popularity, seed=seed, model="ai")
     
     def generate_alternate_ending(self, movie_title, original_genre):
         """Generate AI alternate movie endings"""
@@ -83,18 +86,8 @@ class AIEnhancements:
     
     def movie_mood_analyzer(self, plot_keywords):
         """Analyze movie mood from plot keywords"""
-        mood_indicators = {
-            "dark": ["death", "murder", "revenge", "betrayal", "war"],
-            "uplifting": ["love", "friendship", "hope", "victory", "family"],
-            "mysterious": ["secret", "hidden", "unknown", "puzzle", "investigation"],
-            "intense": ["chase", "fight", "escape", "survival", "danger"],
-            "emotional": ["loss", "sacrifice", "reunion", "forgiveness", "growth"]
-        }
-        
-        detected_moods = []
-        for mood, keywords in mood_indicators.items():
-            if any(keyword in plot_keywords.lower() for keyword in keywords):
-                detected_moods.append(mood)
+        hits = self._mood_classifier.classify(plot_keywords)
+        detected_moods = [mood for mood in MOOD_INDICATORS if hits[mood]]
         
         return detected_moods if detected_moods else ["neutral"]
     
@@ -1,35 +1,110 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-import os, requests, base64, io, json, random
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, g, stream_with_context
+import os, re, time, requests, base64, io, json, random, hmac
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from openai import OpenAI
 import cv2
 import numpy as np
 from PIL import Image
-try:
-    import speech_recognition as sr
-except ImportError:
-    sr = None
-    print("⚠️ speech_recognition not available (voice search will be limited)")
 from free_ai import get_free_ai_response
 import bcrypt
 from database import (
     get_user_by_email, get_user_by_username, get_user_by_id,
     create_user, update_user_preferences,
     add_to_watchlist, remove_from_watchlist, get_watchlist,
-    add_rating, get_rating, get_all_ratings
+    add_rating, get_rating, get_all_ratings, get_rating_aggregates
 )
+import database
+from tmdb_client import tmdb_get
+from http_cache import (
+    cached_json_response, DETAIL_CACHE_CONTROL, SEARCH_CACHE_CONTROL,
+    CONTENT_CACHE_CONTROL, PRIVATE_CACHE_CONTROL, AUTOCOMPLETE_CACHE_CONTROL
+)
+from projection import project_detail, parse_fields, detail_fields, region_from_request, to_card
+from json_provider import get_json_provider_class
+from compression import compress_response
+from poster_cache import poster_cache, negotiate_format, POSTER_WIDTHS, FORMATS
+import metrics
+import session_store
+from autocomplete import title_index, NODE_TOP
+import voice_search as voice
+import success_model
+import mood_index
+import rating_aggregates
+import user_data
+import admission
+from heavy_hitters import hot_keys
+from profiler import profiler, render_collapsed, PROFILE_MAX_SECONDS, init_app as init_profiler
+from provider_index import provider_index, init_index as init_provider_index
+from rate_limiter import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH
+from face_detection import face_detector, detect_smiles
 
 load_dotenv()
 
 API_KEY = os.getenv("TMDB_API_KEY")
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 if not API_KEY:
     raise RuntimeError("TMDB_API_KEY missing. Put it in .env")
 # Temporarily disable OpenAI due to quota exceeded
 openai_client = None
 print("Using mock responses (OpenAI quota exceeded)")
 
-BASE_URL = "https://api.themoviedb.org/3"
+# Upstream cache lifetimes (seconds) for TMDb payloads
+DETAIL_TTL = 3600
+SEARCH_TTL = 300
+CONTENT_TTL = 600
+
+DETAIL_PARAMS = {
+    "language": "en-US",
+    "append_to_response": "videos,watch/providers,similar"
+}
+
+# Input limits (checked before any upstream call)
+MAX_TMDB_ID = 10_000_000
+MAX_QUERY_LENGTH = 100
+MAX_DISCOVER_PAGE = 500   # TMDb rejects pages above this
+SEARCH_TYPES = {"multi": "multi", "all": "multi", "movie": "movie", "movies": "movie", "tv": "tv"}
+CONTENT_TYPES = {"movie": "movie", "movies": "movie", "tv": "tv", "series": "tv"}
+
+# Batch detail hydration
+BATCH_MAX_ITEMS = 500
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+WATCHLIST_ENRICH_FIELDS = ["vote_average", "runtime", "episode_run_time", "genres", "watch/providers"]
+
+# Batch success scoring
+SCORE_MAX_ROWS = int(os.getenv("SCORE_MAX_ROWS", "5000000"))
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+# Frames accepted per /api/detect-mood request (detected as one batch)
+MAX_MOOD_FRAMES = 8
+MAX_PROVIDER_FILTER = 20
+
+# Admission control class per route rule; unlisted routes are "default", None is never limited
+ROUTE_CLASSES = {
+    "/api/detect-mood": "upload",
+    "/api/voice-search": "upload",
+    "/api/import": "upload",
+    "/api/predict-success/batch": "upload",
+    "/api/signin": "auth",
+    "/api/signup": "auth",
+    "/search": "upstream",
+    "/api/content": "upstream",
+    "/api/movies": "upstream",
+    "/movie/<int:movie_id>": "upstream",
+    "/tv/<int:series_id>": "upstream",
+    "/api/details/batch": "upstream",
+    "/poster/<size>/<filename>": "upstream",
+    "/api/chat": "upstream",
+    "/api/ai-match": "upstream",
+    "/api/generate-synopsis": "upstream",
+    "/api/movie-mashup": "upstream",
+    "/metrics": None,
+}
+
+POSTER_MAX_AGE = 31536000  # 1 year; poster paths are content-unique on TMDb
+POSTER_FILENAME_RE = re.compile(r"^[A-Za-z0-9_-]+\.(jpg|jpeg|png)$")
 
 # Map moods → TMDb genre IDs
 MOOD_TO_GENRES = {
@@ -54,10 +129,37 @@ GENRE_IDS = {
     "romance": 10749,
 }
 
+mood_index.init_index(MOOD_TO_GENRES)
+
 app = Flask(__name__)
+app.json_provider_class = get_json_provider_class()
+app.json = app.json_provider_class(app)
+app.after_request(compress_response)
 app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SESSION_PERMANENT'] = False
 app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 hours
+session_store.init_app(app, database.sessions_collection)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+init_profiler(app)
+admission.init_app(app, ROUTE_CLASSES)
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start,
+                        route=route, method=request.method, status=str(response.status_code))
+    return response
+
+# ✅ PROMETHEUS METRICS
+@app.route("/metrics")
+def metrics_endpoint():
+    return app.response_class(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def home():
@@ -75,97 +177,284 @@ def signup_page():
 def ai_dashboard():
     return render_template("ai_dashboard.html")
 
+def upstream_status(error):
+    """HTTP status to report for a failed TMDb call"""
+    response = getattr(error, "response", None)
+    return response.status_code if response is not None else 502
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so near-identical searches share cache entries"""
+    return " ".join((query or "").split()).lower()
+
+def fetch_details(content_type, tmdb_id, priority=PRIORITY_INTERACTIVE):
+    """Raw (cached) TMDb detail payload for a movie or TV series"""
+    return tmdb_get(f"/{content_type}/{tmdb_id}", DETAIL_PARAMS, ttl=DETAIL_TTL, priority=priority)
+
+def prefetch_details(content_type, tmdb_id):
+    return fetch_details(content_type, tmdb_id, PRIORITY_PREFETCH)
+
+# Provider availability index, refreshed with low-priority detail fetches
+init_provider_index(prefetch_details)
+
+def iter_details(pairs, region, fields=None):
+    """Resolve (content_type, tmdb_id) pairs with bounded concurrency.
+
+    Duplicates are fetched once. Yields (content_type, tmdb_id, projected,
+    status) in completion order; projected is None when the fetch failed.
+    """
+    unique = list(dict.fromkeys(pairs))
+    if not unique:
+        return
+    pool = ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(unique)))
+    try:
+        futures = {pool.submit(fetch_details, ct, tid): (ct, tid) for ct, tid in unique}
+        for future in as_completed(futures):
+            content_type, tmdb_id = futures[future]
+            try:
+                details = future.result()
+            except requests.RequestException as e:
+                yield content_type, tmdb_id, None, upstream_status(e)
+                continue
+            yield content_type, tmdb_id, project_detail(details, content_type, region, fields), 200
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def with_community_ratings(items):
+    """Copies of cards/results with the in-app average and count attached"""
+    keys = [rating_aggregates.aggregate_key(item.get("id"), item.get("type")) for item in items]
+    aggregates = get_rating_aggregates([key for key in keys if key])
+    return [
+        dict(item, community_rating=rating_aggregates.summary(aggregates.get(key, rating_aggregates.EMPTY)))
+        for item, key in zip(items, keys)
+    ]
+
+def provider_filter_from_request():
+    """(region, provider ids) from ?providers=8,337, or None; raises ValueError"""
+    raw = request.args.get("providers")
+    if not raw:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(p) for p in raw.split(",") if p.strip()))
+    except ValueError:
+        raise ValueError("providers must be a comma-separated list of provider ids")
+    if not ids or len(ids) > MAX_PROVIDER_FILTER:
+        raise ValueError(f"providers must list 1 to {MAX_PROVIDER_FILTER} provider ids")
+    return region_from_request(request), ids
+
+def listing_response(payload, cache_control, providers=None):
+    """Listing JSON with community ratings; narrowed to the ?providers= services when given"""
+    results = payload.get("results", [])
+    if providers:
+        region, ids = providers
+        results, unknown = provider_index.filter(results, region, ids)
+        payload = dict(payload, providers={"region": region, "ids": ids, "unknown": unknown})
+    response = cached_json_response(dict(payload, results=with_community_ratings(results)), cache_control)
+    if providers:
+        response.vary.add("Accept-Language")
+    return response
+
+def details_response(content_type, tmdb_id):
+    """Fetch a movie/TV detail payload and project it for the client"""
+    if not 0 < tmdb_id < MAX_TMDB_ID:
+        return jsonify({"error": "Not found"}), 404
+    hot_keys.record(f"{content_type}:{tmdb_id}", [(f"/{content_type}/{tmdb_id}", DETAIL_PARAMS, DETAIL_TTL)])
+
+    fields, unknown = parse_fields(request.args.get("fields"), content_type)
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    try:
+        details = fetch_details(content_type, tmdb_id)
+    except requests.RequestException as e:
+        return jsonify({"error": "Failed to fetch from TMDb"}), upstream_status(e)
+
+    projected = project_detail(details, content_type, region_from_request(request), fields)
+    if fields is None:
+        aggregate = get_rating_aggregates([(tmdb_id, content_type)]).get((tmdb_id, content_type), rating_aggregates.EMPTY)
+        projected["community_rating"] = rating_aggregates.summary(aggregate, histogram=True)
+    response = cached_json_response(projected, DETAIL_CACHE_CONTROL)
+    response.vary.add("Accept-Language")
+    return response
+
 # ✅ Movie Details (with trailer + providers + similar movies)
 @app.route("/movie/<int:movie_id>")
 def movie_details(movie_id):
-    params = {
-        "api_key": API_KEY,
-        "language": "en-US",
-        "append_to_response": "videos,watch/providers,similar"
-    }
-    details = requests.get(f"{BASE_URL}/movie/{movie_id}", params=params).json()
-    return jsonify(details)
+    return details_response("movie", movie_id)
 
 # ✅ TV Series Details (with trailer + providers + similar series)
 @app.route("/tv/<int:series_id>")
 def tv_details(series_id):
-    params = {
-        "api_key": API_KEY,
-        "language": "en-US",
-        "append_to_response": "videos,watch/providers,similar"
-    }
-    details = requests.get(f"{BASE_URL}/tv/{series_id}", params=params).json()
-    return jsonify(details)
+    return details_response("tv", series_id)
+
+# ✅ Batch Details (hydrate watchlists / lists of IDs, streamed as NDJSON)
+@app.route("/api/details/batch", methods=["POST"])
+def batch_details():
+    data = request.get_json(silent=True) or {}
+    items = data.get("items", [])
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items per batch"}), 400
+
+    pairs = []
+    for item in items:
+        if isinstance(item, dict):
+            tmdb_id, content_type = item.get("tmdb_id"), item.get("content_type", "movie")
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            tmdb_id, content_type = item
+        else:
+            return jsonify({"error": "Each item must be {tmdb_id, content_type} or [tmdb_id, content_type]"}), 400
+        try:
+            tmdb_id = int(tmdb_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Invalid tmdb_id: {tmdb_id!r}"}), 400
+        if content_type not in ("movie", "tv") or not 0 < tmdb_id < MAX_TMDB_ID:
+            return jsonify({"error": f"Invalid item: {item!r}"}), 400
+        pairs.append((content_type, tmdb_id))
+
+    fields = None
+    if data.get("fields"):
+        requested = data["fields"]
+        fields = requested.split(",") if isinstance(requested, str) else list(requested)
+        allowed = set(detail_fields("movie")) | set(detail_fields("tv"))
+        unknown = [f for f in fields if f not in allowed]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    region = region_from_request(request)
+
+    def generate():
+        for content_type, tmdb_id, details, status in iter_details(pairs, region, fields):
+            line = {"tmdb_id": tmdb_id, "content_type": content_type}
+            if details is None:
+                line.update(error="Failed to fetch from TMDb", status=status)
+            else:
+                line["details"] = details
+            yield app.json.dumps(line) + "\n"
+
+    return app.response_class(generate(), mimetype="application/x-ndjson")
+
+def search_tmdb(query, content_type):
+    """Search payload for a normalized query; content_type is multi, movie or tv.
+
+    Raises requests.HTTPError when a single-type search fails upstream.
+    """
+    if content_type == "multi":
+        # Search both movies and TV shows
+        # (cached payloads are shared, so results are copied before tagging)
+        combined_results = []
+        try:
+            movie_data = tmdb_get("/search/movie", {"query": query}, ttl=SEARCH_TTL)
+            for movie in movie_data.get("results", []):
+                combined_results.append(dict(movie, type="movie"))
+        except requests.HTTPError:
+            pass
+        
+        try:
+            tv_data = tmdb_get("/search/tv", {"query": query}, ttl=SEARCH_TTL)
+            for show in tv_data.get("results", []):
+                combined_results.append(dict(
+                    show,
+                    type="tv",
+                    title=show.get("name", ""),
+                    release_date=show.get("first_air_date", "")
+                ))
+        except requests.HTTPError:
+            pass
+        
+        return {"results": combined_results}
+
+    data = tmdb_get(f"/search/{content_type}", {"query": query}, ttl=SEARCH_TTL)
+    
+    # Add type to results
+    results = []
+    for item in data.get("results", []):
+        item = dict(item, type=content_type)
+        if content_type == "tv":
+            item["title"] = item.get("name", "")
+            item["release_date"] = item.get("first_air_date", "")
+        results.append(item)
+    return dict(data, results=results)
 
 @app.route("/search")
 def search():
-    query = request.args.get("q")
+    query = normalize_query(request.args.get("q"))
     # Support both 'type' and 'content-type' parameters
     content_type = request.args.get("type") or request.args.get("content-type", "multi")
     
     # Handle content type values from dropdown
-    if content_type in ["movies", "tv"]:
-        content_type = "movie" if content_type == "movies" else "tv"
+    content_type = SEARCH_TYPES.get(content_type.lower())
+    if content_type is None:
+        return jsonify({"error": "type must be one of: multi, movie, tv"}), 400
+    
+    if len(query) > MAX_QUERY_LENGTH:
+        return jsonify({"error": f"Query must be at most {MAX_QUERY_LENGTH} characters"}), 400
+    try:
+        providers = provider_filter_from_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     if not query:
         return jsonify({"results": []})
 
+    search_types = ["movie", "tv"] if content_type == "multi" else [content_type]
+    hot_keys.record(f"search:{content_type}:{query}",
+                    [(f"/search/{t}", {"query": query}, SEARCH_TTL) for t in search_types])
     try:
-        if content_type == "multi" or content_type == "all":
-            # Search both movies and TV shows
-            movie_url = f"{BASE_URL}/search/movie?api_key={API_KEY}&query={query}"
-            tv_url = f"{BASE_URL}/search/tv?api_key={API_KEY}&query={query}"
-            
-            movie_response = requests.get(movie_url, timeout=10)
-            tv_response = requests.get(tv_url, timeout=10)
-            
-            combined_results = []
-            if movie_response.status_code == 200:
-                movie_data = movie_response.json()
-                for movie in movie_data.get("results", []):
-                    movie["type"] = "movie"
-                    combined_results.append(movie)
-            
-            if tv_response.status_code == 200:
-                tv_data = tv_response.json()
-                for show in tv_data.get("results", []):
-                    show["type"] = "tv"
-                    show["title"] = show.get("name", "")
-                    show["release_date"] = show.get("first_air_date", "")
-                    combined_results.append(show)
-            
-            return jsonify({"results": combined_results})
-        else:
-            endpoint = "movie" if content_type == "movie" else "tv"
-            url = f"{BASE_URL}/search/{endpoint}?api_key={API_KEY}&query={query}"
-            response = requests.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                # Add type to results
-                for item in data.get("results", []):
-                    item["type"] = content_type
-                    if content_type == "tv":
-                        item["title"] = item.get("name", "")
-                        item["release_date"] = item.get("first_air_date", "")
-                return jsonify(data)
-            else:
-                return jsonify({"error": "Failed to fetch from TMDb"}), response.status_code
-    
+        payload = search_tmdb(query, content_type)
+    except requests.HTTPError as e:
+        return jsonify({"error": "Failed to fetch from TMDb"}), e.response.status_code
     except requests.RequestException as e:
         return jsonify({"error": f"Request failed: {str(e)}"}), 500
     except Exception as e:
         return jsonify({"error": f"Search error: {str(e)}"}), 500
+    return listing_response(payload, SEARCH_CACHE_CONTROL, providers)
+
+# ✅ AUTOCOMPLETE (local title index, no TMDb call)
+@app.route("/api/autocomplete")
+def autocomplete():
+    query = normalize_query(request.args.get("q"))
+    content_type = SEARCH_TYPES.get(request.args.get("type", "multi").lower())
+    if content_type is None:
+        return jsonify({"error": "type must be one of: multi, movie, tv"}), 400
+    if len(query) > MAX_QUERY_LENGTH:
+        return jsonify({"error": f"Query must be at most {MAX_QUERY_LENGTH} characters"}), 400
+    try:
+        limit = min(int(request.args.get("limit", 8)), NODE_TOP)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+
+    with metrics.timer("autocomplete_lookup_seconds"):
+        results = title_index.search(query, limit, None if content_type == "multi" else content_type)
+    return cached_json_response({"results": results}, AUTOCOMPLETE_CACHE_CONTROL)
 
 @app.route("/api/content")
 def content_by_mood_or_genre():
-    mood = request.args.get("mood")
-    genre = request.args.get("genre")
-    content_type = request.args.get("type", "movie")  # movie or tv
-    page = int(request.args.get("page", 1))
+    mood = (request.args.get("mood") or "").lower()
+    genre = (request.args.get("genre") or "").lower()
+    content_type = CONTENT_TYPES.get(request.args.get("type", "movie").lower())  # movie or tv
+    
+    # Reject bad parameters before spending upstream quota on them
+    if content_type is None:
+        return jsonify({"error": "type must be movie or tv"}), 400
+    if mood and mood not in MOOD_TO_GENRES:
+        return jsonify({"error": f"Unknown mood: {mood}"}), 400
+    if genre and genre != "all" and genre not in GENRE_IDS:
+        return jsonify({"error": f"Unknown genre: {genre}"}), 400
+    try:
+        page = int(request.args.get("page", 1))
+    except ValueError:
+        return jsonify({"error": "page must be an integer"}), 400
+    if not 1 <= page <= MAX_DISCOVER_PAGE:
+        return jsonify({"error": f"page must be between 1 and {MAX_DISCOVER_PAGE}"}), 400
+    try:
+        providers = provider_filter_from_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     params = {
-        "api_key": API_KEY,
         "include_adult": "false",
         "sort_by": "popularity.desc",
         "language": "en-US",
@@ -173,41 +462,148 @@ def content_by_mood_or_genre():
         "page": page,
     }
 
+    hot_key = f"content:{content_type}:" + (f"mood={mood}" if mood else f"genre={genre or 'all'}") + f":page={page}"
     if mood:
-        genres = MOOD_TO_GENRES.get(mood.lower(), [35])
+        # Mood-ranked page straight from the local tag index once it is warm
+        ranked = mood_index.mood_index.page(mood, content_type, page)
+        metrics.record_cache("mood_index", ranked is not None)
+        if ranked is not None:
+            hot_keys.record(hot_key)
+            cards, total_pages = ranked
+            return listing_response({
+                "page": page,
+                "total_pages": total_pages,
+                "results": cards
+            }, CONTENT_CACHE_CONTROL, providers)
+
+        genres = MOOD_TO_GENRES[mood]
         params["with_genres"] = ",".join(map(str, genres))
-        if mood.lower() == "nostalgic":
+        if mood == "nostalgic":
             if content_type == "movie":
                 params["primary_release_date.lte"] = "2000-12-31"
             else:
                 params["first_air_date.lte"] = "2000-12-31"
-    elif genre and genre.lower() != "all":
-        genres = [GENRE_IDS.get(genre.lower(), 35)]
+    elif genre and genre != "all":
+        genres = [GENRE_IDS[genre]]
         params["with_genres"] = ",".join(map(str, genres))
 
-    endpoint = "movie" if content_type == "movie" else "tv"
-    r = requests.get(f"{BASE_URL}/discover/{endpoint}", params=params, timeout=15)
-    r.raise_for_status()
-    data = r.json()
-
-    def to_card(m):
-        poster = m.get("poster_path")
-        return {
-            "id": m.get("id"),
-            "title": m.get("title") or m.get("name"),
-            "overview": m.get("overview") or "",
-            "poster": f"https://image.tmdb.org/t/p/w500{poster}" if poster else "",
-            "year": (m.get("release_date") or m.get("first_air_date") or "N/A")[:4],
-            "rating": m.get("vote_average", 0),
-            "type": content_type
-        }
+    endpoint = content_type
+    hot_keys.record(hot_key, [(f"/discover/{endpoint}", params, CONTENT_TTL)])
+    try:
+        data = tmdb_get(f"/discover/{endpoint}", params, ttl=CONTENT_TTL, timeout=15)
+    except requests.RequestException:
+        # No fresh or stale cards to fall back on
+        response = jsonify({"error": "Content is temporarily unavailable"})
+        response.headers["Retry-After"] = "30"
+        return response, 503
 
-    return jsonify({
+    return listing_response({
         "page": data.get("page"),
         "total_pages": data.get("total_pages"),
-        "results": [to_card(m) for m in data.get("results", [])]
+        "results": [to_card(m, content_type) for m in data.get("results", [])]
+    }, CONTENT_CACHE_CONTROL, providers)
+
+def admin_required(view):
+    """Operator endpoints: Authorization: Bearer $ADMIN_TOKEN (404 when no token is set)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        supplied = request.headers.get("Authorization", "").encode()
+        if not hmac.compare_digest(supplied, f"Bearer {ADMIN_TOKEN}".encode()):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+# ✅ HOT KEYS (decayed request counts for titles, searches and listing pages)
+@app.route("/api/admin/hot-keys")
+@admin_required
+def hot_keys_endpoint():
+    try:
+        limit = min(int(request.args.get("limit", 50)), hot_keys.k)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify({
+        "half_life_seconds": hot_keys.half_life,
+        "keys": [
+            {"key": key, "count": round(count, 2), "warmed": bool(specs)}
+            for key, count, specs in hot_keys.top(limit)
+        ]
     })
 
+# ✅ PROFILER (sampling profiles and slow-request captures, per worker process)
+@app.route("/api/admin/profiler", methods=["GET", "POST", "DELETE"])
+@admin_required
+def profiler_endpoint():
+    if request.method == "GET":
+        return jsonify(profiler.status())
+    if request.method == "DELETE":
+        profile = profiler.stop()
+        if profile is None:
+            return jsonify({"error": "No profile is running"}), 404
+        return jsonify(profile.summary())
+
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get("seconds", 30))
+        percent = None if data.get("percent") is None else float(data["percent"])
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds and percent must be numbers"}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({"error": f"seconds must be between 0 and {PROFILE_MAX_SECONDS}"}), 400
+    if percent is not None and not 0 < percent <= 100:
+        return jsonify({"error": "percent must be between 0 and 100"}), 400
+    profile = profiler.start(seconds, percent)
+    if profile is None:
+        return jsonify({"error": "A profile is already running"}), 409
+    return jsonify(profile.summary()), 201
+
+@app.route("/api/admin/profiler/<int:capture_id>/stacks")
+@admin_required
+def profiler_stacks(capture_id):
+    stacks = profiler.stacks(capture_id)
+    if stacks is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return app.response_class(render_collapsed(stacks), mimetype="text/plain", headers={
+        "Content-Disposition": f'attachment; filename="profile-{capture_id}.collapsed"'
+    })
+
+# ✅ WATCH PROVIDERS (services seen in the availability index for a region)
+@app.route("/api/providers")
+def watch_providers():
+    region = region_from_request(request)
+    response = cached_json_response({
+        "region": region,
+        "providers": provider_index.providers(region)
+    }, AUTOCOMPLETE_CACHE_CONTROL)
+    response.vary.add("Accept-Language")
+    return response
+
+# ✅ POSTER PROXY (resized, cached thumbnails)
+@app.route("/poster/<size>/<filename>")
+def poster(size, filename):
+    if size not in POSTER_WIDTHS:
+        return jsonify({"error": "Unknown poster size"}), 400
+    if not POSTER_FILENAME_RE.match(filename):
+        return jsonify({"error": "Invalid poster path"}), 400
+
+    fmt = negotiate_format(request)
+    try:
+        f, name = poster_cache.get_variant(f"/{filename}", size, fmt)
+    except requests.RequestException:
+        return jsonify({"error": "Poster unavailable"}), 502
+    except OSError:
+        return jsonify({"error": "Invalid poster image"}), 502
+
+    response = send_file(f, mimetype=FORMATS[fmt][1], etag=name,
+                         max_age=POSTER_MAX_AGE, conditional=True)
+    if response.status_code == 200 and response.content_length is None:
+        # send_file only sizes paths and buffers, not open files
+        response.content_length = os.fstat(f.fileno()).st_size
+    response.headers["Cache-Control"] = f"public, max-age={POSTER_MAX_AGE}, immutable"
+    response.vary.add("Accept")
+    return response
+
 # Keep old endpoint for backward compatibility
 @app.route("/api/movies")
 def movies_by_mood_or_genre():
@@ -242,25 +638,30 @@ def ai_chat():
 def detect_mood():
     try:
         data = request.get_json()
-        image_data = data.get("image", "")
+        # A single "image", or a few webcam "images" analyzed as one batch
+        frames_data = data.get("images") or ([data["image"]] if data.get("image") else [])
         
-        if not image_data:
+        if not frames_data:
             return jsonify({"error": "No image data provided"}), 400
+        if not isinstance(frames_data, list) or len(frames_data) > MAX_MOOD_FRAMES:
+            return jsonify({"error": f"images must be a list of at most {MAX_MOOD_FRAMES} frames"}), 400
         
-        # Decode base64 image
-        try:
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
+        # Decode base64 images
+        frames = []
+        for image_data in frames_data:
+            try:
+                image_bytes = base64.b64decode(image_data.split(',')[1])
+                nparr = np.frombuffer(image_bytes, np.uint8)
+                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            except Exception as img_error:
+                return jsonify({"error": "Failed to decode image"}), 400
             if img is None:
                 return jsonify({"error": "Invalid image format"}), 400
-                
-        except Exception as img_error:
-            return jsonify({"error": "Failed to decode image"}), 400
+            frames.append(img)
         
-        # Real-time facial emotion detection
-        mood, confidence = analyze_facial_emotion(img)
+        # Real-time facial emotion detection; the most confident frame wins
+        results = [r for r in analyze_facial_emotions(frames) if r[0]]
+        mood, confidence = max(results, key=lambda r: r[1]) if results else (None, 0)
         
         if mood:
             return jsonify({
@@ -275,23 +676,25 @@ def detect_mood():
         print(f"Mood detection error: {str(e)}")
         return jsonify({"error": "Mood detection failed. Please try again."}), 500
 
-def analyze_facial_emotion(img):
+@metrics.timed("facial_emotion_seconds")
+def analyze_facial_emotions(frames):
+    """(mood, confidence) per frame; (None, 0) where no face was found"""
+    try:
+        faces = face_detector.detect(frames)
+    except Exception as e:
+        print(f"Analysis error: {str(e)}")
+        return [(random.choice(['happy', 'relaxed', 'thoughtful']), 0.65) for _ in frames]
+    return [emotion_from_face(img, boxes[0]) if boxes else (None, 0)
+            for img, boxes in zip(frames, faces)]
+
+def emotion_from_face(img, face):
     try:
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        smile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_smile.xml')
-        
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-        
-        if len(faces) == 0:
-            return None, 0
-        
-        face = faces[0]
         x, y, w, h = face
         face_roi = gray[y:y+h, x:x+w]
         
         # Simple smile detection
-        smiles = smile_cascade.detectMultiScale(face_roi, 1.8, 20)
+        smiles = detect_smiles(face_roi)
         
         # Basic brightness analysis
         brightness = np.mean(face_roi)
@@ -317,12 +720,43 @@ def analyze_facial_emotion(img):
 # ✅ VOICE SEARCH
 @app.route("/api/voice-search", methods=["POST"])
 def voice_search():
+    """Stream audio in, stream NDJSON out: partial/final transcript lines,
+    then one line with the full transcript and its search results"""
+    if not voice.is_available():
+        return jsonify({"error": "Voice search is not configured"}), 503
+    content_type = SEARCH_TYPES.get(request.args.get("type", "multi").lower())
+    if content_type is None:
+        return jsonify({"error": "type must be one of: multi, movie, tv"}), 400
     try:
-        # This would handle audio file upload and convert to text
-        # For demo, return sample response
-        return jsonify({"transcript": "Find me a comedy movie with Will Smith"})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        decoder = voice.open_decoder(request.mimetype, request.mimetype_params)
+    except voice.AudioFormatError as e:
+        return jsonify({"error": str(e)}), 415
+    if not voice.try_admit():
+        return jsonify({"error": "Voice search is busy, try again shortly"}), 503, {"Retry-After": "2"}
+
+    stream = request.stream
+
+    def generate():
+        try:
+            for event in voice.transcribe(iter(lambda: stream.read(voice.READ_CHUNK), b""), decoder):
+                if "partial" in event:
+                    # Local title index only: no TMDb call per partial
+                    event["suggestions"] = title_index.search(event["partial"], 5)
+                elif "transcript" in event:
+                    query = normalize_query(event["transcript"])[:MAX_QUERY_LENGTH]
+                    event["results"] = []
+                    if query:
+                        try:
+                            event["results"] = search_tmdb(query, content_type)["results"]
+                        except requests.RequestException:
+                            event["error"] = "Search failed"
+                yield app.json.dumps(event) + "\n"
+        except voice.AudioFormatError as e:
+            yield app.json.dumps({"error": str(e)}) + "\n"
+
+    response = app.response_class(stream_with_context(generate()), mimetype="application/x-ndjson")
+    response.call_on_close(voice.release)
+    return response
 
 # ✅ AI MOVIE MATCHER
 @app.route("/api/ai-match", methods=["POST"])
@@ -392,31 +826,87 @@ def predict_success():
     budget = data.get("budget_range", "medium")
     cast = data.get("cast_popularity", "medium")
     
-    # Simple algorithm for success prediction
-    base_scores = {
-        "action": 65, "comedy": 60, "drama": 55, "horror": 70, "sci-fi": 62
-    }
-    
-    budget_multipliers = {
-        "low": 0.8, "medium": 1.0, "high": 1.2
-    }
-    
-    cast_multipliers = {
-        "low": 0.7, "medium": 1.0, "high": 1.3
-    }
-    
-    base_score = base_scores.get(genre, 60)
-    budget_mult = budget_multipliers.get(budget, 1.0)
-    cast_mult = cast_multipliers.get(cast, 1.0)
-    
-    # Add some randomness
-    random_factor = random.uniform(0.9, 1.1)
-    
-    final_score = int(base_score * budget_mult * cast_mult * random_factor)
-    final_score = min(95, max(25, final_score))  # Keep between 25-95%
+    final_score = int(success_model.predict_success([genre], [budget], [cast], fold_case=False)[0])
     
     return jsonify({"success_probability": final_score})
 
+def score_columns_from_request():
+    """(genres, budgets, casts, seed, model) from a JSON or Arrow batch request"""
+    if request.mimetype == ARROW_STREAM_MIMETYPE:
+        if success_model.pa is None:
+            raise ValueError("Arrow input needs pyarrow installed")
+        table = success_model.pa.ipc.open_stream(request.stream).read_all()
+        columns = {name: table.column(name) for name in success_model.DEFAULTS if name in table.column_names}
+        options = request.args
+        rows = table.num_rows
+    else:
+        data = request.get_json(silent=True) or {}
+        options = data
+        if "records" in data:
+            records = data["records"]
+            if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+                raise ValueError("records must be a list of objects")
+            columns = {name: [r.get(name, default) for r in records] for name, default in success_model.DEFAULTS.items()}
+            rows = len(records)
+        else:
+            columns = {name: data[name] for name in success_model.DEFAULTS if isinstance(data.get(name), list)}
+            rows = max((len(c) for c in columns.values()), default=0)
+    if not rows:
+        raise ValueError("Send records or genre/budget_range/cast_popularity columns")
+    if rows > SCORE_MAX_ROWS:
+        raise ValueError(f"At most {SCORE_MAX_ROWS} rows per batch")
+    for name, default in success_model.DEFAULTS.items():
+        columns.setdefault(name, [default] * rows)
+
+    model = options.get("model", "simple")
+    if model not in success_model.MODELS:
+        raise ValueError(f"model must be one of: {', '.join(success_model.MODELS)}")
+    seed = options.get("seed")
+    if seed is not None:
+        seed = int(seed)
+    return columns["genre"], columns["budget_range"], columns["cast_popularity"], seed, model
+
+# ✅ BATCH SUCCESS SCORING (NDJSON, or Arrow stream when accepted)
+@app.route("/api/predict-success/batch", methods=["POST"])
+def predict_success_batch():
+    try:
+        genres, budgets, casts, seed, model = score_columns_from_request()
+        chunks = success_model.iter_scores(genres, budgets, casts, seed=seed, model=model)
+        first = next(chunks)   # surfaces encoding errors before the response starts
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    metrics.inc("success_scored_rows_total", len(genres), model=model)
+
+    def all_chunks():
+        yield first
+        yield from chunks
+
+    wants_arrow = request.accept_mimetypes.quality(ARROW_STREAM_MIMETYPE) > 0 and success_model.pa is not None
+    if wants_arrow:
+        return app.response_class(arrow_stream(all_chunks()), mimetype=ARROW_STREAM_MIMETYPE)
+
+    def generate():
+        for start, scores in all_chunks():
+            yield "".join(f'{{"index":{i},"success_probability":{s}}}\n'
+                          for i, s in enumerate(scores.tolist(), start))
+
+    return app.response_class(generate(), mimetype="application/x-ndjson")
+
+def arrow_stream(chunks):
+    """Arrow IPC stream of (index, success_probability) record batches"""
+    pa = success_model.pa
+    schema_sent = False
+    for start, scores in chunks:
+        batch = pa.record_batch(
+            [pa.array(np.arange(start, start + len(scores))), pa.array(scores)],
+            names=["index", "success_probability"],
+        )
+        if not schema_sent:
+            yield batch.schema.serialize().to_pybytes()
+            schema_sent = True
+        yield batch.serialize().to_pybytes()
+    yield b"\xff\xff\xff\xff\x00\x00\x00\x00"   # end-of-stream marker
+
 # ✅ SIGN UP ENDPOINT
 @app.route("/api/signup", methods=["POST"])
 def signup():
@@ -445,12 +935,16 @@ def signup():
             return jsonify({"error": "Username already taken"}), 400
         
         # Hash password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        with metrics.timer("bcrypt_seconds", op="hashpw"):
+            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         
         # Create user
         user_id = create_user(username, email, password_hash, preferences)
         
         if user_id:
+            # New id on sign-up so a pre-login session id can't be reused
+            app.session_interface.regenerate(session)
+
             # Set session
             session['signed_in'] = True
             session['user_id'] = user_id
@@ -492,9 +986,14 @@ def signin():
             return jsonify({"error": "Invalid email or password"}), 401
         
         # Verify password
-        if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+        with metrics.timer("bcrypt_seconds", op="checkpw"):
+            password_ok = bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8'))
+        if not password_ok:
             return jsonify({"error": "Invalid email or password"}), 401
         
+        # New id on sign-in so a pre-login session id can't be reused
+        app.session_interface.regenerate(session)
+        
         # Set session
         session['signed_in'] = True
         session['user_id'] = str(user['_id'])
@@ -561,7 +1060,6 @@ def user_preferences():
         
         # Update preferences in database
         if update_user_preferences(user_id, preferences):
-            session['preferences'] = preferences
             return jsonify({"success": True})
         else:
             return jsonify({"error": "Failed to update preferences"}), 500
@@ -589,7 +1087,28 @@ def watchlist():
     if request.method == "GET":
         # Get user's watchlist
         watchlist_items = get_watchlist(user_id)
-        return jsonify({"watchlist": watchlist_items})
+        
+        # ?enrich=1 attaches ratings/runtime/genres/providers to each item
+        if request.args.get("enrich") in ("1", "true"):
+            pairs = []
+            for item in watchlist_items:
+                try:
+                    if item.get("content_type") in ("movie", "tv"):
+                        pairs.append((item["content_type"], int(item["tmdb_id"])))
+                except (TypeError, ValueError, KeyError):
+                    continue
+            resolved = {
+                (content_type, tmdb_id): details
+                for content_type, tmdb_id, details, _ in iter_details(
+                    pairs, region_from_request(request), WATCHLIST_ENRICH_FIELDS)
+            }
+            for item in watchlist_items:
+                try:
+                    item["details"] = resolved.get((item.get("content_type"), int(item.get("tmdb_id"))))
+                except (TypeError, ValueError):
+                    item["details"] = None
+        
+        return cached_json_response({"watchlist": watchlist_items}, PRIVATE_CACHE_CONTROL)
     
     elif request.method == "POST":
         # Add to watchlist
@@ -637,21 +1156,17 @@ def ratings():
         if tmdb_id:
             rating = get_rating(user_id, tmdb_id, content_type)
             if rating:
-                return jsonify({
+                return cached_json_response({
                     "rating": rating.get("rating"),
                     "review": rating.get("review", ""),
-                    "created_date": rating.get("created_date").isoformat() if rating.get("created_date") else None
-                })
+                    "created_date": rating.get("created_date")
+                }, PRIVATE_CACHE_CONTROL, last_modified=rating.get("created_date"))
             else:
-                return jsonify({"rating": None})
+                return cached_json_response({"rating": None}, PRIVATE_CACHE_CONTROL)
         else:
             # Get all ratings
             ratings_list = get_all_ratings(user_id)
-            # Convert datetime to string for JSON serialization
-            for rating in ratings_list:
-                if rating.get("created_date"):
-                    rating["created_date"] = rating["created_date"].isoformat()
-            return jsonify({"ratings": ratings_list})
+            return cached_json_response({"ratings": ratings_list}, PRIVATE_CACHE_CONTROL)
     
     elif request.method == "POST":
         # Save rating
@@ -672,5 +1187,53 @@ def ratings():
         else:
             return jsonify({"error": "Failed to save rating"}), 500
 
+# ✅ EXPORT / IMPORT (streamed: watchlist, ratings, preferences)
+@app.route("/api/export", methods=["GET"])
+def export_user_data():
+    if not session.get('signed_in'):
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    user_id = session.get('user_id')
+    fmt = request.args.get("format", "ndjson").lower()
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    kinds = [k.strip() for k in request.args.get("include", ",".join(user_data.KINDS)).split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in user_data.KINDS]
+    if unknown:
+        return jsonify({"error": f"Unknown record types: {', '.join(unknown)}"}), 400
+
+    records = user_data.export_records(user_id, kinds)
+    if fmt == "csv":
+        body, mimetype = user_data.to_csv(records), user_data.CSV_MIMETYPE
+    else:
+        body, mimetype = user_data.to_ndjson(records, app.json.dumps), user_data.NDJSON_MIMETYPE
+    response = app.response_class(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=moviemood-export.{fmt}"
+    response.headers["Cache-Control"] = PRIVATE_CACHE_CONTROL
+    return response
+
+@app.route("/api/import", methods=["POST"])
+def import_user_data():
+    """Stream NDJSON/CSV records in, stream NDJSON progress events out"""
+    if not session.get('signed_in'):
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    user_id = session.get('user_id')
+    if request.mimetype == user_data.CSV_MIMETYPE:
+        parse = user_data.parse_csv
+    elif request.mimetype in (user_data.NDJSON_MIMETYPE, "application/jsonl"):
+        parse = user_data.parse_ndjson
+    else:
+        return jsonify({"error": "Send text/csv or application/x-ndjson"}), 415
+
+    stream = request.stream
+
+    def generate():
+        lines = user_data.iter_lines(iter(lambda: stream.read(user_data.READ_CHUNK), b""))
+        for event in user_data.import_records(user_id, parse(lines)):
+            yield app.json.dumps(event) + "\n"
+
+    return app.response_class(stream_with_context(generate()), mimetype=user_data.NDJSON_MIMETYPE)
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
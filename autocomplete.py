@@ -0,0 +1,227 @@
+"""
+Search-as-you-type over titles harvested from TMDb payloads.
+
+Every title that passes through tmdb_client (search and discover pages,
+details and their "similar" lists) is added to a prefix trie under its
+normalized title and under each of its first few word starts, so "knight"
+finds "The Dark Knight". Each node keeps its NODE_TOP most popular items of
+each content type, so a lookup, with or without a type filter, is a walk of
+len(prefix) edges and a slice, never a subtree scan.
+
+The layout is array-backed to stay small: the edges of all nodes live in one
+dict keyed by node * 0x110000 + codepoint, per-node top lists are tuples of
+int item ids, and item attributes are parallel lists indexed by item id.
+Paths stop at MAX_DEPTH characters; the deepest nodes list every item below
+them so longer prefixes are filtered there.
+
+Every sighting stores an item's latest popularity. A rise promotes the item
+along its paths at once; a drop only re-sorts the lists it is already in,
+since the items that should replace it aren't known there. The rebuild
+thread re-derives every list from current popularity every
+AUTOCOMPLETE_REBUILD_INTERVAL seconds when anything dropped (0 disables).
+"""
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+
+from projection import payload_items
+from tmdb_client import add_payload_listener
+
+NODE_TOP = 10
+MAX_DEPTH = int(os.getenv("AUTOCOMPLETE_MAX_DEPTH", "16"))
+MAX_ITEMS = int(os.getenv("AUTOCOMPLETE_MAX_ITEMS", "200000"))
+MAX_WORD_STARTS = 4
+AUTOCOMPLETE_REBUILD_INTERVAL = float(os.getenv("AUTOCOMPLETE_REBUILD_INTERVAL", "900"))
+THUMBNAIL_URL = "/poster/w92"
+
+_EDGE_BASE = 0x110000
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def word_starts(key):
+    starts = [0] + [i + 1 for i, c in enumerate(key) if c == " "]
+    return starts[:MAX_WORD_STARTS]
+
+
+class TitleIndex:
+    """Popularity-ranked prefix index of movie and TV titles"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}                  # (content_type, tmdb_id) -> item id
+        self._keys = []                 # normalized titles
+        self._titles = []
+        self._types = []
+        self._tmdb_ids = array("q")
+        self._years = []
+        self._posters = []
+        self._popularity = array("d")
+        self._changed = set()           # item ids whose popularity changed since rebuild() began
+        self.drops = 0                  # popularity drops since then
+        # (edges, top lists, deep buckets), swapped as a unit by rebuild()
+        self._trie = ({}, [()], {})
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, content_type, item):
+        """Index one TMDb result/detail dict, or refresh its popularity"""
+        title = item.get("title") or item.get("name")
+        key = normalize(title)
+        if not key:
+            return
+        popularity = float(item.get("popularity") or 0)
+        with self._lock:
+            idx = self._ids.get((content_type, item["id"]))
+            if idx is None:
+                if len(self._keys) >= MAX_ITEMS:
+                    return
+                idx = len(self._keys)
+                self._ids[(content_type, item["id"])] = idx
+                self._keys.append(key)
+                self._titles.append(title)
+                self._types.append(sys.intern(content_type))
+                self._tmdb_ids.append(item["id"])
+                self._years.append(sys.intern((item.get("release_date") or item.get("first_air_date") or "")[:4]))
+                self._posters.append(item.get("poster_path") or "")
+                self._popularity.append(popularity)
+            elif popularity != self._popularity[idx]:
+                if popularity < self._popularity[idx]:
+                    self.drops += 1
+                self._popularity[idx] = popularity
+                self._changed.add(idx)
+            else:
+                return
+            self._insert(self._trie, idx)
+
+    def _insert(self, trie, idx):
+        edges, top, buckets = trie
+        key = self._keys[idx]
+        for start in word_starts(key):
+            node = 0
+            suffix = key[start:start + MAX_DEPTH]
+            for ch in suffix:
+                edge = node * _EDGE_BASE + ord(ch)
+                child = edges.get(edge)
+                if child is None:
+                    child = len(top)
+                    top.append(())
+                    edges[edge] = child
+                node = child
+                self._promote(top, node, idx)
+            if len(key) - start > MAX_DEPTH:
+                bucket = buckets.setdefault(node, [])
+                if idx not in bucket:
+                    bucket.append(idx)
+
+    def _promote(self, top, node, idx):
+        current = top[node]
+        popularity, types = self._popularity, self._types
+        if idx not in current:
+            same = [i for i in current if types[i] == types[idx]]
+            if len(same) >= NODE_TOP and popularity[idx] <= popularity[same[-1]]:
+                return
+            current = current + (idx,)
+        # Up to NODE_TOP per type, most popular first
+        kept, counts = [], {}
+        for i in sorted(current, key=lambda i: -popularity[i]):
+            count = counts.get(types[i], 0)
+            if count < NODE_TOP:
+                counts[types[i]] = count + 1
+                kept.append(i)
+        # Replace, never mutate: readers walk the trie without the lock
+        top[node] = tuple(kept)
+
+    def search(self, prefix, limit=NODE_TOP, content_type=None):
+        """Most popular titles with a word starting with prefix"""
+        query = normalize(prefix)
+        if not query or limit <= 0:
+            return []
+        edges, top, buckets = self._trie
+        node = 0
+        for ch in query[:MAX_DEPTH]:
+            node = edges.get(node * _EDGE_BASE + ord(ch))
+            if node is None:
+                return []
+        if len(query) > MAX_DEPTH:
+            needle = " " + query
+            candidates = sorted((i for i in buckets.get(node, ()) if needle in " " + self._keys[i]),
+                                key=lambda i: -self._popularity[i])
+        else:
+            candidates = top[node]
+
+        results = []
+        for idx in candidates:
+            if content_type and self._types[idx] != content_type:
+                continue
+            poster = self._posters[idx]
+            results.append({
+                "id": self._tmdb_ids[idx],
+                "title": self._titles[idx],
+                "type": self._types[idx],
+                "year": self._years[idx] or "N/A",
+                "poster": f"{THUMBNAIL_URL}{poster}" if poster else "",
+            })
+            if len(results) >= limit:
+                break
+        return results
+
+    def rebuild(self):
+        """Re-derive every node's top list exactly from current popularity"""
+        # Built off to the side so harvesting isn't blocked; items that
+        # arrive meanwhile are caught up under the lock before the swap
+        trie = ({}, [()], {})
+        with self._lock:
+            built = len(self._keys)
+            self._changed, self.drops = set(), 0
+        for idx in sorted(range(built), key=lambda i: -self._popularity[i]):
+            self._insert(trie, idx)
+        with self._lock:
+            for idx in self._changed.union(range(built, len(self._keys))):
+                self._insert(trie, idx)
+            self._trie = trie
+
+
+title_index = TitleIndex()
+
+
+@add_payload_listener
+def harvest_titles(path, data):
+    for content_type, item in payload_items(path, data):
+        title_index.add(content_type, item)
+
+
+def _rebuild_loop():
+    while True:
+        time.sleep(AUTOCOMPLETE_REBUILD_INTERVAL)
+        if not title_index.drops:
+            continue
+        try:
+            title_index.rebuild()
+        except Exception as e:
+            print(f"⚠️ Autocomplete rebuild failed: {e}")
+
+
+def _start_rebuilder():
+    threading.Thread(target=_rebuild_loop, name="autocomplete-rebuild", daemon=True).start()
+
+
+def _reset_after_fork():
+    title_index._lock = threading.Lock()
+    _start_rebuilder()
+
+
+if AUTOCOMPLETE_REBUILD_INTERVAL > 0:
+    _start_rebuilder()
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,130 @@
+"""
+Face detector benchmark: Haar cascades vs the OpenCV dnn backend.
+
+Runs every available backend over a fixed image set at several frame sizes
+and reports per-frame latency (single-frame calls), batched throughput,
+detection rate and false positives. Labels are a JSON file of
+{filename: face count}; images without a label are assumed to hold one
+face.
+
+The bundled fixture set is small but labelled: a portrait (one face, the
+Tcl/Tk demo image ouster.png), two speakers on a stage (two faces, Go's
+image/testdata video-001.png), a toy (no human face, video-005.gray.png)
+and a face-free screenshot. Point --images/--labels at a larger set for
+better recall numbers. The dnn backend needs its model: run
+`python face_detection.py fetch` first.
+
+Usage: python -m benchmarks.bench_faces [--images DIR] [--labels FILE]
+           [--sizes 640x480,1280x720,1920x1080] [--repeat 5] [--batch 8]
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from face_detection import DnnDetector, HaarDetector
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "faces")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def load_images(directory):
+    images = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            img = cv2.imread(os.path.join(directory, name))
+            if img is not None:
+                images[name] = img
+    return images
+
+
+def fit(img, size):
+    """Letterbox img into a size=(w, h) frame, like a webcam capture"""
+    w, h = size
+    scale = min(w / img.shape[1], h / img.shape[0])
+    resized = cv2.resize(img, (int(img.shape[1] * scale), int(img.shape[0] * scale)))
+    frame = np.zeros((h, w, 3), dtype=np.uint8)
+    y, x = (h - resized.shape[0]) // 2, (w - resized.shape[1]) // 2
+    frame[y:y + resized.shape[0], x:x + resized.shape[1]] = resized
+    return frame
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def bench(detector, frames, expected, repeat, batch):
+    detector.detect(frames[:1])   # warm up (model load, allocations)
+    latencies, found, false_positives = [], 0, 0
+    for _ in range(repeat):
+        for frame, want in zip(frames, expected):
+            start = time.perf_counter()
+            boxes = detector.detect([frame])[0]
+            latencies.append(time.perf_counter() - start)
+            found += min(len(boxes), want)
+            false_positives += max(0, len(boxes) - want)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i in range(0, len(frames), batch):
+            detector.detect(frames[i:i + batch])
+    batched_fps = repeat * len(frames) / (time.perf_counter() - start)
+    total = repeat * sum(expected)
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "fps": len(latencies) / sum(latencies),
+        "batched_fps": batched_fps,
+        "detection_rate": found / total if total else None,
+        "false_positives": false_positives / repeat,
+    }
+
+
+def format_rate(rate):
+    return "n/a" if rate is None else f"{rate:.0%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", default=FIXTURES, help="directory of test images")
+    parser.add_argument("--labels", help="JSON {filename: face count} (default: labels.json in --images)")
+    parser.add_argument("--sizes", default="640x480,1280x720,1920x1080")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="cv2.setNumThreads (0: OpenCV default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+    images = load_images(args.images)
+    if not images:
+        parser.error(f"no images in {args.images}")
+    labels_path = args.labels or os.path.join(args.images, "labels.json")
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path) as f:
+            labels = json.load(f)
+    expected = [labels.get(name, 1) for name in images]
+
+    detectors = [HaarDetector()]
+    try:
+        detectors.append(DnnDetector(batch=args.batch))
+    except cv2.error:
+        print("dnn model not found (run `python face_detection.py fetch`); only Haar is measured")
+
+    print(f"{len(images)} images, {sum(expected)} labelled faces")
+    print(f"{'size':<11}{'backend':<8}{'p50 ms':>9}{'p95 ms':>9}{'fps':>8}{'batch fps':>11}{'detected':>10}{'false +':>9}")
+    for size in args.sizes.split(","):
+        w, h = (int(v) for v in size.split("x"))
+        frames = [fit(img, (w, h)) for img in images.values()]
+        for detector in detectors:
+            r = bench(detector, frames, expected, args.repeat, args.batch)
+            print(f"{size:<11}{detector.name:<8}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['fps']:>8.1f}"
+                  f"{r['batched_fps']:>11.1f}{format_rate(r['detection_rate']):>10}{r['false_positives']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
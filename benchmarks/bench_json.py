@@ -0,0 +1,138 @@
+"""
+JSON serialization and compression benchmark.
+
+Compares Flask's stdlib-backed provider with the orjson-backed one on
+payloads shaped like our real responses, then measures gzip/brotli cost
+and ratio on the serialized bytes.
+
+Usage: python -m benchmarks.bench_json [--seconds 1.0]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from compression import brotli, compress_body
+from json_provider import FastJSONProvider, StdlibJSONProvider, orjson
+
+
+def make_search_multi(n=40):
+    """/search multi-type result: raw TMDb items with type tags"""
+    results = []
+    for i in range(n):
+        results.append({
+            "adult": False,
+            "backdrop_path": f"/backdrop{i}.jpg",
+            "genre_ids": [28, 12, 878],
+            "id": 1000 + i,
+            "original_language": "en",
+            "original_title": f"Original Title {i}",
+            "overview": "A lone hero must stop a galactic threat before time runs out. " * 3,
+            "popularity": 123.456 + i,
+            "poster_path": f"/poster{i}.jpg",
+            "release_date": "2019-05-01",
+            "title": f"Title {i}",
+            "video": False,
+            "vote_average": 7.3,
+            "vote_count": 4521 + i,
+            "type": "movie" if i % 2 else "tv",
+        })
+    return {"results": results}
+
+
+def make_detail(countries=60, similar=20, videos=30):
+    """Raw movie detail with appended videos, providers and similar"""
+    provider = {"logo_path": "/logo.jpg", "provider_id": 8, "provider_name": "Netflix", "display_priority": 1}
+    return {
+        "id": 27205,
+        "title": "Inception",
+        "overview": "Cobb, a skilled thief who commits corporate espionage by infiltrating the subconscious... " * 2,
+        "genres": [{"id": 28, "name": "Action"}, {"id": 878, "name": "Science Fiction"}],
+        "production_companies": [{"id": i, "name": f"Company {i}", "logo_path": None, "origin_country": "US"} for i in range(6)],
+        "spoken_languages": [{"english_name": "English", "iso_639_1": "en", "name": "English"}] * 4,
+        "runtime": 148,
+        "vote_average": 8.4,
+        "videos": {"results": [
+            {"iso_639_1": "en", "iso_3166_1": "US", "name": f"Clip {i}", "key": f"key{i}", "site": "YouTube",
+             "size": 1080, "type": "Trailer" if i < 3 else "Featurette", "official": True,
+             "published_at": "2010-07-01T00:00:00.000Z", "id": f"vid{i}"}
+            for i in range(videos)
+        ]},
+        "watch/providers": {"results": {
+            f"C{i:02d}": {"link": "https://www.themoviedb.org/movie/27205/watch", "flatrate": [provider] * 3,
+                          "rent": [provider] * 4, "buy": [provider] * 4}
+            for i in range(countries)
+        }},
+        "similar": {"page": 1, "total_pages": 50, "total_results": 1000,
+                    "results": make_search_multi(similar)["results"]},
+    }
+
+
+def make_ratings(n=200):
+    """/api/ratings list with native datetimes"""
+    now = datetime(2025, 1, 1)
+    return {"ratings": [
+        {"user_id": "64f0c2", "tmdb_id": 1000 + i, "content_type": "movie", "rating": i % 10 + 1,
+         "review": "Loved it" if i % 3 else "", "created_date": now - timedelta(hours=i)}
+        for i in range(n)
+    ]}
+
+
+PAYLOADS = {
+    "search_multi": make_search_multi(),
+    "detail_raw": make_detail(),
+    "ratings_200": make_ratings(),
+}
+
+
+def throughput(fn, seconds):
+    """Run fn repeatedly for ~seconds; return calls per second"""
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(20):
+            fn()
+        calls += 20
+        now = time.perf_counter()
+        if now >= deadline:
+            return calls / (now - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=1.0, help="time budget per measurement")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    providers = {"stdlib": StdlibJSONProvider(app)}
+    if orjson is not None:
+        providers["orjson"] = FastJSONProvider(app)
+    else:
+        print("orjson not installed; only the stdlib provider is measured")
+
+    print(f"{'payload':<14}{'provider':<10}{'bytes':>10}{'ops/s':>12}{'MB/s':>10}")
+    for name, payload in PAYLOADS.items():
+        baseline = None
+        for provider_name, provider in providers.items():
+            body = provider.dumps_bytes(payload)
+            rate = throughput(lambda: provider.dumps_bytes(payload), args.seconds)
+            baseline = baseline or rate
+            print(f"{name:<14}{provider_name:<10}{len(body):>10}{rate:>12.0f}"
+                  f"{rate * len(body) / 1e6:>10.1f}  x{rate / baseline:.2f}")
+
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    print()
+    print(f"{'payload':<14}{'encoding':<10}{'bytes':>10}{'ratio':>8}{'ops/s':>12}")
+    for name, payload in PAYLOADS.items():
+        body = StdlibJSONProvider(app).dumps_bytes(payload)
+        for encoding in encodings:
+            compressed = compress_body(body, encoding)
+            rate = throughput(lambda: compress_body(body, encoding), args.seconds)
+            print(f"{name:<14}{encoding:<10}{len(compressed):>10}"
+                  f"{len(body) / len(compressed):>8.1f}{rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
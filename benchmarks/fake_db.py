@@ -0,0 +1,212 @@
+"""
+In-memory stand-in for the MongoDB collections used by database.py.
+
+Implements the small slice of the pymongo Collection API the app relies on
+(equality/$in/$or filters, projections, sort, upserts with $set and $inc)
+so the load suite
+can exercise account routes without a MongoDB server.
+"""
+import copy
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+
+def _matches(doc, filter_):
+    for key, value in (filter_ or {}).items():
+        if key == "$or":
+            if not any(_matches(doc, f) for f in value):
+                return False
+        elif isinstance(value, dict) and "$in" in value:
+            if doc.get(key) not in value["$in"]:
+                return False
+        elif isinstance(value, dict) and "$ne" in value:
+            if doc.get(key) == value["$ne"]:
+                return False
+        elif doc.get(key) != value:
+            return False
+    return True
+
+
+def _apply_update(doc, update):
+    doc.update(copy.deepcopy(update.get("$set", {})))
+    for path, amount in update.get("$inc", {}).items():
+        target = doc
+        *parents, leaf = path.split(".")
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = target.get(leaf, 0) + amount
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    if all(v == 0 for v in projection.values()):
+        return {k: copy.deepcopy(v) for k, v in doc.items() if k not in projection}
+    keep = {k for k, v in projection.items() if v}
+    if projection.get("_id", 1):
+        keep.add("_id")
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k in keep}
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        self._docs.sort(key=lambda d: (d.get(key) is None, d.get(key)), reverse=direction < 0)
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class FakeCollection:
+    """Thread-safe list-backed collection"""
+
+    def __init__(self, name):
+        self.name = name
+        self._docs = []
+        self._lock = threading.Lock()
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def insert_one(self, doc):
+        with self._lock:
+            doc = copy.deepcopy(doc)
+            doc.setdefault("_id", ObjectId())
+            self._docs.append(doc)
+            return SimpleNamespace(inserted_id=doc["_id"])
+
+    def insert_many(self, docs):
+        return SimpleNamespace(inserted_ids=[self.insert_one(d).inserted_id for d in docs])
+
+    def find_one(self, filter_=None, projection=None):
+        with self._lock:
+            for doc in self._docs:
+                if _matches(doc, filter_):
+                    return _project(doc, projection)
+        return None
+
+    def find(self, filter_=None, projection=None):
+        with self._lock:
+            return FakeCursor([_project(d, projection) for d in self._docs if _matches(d, filter_)])
+
+    def count_documents(self, filter_):
+        with self._lock:
+            return sum(1 for d in self._docs if _matches(d, filter_))
+
+    def find_one_and_update(self, filter_, update, projection=None, upsert=False):
+        """Returns the document as it was before the update (pymongo's default)"""
+        with self._lock:
+            for doc in self._docs:
+                if _matches(doc, filter_):
+                    before = _project(doc, projection)
+                    _apply_update(doc, update)
+                    return before
+            if upsert:
+                self._insert_upsert(filter_, update)
+            return None
+
+    def _insert_upsert(self, filter_, update):
+        doc = {k: v for k, v in filter_.items() if not isinstance(v, dict)}
+        _apply_update(doc, update)
+        doc.update(copy.deepcopy(update.get("$setOnInsert", {})))
+        doc.setdefault("_id", ObjectId())
+        self._docs.append(doc)
+        return doc["_id"]
+
+    def update_one(self, filter_, update, upsert=False):
+        with self._lock:
+            for doc in self._docs:
+                if _matches(doc, filter_):
+                    _apply_update(doc, update)
+                    return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._insert_upsert(filter_, update))
+
+    def replace_one(self, filter_, replacement, upsert=False):
+        with self._lock:
+            for i, doc in enumerate(self._docs):
+                if _matches(doc, filter_):
+                    self._docs[i] = dict(copy.deepcopy(replacement), _id=doc["_id"])
+                    return SimpleNamespace(matched_count=1)
+            if upsert:
+                self._docs.append(dict(copy.deepcopy(replacement), _id=ObjectId()))
+            return SimpleNamespace(matched_count=0)
+
+    def bulk_write(self, requests, ordered=True):
+        """UpdateOne/ReplaceOne/DeleteOne/InsertOne only, applied one by one"""
+        for op in requests:
+            kind = type(op).__name__
+            if kind == "UpdateOne":
+                self.update_one(op._filter, op._doc, upsert=op._upsert)
+            elif kind == "ReplaceOne":
+                self.replace_one(op._filter, op._doc, upsert=op._upsert)
+            elif kind == "DeleteOne":
+                self.delete_one(op._filter)
+            elif kind == "InsertOne":
+                self.insert_one(op._doc)
+            else:
+                raise NotImplementedError(kind)
+        return SimpleNamespace(acknowledged=True)
+
+    def delete_one(self, filter_):
+        with self._lock:
+            for i, doc in enumerate(self._docs):
+                if _matches(doc, filter_):
+                    del self._docs[i]
+                    return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def delete_many(self, filter_):
+        with self._lock:
+            kept = [d for d in self._docs if not _matches(d, filter_)]
+            deleted, self._docs[:] = len(self._docs) - len(kept), kept
+        return SimpleNamespace(deleted_count=deleted)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, FakeCollection(name))
+
+
+def install(database_module):
+    """Swap database.py's collections for in-memory ones; returns the fake db"""
+    fake = FakeDatabase()
+    database_module.db = fake
+    for attr in [a for a in vars(database_module) if a.endswith("_collection")]:
+        setattr(database_module, attr, fake[attr[:-len("_collection")]])
+    if database_module.write_behind.WRITE_BEHIND:
+        queue = database_module.write_behind.WriteBehindQueue
+        database_module.watchlist_writes = queue(fake["watchlist"])
+        database_module.ratings_writes = queue(fake["ratings"], on_upsert=database_module.rating_flushed)
+        database_module.aggregate_writes = queue(fake["rating_aggregates"], key_fields=("tmdb_id", "content_type"))
+    database_module.rating_aggregates = database_module.RatingAggregates(
+        fake["rating_aggregates"], database_module.aggregate_writes)
+    return fake
+
+
+def seed_users(database_module, count, password_hash):
+    """Create count users named user<i> sharing one password hash"""
+    for i in range(count):
+        database_module.create_user(f"user{i}", f"user{i}@example.com", password_hash)
@@ -0,0 +1,142 @@
+"""
+Local stand-in for the TMDb API and image CDN.
+
+Serves the recorded payloads in benchmarks/fixtures (or another fixture
+directory) with configurable latency and error injection, so load tests
+never touch the real upstream. Point the app at it with
+TMDB_BASE_URL=http://127.0.0.1:<port>/3.
+
+Usage: python -m benchmarks.fake_tmdb [--port 8765] [--latency-ms 40]
+           [--jitter-ms 20] [--error-rate 0.01] [--error-status 500]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# IDs at or above this are treated as unknown titles (404)
+MISSING_ID_THRESHOLD = 10_000_000
+
+ROUTES = [
+    (re.compile(r"^/3/(movie|tv)/(\d+)$"), "detail"),
+    (re.compile(r"^/3/search/(movie|tv)$"), "search"),
+    (re.compile(r"^/3/discover/(movie|tv)$"), "discover"),
+    (re.compile(r"^/t/p/[^/]+/[\w.-]+$"), "image"),
+]
+
+
+class FakeTMDb:
+    """Fixture-backed fake upstream with latency/error knobs"""
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, error_status=500, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self.fixtures = {}
+        for name in os.listdir(fixtures_dir):
+            path = os.path.join(fixtures_dir, name)
+            if name.endswith(".json"):
+                with open(path) as f:
+                    self.fixtures[name[:-5]] = json.load(f)
+            elif name.endswith(".jpg"):
+                with open(path, "rb") as f:
+                    self.fixtures[name[:-4]] = f.read()
+
+    def _delay(self):
+        with self._lock:
+            self.requests_served += 1
+            delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self.random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        return fail
+
+    def handle(self, path, query):
+        """Return (status, content_type, body bytes) for a request"""
+        if self._delay():
+            body = {"status_code": 25, "status_message": "Injected upstream error"}
+            return self.error_status, "application/json", json.dumps(body).encode()
+
+        for pattern, kind in ROUTES:
+            match = pattern.match(path)
+            if not match:
+                continue
+            if kind == "image":
+                return 200, "image/jpeg", self.fixtures["poster"]
+            content_type = match.group(1)
+            if kind == "detail":
+                tmdb_id = int(match.group(2))
+                if tmdb_id == 0 or tmdb_id >= MISSING_ID_THRESHOLD:
+                    break
+                payload = dict(self.fixtures[f"{content_type}_detail"], id=tmdb_id)
+            elif kind == "search":
+                payload = self.fixtures[f"search_{content_type}"]
+                if not query.get("query", [""])[0].strip():
+                    payload = dict(payload, results=[], total_results=0, total_pages=0)
+            else:
+                page = int(query.get("page", ["1"])[0])
+                payload = dict(self.fixtures[f"discover_{content_type}"], page=page)
+            return 200, "application/json", json.dumps(payload).encode()
+
+        body = {"status_code": 34, "status_message": "The resource you requested could not be found."}
+        return 404, "application/json", json.dumps(body).encode()
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            status, content_type, body = fake.handle(url.path, parse_qs(url.query))
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(fake, host="127.0.0.1", port=0):
+    """Run the fake in a daemon thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-tmdb", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixture-backed fake TMDb server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    fake = FakeTMDb(args.fixtures, args.latency_ms, args.jitter_ms, args.error_rate, args.error_status)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    print(f"Fake TMDb listening on http://{args.host}:{args.port}/3")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
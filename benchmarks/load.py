@@ -0,0 +1,269 @@
+"""
+Offline load-test suite for app.py.
+
+Starts the fake TMDb server, swaps database.py onto in-memory collections,
+serves the app on a local threaded WSGI server and drives each scenario
+with a pool of concurrent clients. Reports throughput and p50/p95/p99
+latency per route and stores the run under benchmarks/results/ keyed by
+commit, so --compare can show regressions against the previous run.
+
+Client and server share one process (and GIL), so absolute numbers are
+pessimistic; compare runs made with the same settings. "errs" counts
+connection failures and 5xx, "4xx" client errors (including 429 shedding).
+
+Usage: python -m benchmarks.load [--scenario search_burst ...] [--duration 10]
+           [--concurrency 8] [--latency-ms 30] [--error-rate 0.0] [--compare]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from benchmarks.fake_tmdb import FakeTMDb, start_server
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PASSWORD = "benchmark-password"
+SEED_USERS = 200
+
+SEARCH_TERMS = [
+    "star", "love", "war", "the office", "batman", "dark", "inception", "matrix",
+    "toy story", "friends", "breaking bad", "alien", "frozen", "godfather", "joker",
+    "avengers", "lost", "dune", "up", "heat", "jaws", "her", "arrival", "parasite",
+]
+MOODS = ["happy", "sad", "excited", "relaxed", "adventurous", "romantic", "thoughtful", "nostalgic", "scared"]
+
+
+def make_frame(width=640, height=480):
+    """Webcam-sized JPEG frame with one face (the bench_faces portrait) as a data URL"""
+    import cv2
+    from benchmarks.bench_faces import FIXTURES, fit
+    frame = fit(cv2.imread(os.path.join(FIXTURES, "portrait.png")), (width, height))
+    ok, jpeg = cv2.imencode(".jpg", frame)
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg.tobytes()).decode()
+
+
+def load_frame(path):
+    with open(path, "rb") as f:
+        return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode()
+
+
+# Each scenario returns (route label, method, path, json body) for one request
+def search_burst(rng, ctx):
+    q = rng.choice(SEARCH_TERMS)
+    kind = rng.choice(["multi", "movie", "tv"])
+    return "/search", "GET", f"/search?q={q}&type={kind}", None
+
+
+def mood_paging(rng, ctx):
+    kind = rng.choice(["movie", "tv"])
+    return "/api/content", "GET", f"/api/content?mood={rng.choice(MOODS)}&type={kind}&page={rng.randint(1, 10)}", None
+
+
+def detail_views(rng, ctx):
+    kind = rng.choice(["movie", "tv"])
+    return f"/{kind}/<id>", "GET", f"/{kind}/{rng.randint(1, 500)}", None
+
+
+def login_storm(rng, ctx):
+    i = rng.randrange(SEED_USERS)
+    return "/api/signin", "POST", "/api/signin", {"email": f"user{i}@example.com", "password": PASSWORD}
+
+
+def detect_mood_uploads(rng, ctx):
+    return "/api/detect-mood", "POST", "/api/detect-mood", {"image": ctx["frame"]}
+
+
+SCENARIOS = {
+    "search_burst": search_burst,
+    "mood_paging": mood_paging,
+    "detail_views": detail_views,
+    "login_storm": login_storm,
+    "detect_mood": detect_mood_uploads,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(name, base_url, duration, concurrency, ctx, seed):
+    """Drive one scenario; returns {route: stats}"""
+    make_request = SCENARIOS[name]
+    samples = []
+    samples_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        session = requests.Session()
+        local = []
+        while time.perf_counter() < deadline:
+            route, method, path, body = make_request(rng, ctx)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, json=body, timeout=30)
+                status = response.status_code
+            except requests.RequestException:
+                status = 0
+            local.append((route, time.perf_counter() - start, status))
+        with samples_lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    by_route = {}
+    for route, latency, status in samples:
+        by_route.setdefault(route, []).append((latency, status))
+
+    stats = {}
+    for route, entries in by_route.items():
+        latencies = sorted(l for l, _ in entries)
+        stats[route] = {
+            "requests": len(entries),
+            "errors": sum(1 for _, s in entries if s == 0 or s >= 500),
+            # Scenarios only send valid requests, so any 4xx (429 shedding included) is worth seeing
+            "client_errors": sum(1 for _, s in entries if 400 <= s < 500),
+            "rps": len(entries) / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    return stats
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_result():
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json"))
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1])) as f:
+        return json.load(f)
+
+
+def save_result(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(RESULTS_DIR, f"{stamp}_{result['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def print_report(results, baseline=None):
+    header = f"{'scenario':<14}{'route':<18}{'reqs':>7}{'errs':>6}{'4xx':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header + ("   Δrps   Δp95" if baseline else ""))
+    for scenario, routes in results.items():
+        for route, s in sorted(routes.items()):
+            line = (f"{scenario:<14}{route:<18}{s['requests']:>7}{s['errors']:>6}{s.get('client_errors', 0):>6}{s['rps']:>9.1f}"
+                    f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}")
+            old = (baseline or {}).get(scenario, {}).get(route)
+            if old:
+                line += f" {(s['rps'] / old['rps'] - 1) * 100:>+6.1f}% {(s['p95_ms'] / old['p95_ms'] - 1) * 100:>+6.1f}%"
+            print(line)
+
+
+def setup_app(fake_base_url):
+    """Point the app at the fakes, then import and prepare it"""
+    os.environ["TMDB_BASE_URL"] = f"{fake_base_url}/3"
+    os.environ["TMDB_IMAGE_BASE_URL"] = f"{fake_base_url}/t/p"
+    os.environ.setdefault("TMDB_API_KEY", "benchmark")
+    os.environ["MONGODB_URI"] = "mongodb://127.0.0.1:1/"
+    os.environ.setdefault("POSTER_CACHE_DIR", tempfile.mkdtemp(prefix="bench-posters-"))
+
+    import bcrypt
+    import database
+    from benchmarks.fake_db import install, seed_users
+
+    install(database)
+    seed_users(database, SEED_USERS, bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt()).decode())
+
+    import app as app_module
+    return app_module.app
+
+
+def serve(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load tests against local TMDb/MongoDB stand-ins")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="fake TMDb latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake TMDb error fraction")
+    parser.add_argument("--frame", help="JPEG to upload in detect_mood (default: a 640x480 frame with one face)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", action="store_true", help="show deltas against the previous stored run")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    fake = FakeTMDb(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                    error_rate=args.error_rate, seed=args.seed)
+    fake_server, fake_url = start_server(fake)
+    app = setup_app(fake_url)
+    app_server, app_url = serve(app)
+
+    ctx = {"frame": load_frame(args.frame) if args.frame else make_frame()}
+    scenarios = args.scenario or list(SCENARIOS)
+    results = {}
+    for name in scenarios:
+        print(f"▶ {name} ({args.duration:.0f}s, {args.concurrency} clients)", file=sys.stderr)
+        results[name] = run_scenario(name, app_url, args.duration, args.concurrency, ctx, args.seed)
+
+    baseline = previous_result() if args.compare else None
+    print_report(results, baseline["results"] if baseline else None)
+
+    if not args.no_save:
+        result = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("compare", "no_save")},
+            "upstream_requests": fake.requests_served,
+            "results": results,
+        }
+        print(f"saved {save_result(result)}", file=sys.stderr)
+
+    app_server.shutdown()
+    fake_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Circuit breakers for upstream services.
+
+A breaker watches a sliding window of recent calls and opens when too many
+of them fail or are slow. While open, callers skip the upstream entirely
+and serve a fallback (stale cache, canned answer) so request threads are
+not tied up waiting on timeouts. After reset_timeout one probe call is let
+through; its outcome closes the breaker or re-opens it.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+metrics.describe("circuit_breaker_transitions_total", "counter", "Circuit breaker state changes")
+metrics.describe("circuit_breaker_rejections_total", "counter", "Calls short-circuited by an open breaker")
+
+
+class CircuitBreaker:
+    """Error-rate and latency based breaker over a sliding window of calls"""
+
+    def __init__(self, name, window=20, min_calls=10, error_rate=0.5,
+                 slow_call_seconds=3.0, slow_call_rate=0.5, reset_timeout=30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._calls = deque(maxlen=window)      # (failed, slow)
+        self._latencies = deque(maxlen=200)     # successful call durations
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        self.state = state
+        metrics.inc("circuit_breaker_transitions_total", breaker=self.name, state=state)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            print(f"⚠️ Circuit '{self.name}' opened")
+        elif state == CLOSED:
+            self._calls.clear()
+
+    def allow(self):
+        """Whether a call may go upstream right now"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+                self._probe_started = now
+                return True
+            if self.state == HALF_OPEN and now - self._probe_started >= self.reset_timeout:
+                # the previous probe never reported back; try another
+                self._probe_started = now
+                return True
+            metrics.inc("circuit_breaker_rejections_total", breaker=self.name)
+            return False
+
+    def record(self, success, seconds):
+        """Report the outcome of a call that was allowed through"""
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            if success:
+                self._latencies.append(seconds)
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED if success and not slow else OPEN)
+                return
+            self._calls.append((not success, slow))
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for failed, _ in self._calls if failed)
+                slow_calls = sum(1 for _, s in self._calls if s)
+                if failures >= self.error_rate * len(self._calls) or \
+                        slow_calls >= self.slow_call_rate * len(self._calls):
+                    self._transition(OPEN)
+
+    def latency_percentile(self, pct):
+        """Recent successful-call latency percentile, or None without data"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < 10:
+            return None
+        return latencies[min(len(latencies) - 1, int(pct / 100.0 * len(latencies)))]
+
+
+def _breaker_from_env(name):
+    prefix = f"{name.upper()}_BREAKER_"
+    return CircuitBreaker(
+        name,
+        error_rate=float(os.getenv(prefix + "ERROR_RATE", "0.5")),
+        slow_call_seconds=float(os.getenv(prefix + "SLOW_SECONDS", "3")),
+        slow_call_rate=float(os.getenv(prefix + "SLOW_RATE", "0.5")),
+        reset_timeout=float(os.getenv(prefix + "RESET_SECONDS", "30")),
+    )
+
+
+tmdb_breaker = _breaker_from_env("tmdb")
+gemini_breaker = _breaker_from_env("gemini")
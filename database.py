@@ -1,19 +1,34 @@
 """
 MongoDB Database Connection and Models
 """
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, monitoring
 from pymongo.errors import ConnectionFailure, DuplicateKeyError
 import os
 from datetime import datetime
 from bson import ObjectId
+import metrics
+import write_behind
+from rating_aggregates import RatingAggregates, aggregate_key
 
 # MongoDB Atlas connection string from environment variable
 MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
 DB_NAME = os.getenv("MONGODB_DB_NAME", "moviemood")
 
+class CommandMetrics(monitoring.CommandListener):
+    """Feed MongoDB command timings into the metrics subsystem"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.record_upstream("mongodb", event.command_name, "ok", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        metrics.record_upstream("mongodb", event.command_name, "error", event.duration_micros / 1e6)
+
 # Initialize MongoDB client
 try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, event_listeners=[CommandMetrics()])
     # Test connection
     client.admin.command('ping')
     print("✅ Successfully connected to MongoDB Atlas!")
@@ -29,6 +44,8 @@ db = client[DB_NAME] if client is not None else None
 users_collection = db.users if db is not None else None
 watchlist_collection = db.watchlist if db is not None else None
 ratings_collection = db.ratings if db is not None else None
+sessions_collection = db.sessions if db is not None else None
+rating_aggregates_collection = db.rating_aggregates if db is not None else None
 
 # Create indexes
 if db is not None:
@@ -44,11 +61,26 @@ if db is not None:
         # Indexes for ratings
         ratings_collection.create_index([("user_id", 1), ("tmdb_id", 1), ("content_type", 1)], unique=True)
         ratings_collection.create_index("user_id")
+        rating_aggregates_collection.create_index([("tmdb_id", 1), ("content_type", 1)], unique=True)
+        
+        # Server-side sessions: looked up by id, expired by MongoDB
+        sessions_collection.create_index("id", unique=True)
+        sessions_collection.create_index("expiration", expireAfterSeconds=0)
         
         print("✅ Database indexes created successfully!")
     except Exception as e:
         print(f"⚠️ Error creating indexes: {e}")
 
+# Optional write-behind (WRITE_BEHIND=1): ratings/watchlist writes are queued and batched
+watchlist_writes = ratings_writes = aggregate_writes = None
+if write_behind.WRITE_BEHIND and db is not None:
+    watchlist_writes = write_behind.WriteBehindQueue(watchlist_collection)
+    ratings_writes = write_behind.WriteBehindQueue(ratings_collection, on_upsert=lambda *args: rating_flushed(*args))
+    aggregate_writes = write_behind.WriteBehindQueue(rating_aggregates_collection, key_fields=("tmdb_id", "content_type"))
+
+# Community average/count/histogram per title, kept current by add_rating
+rating_aggregates = RatingAggregates(rating_aggregates_collection, aggregate_writes) if db is not None else None
+
 def get_db():
     """Get database instance"""
     return db
@@ -122,6 +154,18 @@ def add_to_watchlist(user_id, tmdb_id, content_type, title, poster_path):
     if watchlist_collection is None:
         return False
     
+    fields = {
+        "user_id": user_id,
+        "tmdb_id": tmdb_id,
+        "content_type": content_type,
+        "title": title,
+        "poster_path": poster_path,
+        "added_date": datetime.utcnow()
+    }
+    if watchlist_writes is not None:
+        watchlist_writes.upsert((user_id, tmdb_id, content_type), fields)
+        return True
+    
     try:
         watchlist_collection.update_one(
             {
@@ -129,16 +173,7 @@ def add_to_watchlist(user_id, tmdb_id, content_type, title, poster_path):
                 "tmdb_id": tmdb_id,
                 "content_type": content_type
             },
-            {
-                "$set": {
-                    "user_id": user_id,
-                    "tmdb_id": tmdb_id,
-                    "content_type": content_type,
-                    "title": title,
-                    "poster_path": poster_path,
-                    "added_date": datetime.utcnow()
-                }
-            },
+            {"$set": fields},
             upsert=True
         )
         return True
@@ -150,6 +185,11 @@ def remove_from_watchlist(user_id, tmdb_id, content_type):
     if watchlist_collection is None:
         return False
     
+    if watchlist_writes is not None:
+        # Acknowledged without a round trip, so removing a missing item also succeeds
+        watchlist_writes.delete((user_id, tmdb_id, content_type))
+        return True
+    
     try:
         result = watchlist_collection.delete_one({
             "user_id": user_id,
@@ -166,54 +206,160 @@ def get_watchlist(user_id):
         return []
     
     try:
-        items = list(watchlist_collection.find(
+        fetch = lambda: list(watchlist_collection.find(
             {"user_id": user_id},
             {"_id": 0}
         ).sort("added_date", -1))
-        return items
+        if watchlist_writes is not None:
+            return watchlist_writes.overlay_many(user_id, fetch, "added_date")
+        return fetch()
     except:
         return []
 
+def iter_watchlist(user_id, batch_size=500):
+    """Stream a user's watchlist straight from a cursor"""
+    if watchlist_collection is None:
+        return iter(())
+    return watchlist_collection.find({"user_id": user_id}, {"_id": 0}).batch_size(batch_size)
+
+def bulk_upsert_watchlist(user_id, items):
+    """Upsert a batch of watchlist items in one bulk_write; returns items written"""
+    if watchlist_collection is None or not items:
+        return 0
+    try:
+        watchlist_collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "tmdb_id": item["tmdb_id"], "content_type": item["content_type"]},
+                {"$set": dict(item, user_id=user_id)},
+                upsert=True
+            )
+            for item in items
+        ], ordered=False)
+        return len(items)
+    except Exception as e:
+        print(f"⚠️ Watchlist import batch failed: {e}")
+        return 0
+
+def rating_tmdb_id(tmdb_id):
+    """tmdb_id as the int the aggregates key it by, so "550" and 550 are one rating"""
+    key = aggregate_key(tmdb_id, None)
+    return tmdb_id if key is None else key[0]
+
 def add_rating(user_id, tmdb_id, content_type, rating, review=""):
     """Add or update rating"""
     if ratings_collection is None:
         return False
     
+    tmdb_id = rating_tmdb_id(tmdb_id)
+    fields = {
+        "user_id": user_id,
+        "tmdb_id": tmdb_id,
+        "content_type": content_type,
+        "rating": rating,
+        "review": review,
+        "created_date": datetime.utcnow()
+    }
+    key = {
+        "user_id": user_id,
+        "tmdb_id": tmdb_id,
+        "content_type": content_type
+    }
+    if ratings_writes is not None:
+        # Aggregates are updated by rating_flushed, once MongoDB says what was replaced
+        ratings_writes.upsert((user_id, tmdb_id, content_type), fields)
+        return True
+    
     try:
-        ratings_collection.update_one(
-            {
-                "user_id": user_id,
-                "tmdb_id": tmdb_id,
-                "content_type": content_type
-            },
-            {
-                "$set": {
-                    "user_id": user_id,
-                    "tmdb_id": tmdb_id,
-                    "content_type": content_type,
-                    "rating": rating,
-                    "review": review,
-                    "created_date": datetime.utcnow()
-                }
-            },
+        previous = ratings_collection.find_one_and_update(
+            key,
+            {"$set": fields},
+            projection={"_id": 0, "rating": 1},
             upsert=True
         )
-        return True
     except:
         return False
+    record_rating_change(tmdb_id, content_type, previous, rating)
+    return True
+
+def record_rating_change(tmdb_id, content_type, previous, rating):
+    """Feed a saved rating into the community aggregates"""
+    if rating_aggregates is None:
+        return
+    try:
+        rating_aggregates.record(tmdb_id, content_type, (previous or {}).get("rating"), rating)
+    except Exception as e:
+        print(f"⚠️ Could not update rating aggregates: {e}")
+
+def rating_flushed(key, previous, fields):
+    """Write-behind hook: a queued rating reached MongoDB, replacing previous"""
+    _, tmdb_id, content_type = key
+    record_rating_change(tmdb_id, content_type, previous, fields["rating"])
+
+def iter_ratings(user_id, batch_size=500):
+    """Stream a user's ratings straight from a cursor"""
+    if ratings_collection is None:
+        return iter(())
+    return ratings_collection.find({"user_id": user_id}, {"_id": 0}).batch_size(batch_size)
+
+def bulk_upsert_ratings(user_id, items):
+    """Upsert a batch of ratings in one bulk_write, updating the aggregates; returns items written"""
+    if ratings_collection is None or not items:
+        return 0
+    items = [dict(item, tmdb_id=rating_tmdb_id(item["tmdb_id"])) for item in items]
+    try:
+        # Previous ratings for the batch in one query, for the aggregate deltas
+        previous = {
+            (doc["tmdb_id"], doc["content_type"]): doc
+            for doc in ratings_collection.find(
+                {"user_id": user_id, "$or": [
+                    {"tmdb_id": item["tmdb_id"], "content_type": item["content_type"]} for item in items
+                ]},
+                {"_id": 0, "tmdb_id": 1, "content_type": 1, "rating": 1}
+            )
+        }
+        ratings_collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "tmdb_id": item["tmdb_id"], "content_type": item["content_type"]},
+                {"$set": dict(item, user_id=user_id)},
+                upsert=True
+            )
+            for item in items
+        ], ordered=False)
+    except Exception as e:
+        print(f"⚠️ Ratings import batch failed: {e}")
+        return 0
+    for item in items:
+        record_rating_change(item["tmdb_id"], item["content_type"],
+                             previous.get((item["tmdb_id"], item["content_type"])), item["rating"])
+    return len(items)
+
+def flush_pending_writes():
+    """Push queued write-behind operations to MongoDB before reading/writing in bulk"""
+    for queue in (watchlist_writes, ratings_writes):
+        if queue is not None:
+            queue.flush()
+
+def get_rating_aggregates(keys):
+    """{(tmdb_id, content_type): (sum, count, histogram)} for a page of titles"""
+    if rating_aggregates is None:
+        return {}
+    return rating_aggregates.get_many(keys)
 
 def get_rating(user_id, tmdb_id, content_type):
     """Get user's rating for a specific item"""
     if ratings_collection is None:
         return None
     
+    tmdb_id = rating_tmdb_id(tmdb_id)
     try:
-        rating = ratings_collection.find_one({
+        fetch = lambda: ratings_collection.find_one({
             "user_id": user_id,
             "tmdb_id": tmdb_id,
             "content_type": content_type
         }, {"_id": 0})
-        return rating
+        if ratings_writes is not None:
+            return ratings_writes.overlay_one((user_id, tmdb_id, content_type), fetch)
+        return fetch()
     except:
         return None
 
@@ -223,11 +369,13 @@ def get_all_ratings(user_id):
         return []
     
     try:
-        ratings = list(ratings_collection.find(
+        fetch = lambda: list(ratings_collection.find(
             {"user_id": user_id},
             {"_id": 0}
         ).sort("created_date", -1))
-        return ratings
+        if ratings_writes is not None:
+            return ratings_writes.overlay_many(user_id, fetch, "created_date")
+        return fetch()
     except:
         return []
 
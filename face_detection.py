@@ -0,0 +1,170 @@
+"""
+Pluggable face detectors for /api/detect-mood.
+
+FACE_DETECTOR picks the backend:
+    haar  OpenCV's frontal-face Haar cascade (default, ships with opencv)
+    dnn   OpenCV dnn SSD face detector (ResNet-10, 300x300) on CPU
+
+The dnn backend loads a local model: FACE_DNN_MODEL (.caffemodel or .onnx)
+and, for Caffe, FACE_DNN_CONFIG (deploy.prototxt); by default from
+models/face_detector/ (res10_300x300_ssd_iter_140000_fp16.caffemodel, the
+model from OpenCV's samples/dnn/face_detector; `python face_detection.py
+fetch` downloads it and checks its SHA-1). Frames are resized into one
+NCHW blob and inferred as a batch, up to FACE_DNN_BATCH frames per forward
+pass. FACE_DNN_THREADS caps OpenCV's worker threads. If the model files are
+missing the haar backend is used instead.
+
+Both backends return, per frame, face boxes as (x, y, w, h) sorted largest
+first. Cascades and networks are not thread-safe, so each thread gets its own.
+"""
+import os
+import threading
+
+import cv2
+import numpy as np
+
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "haar")
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "face_detector")
+FACE_DNN_MODEL = os.getenv("FACE_DNN_MODEL", os.path.join(MODEL_DIR, "res10_300x300_ssd_iter_140000_fp16.caffemodel"))
+FACE_DNN_CONFIG = os.getenv("FACE_DNN_CONFIG", os.path.join(MODEL_DIR, "deploy.prototxt"))
+FACE_DNN_CONFIDENCE = float(os.getenv("FACE_DNN_CONFIDENCE", "0.5"))
+FACE_DNN_BATCH = int(os.getenv("FACE_DNN_BATCH", "8"))
+FACE_DNN_THREADS = int(os.getenv("FACE_DNN_THREADS", "0"))    # 0: OpenCV default
+DNN_INPUT_SIZE = (300, 300)
+DNN_MEAN = (104.0, 177.0, 123.0)
+# (file, url, sha1 or None) for `python face_detection.py fetch`
+DNN_DOWNLOADS = [
+    ("res10_300x300_ssd_iter_140000_fp16.caffemodel",
+     "https://raw.githubusercontent.com/opencv/opencv_3rdparty/dnn_samples_face_detector_20180205_fp16/"
+     "res10_300x300_ssd_iter_140000_fp16.caffemodel",
+     "31fc22bfdd907567a04bb45b7cfad29966caddc1"),
+    ("deploy.prototxt",
+     "https://raw.githubusercontent.com/opencv/opencv/4.x/samples/dnn/face_detector/deploy.prototxt",
+     None),
+]
+
+_local = threading.local()
+
+
+def _cascade(name):
+    cascades = getattr(_local, "cascades", None)
+    if cascades is None:
+        cascades = _local.cascades = {}
+    if name not in cascades:
+        cascades[name] = cv2.CascadeClassifier(cv2.data.haarcascades + name)
+    return cascades[name]
+
+
+def _largest_first(boxes):
+    return sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+
+
+def detect_smiles(face_gray):
+    """Smile boxes inside a grayscale face crop"""
+    return _cascade("haarcascade_smile.xml").detectMultiScale(face_gray, 1.8, 20)
+
+
+class HaarDetector:
+    name = "haar"
+
+    def detect(self, frames):
+        results = []
+        for frame in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = _cascade("haarcascade_frontalface_default.xml").detectMultiScale(gray, 1.1, 4)
+            results.append(_largest_first([tuple(int(v) for v in f) for f in faces]))
+        return results
+
+
+class DnnDetector:
+    name = "dnn"
+
+    def __init__(self, model=FACE_DNN_MODEL, config=FACE_DNN_CONFIG,
+                 confidence=FACE_DNN_CONFIDENCE, batch=FACE_DNN_BATCH):
+        self.model = model
+        self.config = config if model.endswith(".caffemodel") else ""
+        self.confidence = confidence
+        self.batch = max(1, batch)
+        self._net()   # fail fast on a bad model
+
+    def _net(self):
+        nets = getattr(_local, "face_nets", None)
+        if nets is None:
+            nets = _local.face_nets = {}
+        net = nets.get((self.model, self.config))
+        if net is None:
+            net = cv2.dnn.readNet(self.model, self.config)
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            nets[(self.model, self.config)] = net
+        return net
+
+    def detect(self, frames):
+        results = []
+        for start in range(0, len(frames), self.batch):
+            results.extend(self._detect_batch(frames[start:start + self.batch]))
+        return results
+
+    def _detect_batch(self, frames):
+        blob = cv2.dnn.blobFromImages(frames, 1.0, DNN_INPUT_SIZE, DNN_MEAN, swapRB=False, crop=False)
+        net = self._net()
+        net.setInput(blob)
+        # [1, 1, N, 7]: image index, class, confidence, x1, y1, x2, y2 (relative)
+        detections = net.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= self.confidence]
+
+        results = [[] for _ in frames]
+        for image_id, _, _, x1, y1, x2, y2 in detections:
+            h, w = frames[int(image_id)].shape[:2]
+            x1, x2 = np.clip([x1 * w, x2 * w], 0, w).astype(int)
+            y1, y2 = np.clip([y1 * h, y2 * h], 0, h).astype(int)
+            if x2 > x1 and y2 > y1:
+                results[int(image_id)].append((int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+        return [_largest_first(boxes) for boxes in results]
+
+
+def create_detector(name=FACE_DETECTOR):
+    """Detector for a backend name, falling back to haar when dnn can't load"""
+    if name == "dnn":
+        if FACE_DNN_THREADS:
+            cv2.setNumThreads(FACE_DNN_THREADS)
+        try:
+            return DnnDetector()
+        except cv2.error as e:
+            print(f"⚠️ DNN face detector unavailable ({e.msg.strip() if hasattr(e, 'msg') else e}); using Haar cascades")
+    elif name != "haar":
+        print(f"⚠️ Unknown FACE_DETECTOR '{name}'; using Haar cascades")
+    return HaarDetector()
+
+
+face_detector = create_detector()
+
+
+def fetch_model(directory=MODEL_DIR):
+    """Download the default dnn model files into directory, verifying checksums"""
+    import hashlib
+    import requests
+
+    os.makedirs(directory, exist_ok=True)
+    for name, url, sha1 in DNN_DOWNLOADS:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            print(f"✅ {name} already present")
+            continue
+        response = requests.get(url, timeout=60)
+        response.raise_for_status()
+        digest = hashlib.sha1(response.content).hexdigest()
+        if sha1 and digest != sha1:
+            raise SystemExit(f"❌ {name}: SHA-1 {digest} does not match {sha1}")
+        with open(path, "wb") as f:
+            f.write(response.content)
+        print(f"✅ Downloaded {name} ({len(response.content)} bytes)")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["fetch"]:
+        print("❌ Usage: python face_detection.py fetch", file=sys.stderr)
+        raise SystemExit(1)
+    fetch_model()
@@ -1,5 +1,8 @@
 import requests
 import json
+import time
+import metrics
+from circuit_breaker import gemini_breaker
 
 def get_gemini_response(message):
     """Free Google Gemini AI - 15 requests/minute"""
@@ -12,6 +15,10 @@ def get_gemini_response(message):
         if not API_KEY:
             return get_fallback_response(message)
         
+        # Answer locally while Gemini is failing or slow
+        if not gemini_breaker.allow():
+            return get_fallback_response(message)
+        
         url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={API_KEY}"
         
         payload = {
@@ -22,7 +29,15 @@ def get_gemini_response(message):
             }]
         }
         
-        response = requests.post(url, json=payload, timeout=10)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = requests.post(url, json=payload, timeout=10)
+            status = response.status_code
+        finally:
+            seconds = time.perf_counter() - start
+            metrics.record_upstream("gemini", "generateContent", status, seconds)
+            gemini_breaker.record(status != "error" and status < 500, seconds)
         
         if response.status_code == 200:
             result = response.json()
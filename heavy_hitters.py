@@ -0,0 +1,151 @@
+"""
+Heavy-hitter tracking for hot titles, searches and listing pages.
+
+Routes record one key per request ("movie:550", "search:movie:the matrix",
+"content:movie:mood=happy:page=1"). A count-min sketch (HOT_SKETCH_DEPTH
+rows of HOT_SKETCH_WIDTH counters) estimates every key's count in constant
+memory. A top-k table keeps the HOT_TOP_K keys with the highest estimates.
+Counts decay exponentially with a half-life of HOT_HALF_LIFE seconds, so
+"hot" means recently hot. The sketch is scaled down in one NumPy
+multiplication every DECAY_INTERVAL.
+
+Each top-k key may carry the TMDb requests (path, params, ttl) that back it.
+The warmer thread runs every HOT_WARM_INTERVAL seconds. It pins the cache
+entries of the HOT_PIN hottest keys in the response cache so LRU eviction
+skips them. It also re-fetches any of those entries that will expire within
+REFRESH_AHEAD seconds (or dropped out of the cache), at prefetch priority,
+so popular pages are never a cold miss.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from rate_limiter import PRIORITY_PREFETCH
+from tmdb_client import cache_key, response_cache, tmdb_get
+
+HOT_SKETCH_WIDTH = int(os.getenv("HOT_SKETCH_WIDTH", "4096"))
+HOT_SKETCH_DEPTH = int(os.getenv("HOT_SKETCH_DEPTH", "4"))
+HOT_TOP_K = int(os.getenv("HOT_TOP_K", "200"))
+HOT_HALF_LIFE = float(os.getenv("HOT_HALF_LIFE", "600"))
+HOT_PIN = int(os.getenv("HOT_PIN", "100"))
+HOT_WARM_INTERVAL = float(os.getenv("HOT_WARM_INTERVAL", "30"))   # 0 disables warming
+DECAY_INTERVAL = 10.0
+REFRESH_AHEAD = 60.0
+MIN_WARM_COUNT = 2.0     # decayed hits before a key is worth pinning/refreshing
+
+metrics.describe("hot_key_refreshes_total", "counter", "Proactive refreshes of hot response-cache entries")
+
+
+class HeavyHitters:
+    """Decaying count-min sketch plus a top-k table"""
+
+    def __init__(self, width=HOT_SKETCH_WIDTH, depth=HOT_SKETCH_DEPTH, k=HOT_TOP_K, half_life=HOT_HALF_LIFE):
+        self.width = width
+        self.k = k
+        self.half_life = half_life
+        self._seeds = [0x9E3779B1 * (row + 1) for row in range(depth)]
+        self._rows = np.arange(depth)
+        self._counts = np.zeros((depth, width), dtype=np.float64)
+        self._top = {}        # key -> [estimate, specs]
+        self._lock = threading.Lock()
+        self._decayed_at = time.monotonic()
+
+    def _columns(self, key):
+        return [hash((seed, key)) % self.width for seed in self._seeds]
+
+    def _decay(self, now):
+        """Scale counts down for the time since the last decay (lock held)"""
+        if now - self._decayed_at < DECAY_INTERVAL:
+            return
+        factor = 0.5 ** ((now - self._decayed_at) / self.half_life)
+        self._decayed_at = now
+        self._counts *= factor
+        for entry in self._top.values():
+            entry[0] *= factor
+
+    def record(self, key, specs=None):
+        """Count one hit for key; specs are the (path, params, ttl) TMDb requests behind it"""
+        columns = self._columns(key)
+        now = time.monotonic()
+        with self._lock:
+            self._decay(now)
+            cells = (self._rows, columns)
+            self._counts[cells] += 1
+            estimate = float(self._counts[cells].min())
+            entry = self._top.get(key)
+            if entry is not None:
+                entry[0] = estimate
+                if specs:
+                    entry[1] = specs
+            elif len(self._top) < self.k:
+                self._top[key] = [estimate, specs]
+            else:
+                coldest = min(self._top, key=lambda c: self._top[c][0])
+                if estimate > self._top[coldest][0]:
+                    del self._top[coldest]
+                    self._top[key] = [estimate, specs]
+
+    def estimate(self, key):
+        with self._lock:
+            self._decay(time.monotonic())
+            return float(self._counts[(self._rows, self._columns(key))].min())
+
+    def top(self, n=None):
+        """[(key, decayed count, specs)] hottest first"""
+        with self._lock:
+            # Decay here too, or counts would freeze when traffic stops
+            self._decay(time.monotonic())
+            items = [(key, entry[0], entry[1]) for key, entry in self._top.items()]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return items[:n] if n else items
+
+
+hot_keys = HeavyHitters()
+
+
+def warm_once(tracker=hot_keys, cache=response_cache):
+    """Pin the hottest keys' cache entries and refresh the ones about to expire"""
+    pinned, due = [], []
+    for _, count, specs in tracker.top(HOT_PIN):
+        if count < MIN_WARM_COUNT:
+            break
+        for path, params, ttl in specs or ():
+            key = cache_key(path, params)
+            pinned.append(key)
+            remaining = cache.expires_in(key)
+            if remaining is None or remaining < min(REFRESH_AHEAD, ttl / 2):
+                due.append((path, params, ttl))
+    cache.pin(pinned)
+    for path, params, ttl in due:
+        try:
+            tmdb_get(path, params, ttl=ttl, priority=PRIORITY_PREFETCH, refresh=True)
+            metrics.inc("hot_key_refreshes_total", outcome="ok")
+        except Exception:
+            metrics.inc("hot_key_refreshes_total", outcome="error")
+    return len(pinned), len(due)
+
+
+def _warm_loop():
+    while True:
+        time.sleep(HOT_WARM_INTERVAL)
+        try:
+            warm_once()
+        except Exception as e:
+            print(f"⚠️ Hot-key warmer error: {e}")
+
+
+def _start_warmer():
+    threading.Thread(target=_warm_loop, name="hot-key-warmer", daemon=True).start()
+
+
+def _reset_after_fork():
+    hot_keys._lock = threading.Lock()
+    _start_warmer()
+
+
+if HOT_WARM_INTERVAL > 0:
+    _start_warmer()
+    os.register_at_fork(after_in_child=_reset_after_fork)
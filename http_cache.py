@@ -0,0 +1,61 @@
+"""
+HTTP caching helpers: stable ETags, conditional requests and Cache-Control
+"""
+import hashlib
+
+from flask import current_app, request
+
+import metrics
+
+# Cache-Control policies per route family
+DETAIL_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+SEARCH_CACHE_CONTROL = "public, max-age=300, stale-while-revalidate=3600"
+CONTENT_CACHE_CONTROL = "public, max-age=600, stale-while-revalidate=3600"
+AUTOCOMPLETE_CACHE_CONTROL = "public, max-age=60"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def serialize_payload(payload):
+    """Serialize a payload to normalized JSON bytes (sorted keys, compact)"""
+    with metrics.stage("json_encode"):
+        return current_app.json.dumps_bytes(payload, sort_keys=True)
+
+
+def compute_etag(body):
+    """Stable strong ETag for a serialized body"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0, tzinfo=None) <= \
+            request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def cached_json_response(payload, cache_control, last_modified=None):
+    """Build a JSON response carrying ETag/Cache-Control, or a 304 if the
+    client's cached copy is still current.
+
+    The payload is serialized exactly once; the same bytes feed the ETag and
+    the response body.
+    """
+    body = serialize_payload(payload)
+    etag = compute_etag(body)
+
+    not_modified = _not_modified(etag, last_modified)
+    metrics.record_cache("http_revalidation", not_modified)
+    if not_modified:
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype="application/json")
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    if cache_control.startswith("private"):
+        response.vary.add("Cookie")
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
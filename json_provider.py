@@ -0,0 +1,86 @@
+"""
+Fast JSON provider for Flask, backed by orjson when it is installed.
+
+Datetimes are serialized natively as ISO 8601 strings on both the orjson and
+the stdlib fallback path, so routes can hand Mongo documents straight to
+jsonify without converting them first.
+"""
+import json
+import os
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider, _default
+
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    print("⚠️ orjson not available (JSON responses will use the stdlib encoder)")
+
+# "orjson" (default when installed) or "stdlib"
+JSON_BACKEND = os.getenv("JSON_BACKEND", "orjson" if orjson else "stdlib")
+
+
+def _iso_default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return _default(obj)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's default provider, with ISO 8601 datetimes"""
+
+    default = staticmethod(_iso_default)
+    ensure_ascii = False
+
+    def dumps_bytes(self, obj, sort_keys=None, indent=False):
+        kwargs = {"sort_keys": self.sort_keys if sort_keys is None else sort_keys}
+        if indent:
+            kwargs["indent"] = 2
+        else:
+            kwargs["separators"] = (",", ":")
+        return self.dumps(obj, **kwargs).encode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        with metrics.stage("json_encode"):
+            body = self.dumps_bytes(obj, indent=indent) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+class FastJSONProvider(StdlibJSONProvider):
+    """orjson-backed provider; always emits compact UTF-8"""
+
+    # Key sorting is only needed where output must be canonical (ETags),
+    # and callers ask for it explicitly there.
+    sort_keys = False
+
+    def dumps_bytes(self, obj, sort_keys=None, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_iso_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(
+            obj,
+            sort_keys=kwargs.get("sort_keys"),
+            indent=bool(kwargs.get("indent"))
+        ).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def get_json_provider_class():
+    """Provider class selected by JSON_BACKEND"""
+    if JSON_BACKEND == "orjson" and orjson is not None:
+        return FastJSONProvider
+    return StdlibJSONProvider
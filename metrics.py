@@ -0,0 +1,298 @@
+"""
+Low-overhead metrics: counters and latency histograms exported in the
+Prometheus text format.
+
+Every thread writes into its own shard, so the hot path never takes a lock;
+shards are only summed when /metrics is scraped. With several worker
+processes, set METRICS_DIR to a shared directory: each worker periodically
+dumps its totals there and the scrape merges all recent worker files.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# Worker files not refreshed for this long belong to dead workers
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", "600"))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name → (type, help)
+_descriptions = {
+    "http_request_duration_seconds": ("histogram", "Latency of HTTP requests by route"),
+    "upstream_request_duration_seconds": ("histogram", "Latency of upstream calls (TMDb, Gemini, MongoDB)"),
+    "upstream_requests_total": ("counter", "Upstream calls by service, endpoint and status"),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result"),
+    "facial_emotion_seconds": ("histogram", "Time spent in analyze_facial_emotion"),
+    "bcrypt_seconds": ("histogram", "Time spent hashing or checking passwords"),
+}
+
+_local = threading.local()
+_shards = []            # (thread, counters, histograms) per live writer thread
+_retired = ({}, {})     # totals folded in from threads that have exited
+_shards_lock = threading.Lock()
+# Fold dead threads' shards once this many are registered
+_COMPACT_THRESHOLD = 256
+
+
+def describe(name, metric_type, help_text):
+    """Register HELP/TYPE metadata for a metric"""
+    _descriptions[name] = (metric_type, help_text)
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = ({}, {})   # counters, histograms
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard[0], shard[1]))
+            if len(_shards) >= _COMPACT_THRESHOLD:
+                _compact()
+    return shard
+
+
+def _merge_into(counters, histograms, src_counters, src_histograms):
+    for key, value in src_counters.copy().items():
+        counters[key] = counters.get(key, 0) + value
+    for key, hist in src_histograms.copy().items():
+        total = histograms.get(key)
+        histograms[key] = list(hist) if total is None else [a + b for a, b in zip(total, hist)]
+
+
+def _compact():
+    """Fold shards of exited threads into the retired totals (lock held)"""
+    alive = []
+    for thread, counters, histograms in _shards:
+        if thread.is_alive():
+            alive.append((thread, counters, histograms))
+        else:
+            _merge_into(_retired[0], _retired[1], counters, histograms)
+    _shards[:] = alive
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter"""
+    counters = _shard()[0]
+    key = _key(name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record a histogram observation (seconds for latency metrics)"""
+    histograms = _shard()[1]
+    key = _key(name, labels)
+    hist = histograms.get(key)
+    if hist is None:
+        # per-bucket counts (+Inf last), then sum
+        hist = histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+    hist[bisect_left(LATENCY_BUCKETS, value)] += 1
+    hist[-1] += value
+    stages = getattr(_local, "stages", None)
+    if stages is not None:
+        _add_stage(stages, labels.get("service") or name.removesuffix("_seconds"), value)
+
+
+def _add_stage(stages, stage, seconds):
+    entry = stages.get(stage)
+    if entry is None:
+        entry = stages[stage] = [0, 0.0]
+    entry[0] += 1
+    entry[1] += seconds
+
+
+def track_stages(stages):
+    """Total this thread's timings into stages ({stage: [count, seconds]}) until called with None.
+
+    Histogram observations count under their name (upstream calls under their
+    service); stage() adds blocks that have no histogram of their own.
+    """
+    _local.stages = stages
+
+
+@contextmanager
+def stage(name):
+    """Time a block into the thread's stage breakdown, if one is being tracked"""
+    stages = getattr(_local, "stages", None)
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_stage(stages, name, time.perf_counter() - start)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Time a block into a histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator form of timer()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_upstream(service, endpoint, status, seconds):
+    """Record one upstream call's latency and outcome"""
+    observe("upstream_request_duration_seconds", seconds, service=service, endpoint=endpoint)
+    inc("upstream_requests_total", service=service, endpoint=endpoint, status=str(status))
+
+
+def record_cache(cache, hit):
+    inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def snapshot():
+    """Sum all thread shards of this process"""
+    counters, histograms = {}, {}
+    with _shards_lock:
+        _compact()
+        _merge_into(counters, histograms, *_retired)
+        shards = list(_shards)
+    for _, shard_counters, shard_histograms in shards:
+        _merge_into(counters, histograms, shard_counters, shard_histograms)
+    return counters, histograms
+
+
+def _encode(counters, histograms):
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), hist] for (name, labels), hist in histograms.items()],
+    }
+
+
+def _merge_encoded(data, counters, histograms):
+    for name, labels, value in data["counters"]:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, hist in data["histograms"]:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        total = histograms.get(key)
+        histograms[key] = hist if total is None else [a + b for a, b in zip(total, hist)]
+
+
+def _worker_file(pid):
+    return os.path.join(METRICS_DIR, f"worker-{pid}.json")
+
+
+def flush_to_dir():
+    """Write this process's totals to METRICS_DIR (atomic replace)"""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(_encode(*snapshot()), f)
+    os.replace(tmp, _worker_file(os.getpid()))
+
+
+def aggregate():
+    """Totals across all live workers (or just this process without METRICS_DIR)"""
+    counters, histograms = snapshot()
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return counters, histograms
+
+    own = os.path.basename(_worker_file(os.getpid()))
+    cutoff = time.time() - METRICS_STALE_SECONDS
+    for name in os.listdir(METRICS_DIR):
+        if not name.startswith("worker-") or not name.endswith(".json") or name == own:
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                continue
+            with open(path) as f:
+                _merge_encoded(json.load(f), counters, histograms)
+        except (OSError, ValueError):
+            continue
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format"""
+    counters, histograms = aggregate()
+    lines = []
+    seen = set()
+
+    def header(name, default_type):
+        if name in seen:
+            return
+        seen.add(name)
+        metric_type, help_text = _descriptions.get(name, (default_type, name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), hist in sorted(histograms.items()):
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), hist[:-1]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {hist[-1]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush_to_dir()
+        except OSError as e:
+            print(f"⚠️ Failed to flush metrics: {e}")
+
+
+def _start_flusher():
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _reset_after_fork():
+    """Workers forked from a preloaded master start from zero"""
+    global _local, _shards_lock
+    _local = threading.local()
+    _shards_lock = threading.Lock()
+    _shards.clear()
+    _retired[0].clear()
+    _retired[1].clear()
+    if METRICS_DIR:
+        _start_flusher()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+if METRICS_DIR:
+    _start_flusher()
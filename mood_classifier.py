@@ -0,0 +1,28 @@
+"""
+Keyword-stem mood classifier shared by the mood index and ai_enhancements.
+
+Kept free of app imports (no tmdb_client), so anything can use it without
+starting the TMDb client's snapshot, scheduler and listeners.
+"""
+import re
+from collections import Counter
+
+
+class MoodClassifier:
+    """Counts lexicon hits per mood in one regex pass"""
+
+    def __init__(self, lexicon):
+        self._moods_for = {}
+        for mood, stems in lexicon.items():
+            for stem in stems:
+                self._moods_for.setdefault(stem.lower(), []).append(mood)
+        alternation = "|".join(re.escape(s) for s in sorted(self._moods_for, key=len, reverse=True))
+        self._pattern = re.compile(rf"\b({alternation})\w*", re.IGNORECASE)
+
+    def classify(self, text):
+        """Counter of mood -> keyword hits"""
+        hits = Counter()
+        for match in self._pattern.finditer(text or ""):
+            for mood in self._moods_for[match.group(1).lower()]:
+                hits[mood] += 1
+        return hits
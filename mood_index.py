@@ -0,0 +1,171 @@
+"""
+Mood tags for catalog titles, precomputed from their overviews.
+
+A MoodClassifier (mood_classifier.py) compiles a mood -> keyword-stem lexicon into one regex, so
+tagging an overview is a single scan. Every title that passes through
+tmdb_client is tagged as it arrives (payload listener), and at startup a
+background thread runs the same pass over every successful response in the
+TMDb snapshot (tmdb_client.snapshot_payloads), so a replayed or previously
+recorded catalog is indexed before anyone browses it. Scores blend
+keyword hits with the genre prior from MOOD_TO_GENRES and land in an
+inverted (mood, content type) -> {title: score} index, from which
+/api/content?mood= can serve mood-ranked pages without calling TMDb.
+
+Ranked lists are re-sorted lazily on read: on every change until a list is
+big enough to serve, then at most every RANK_REFRESH_SECONDS.
+"""
+import math
+import os
+import threading
+import time
+
+from mood_classifier import MoodClassifier
+from projection import payload_items, to_card
+from tmdb_client import add_payload_listener, snapshot_payloads
+
+MIN_SCORE = 0.3
+GENRE_WEIGHT = 0.6
+KEYWORD_WEIGHT = 0.4
+MIN_VOTES = 100            # same floor /api/content asks TMDb discover for
+MAX_ITEMS = int(os.getenv("MOOD_INDEX_MAX_ITEMS", "50000"))
+MIN_SERVE_ITEMS = int(os.getenv("MOOD_INDEX_MIN_ITEMS", "200"))
+RANK_REFRESH_SECONDS = 30
+
+# Keyword stems per app mood; a stem matches any word it starts
+MOOD_LEXICON = {
+    "happy": ["funny", "comedy", "hilarious", "laugh", "joy", "cheer", "fun", "party", "prank", "heartwarming", "celebrat"],
+    "sad": ["loss", "grief", "griev", "tragic", "tragedy", "dying", "death", "lonely", "heartbreak", "mourn", "cancer", "farewell"],
+    "excited": ["chase", "fight", "explos", "race", "battle", "heist", "mission", "escape", "thrill", "danger", "showdown"],
+    "relaxed": ["family", "holiday", "gentle", "quiet", "vacation", "village", "cozy", "christmas", "garden", "small town"],
+    "adventurous": ["quest", "journey", "explor", "expedition", "treasure", "island", "voyage", "wormhole", "space", "jungle"],
+    "romantic": ["love", "romance", "romantic", "kiss", "marri", "wedding", "affair", "soulmate", "sweetheart"],
+    "thoughtful": ["truth", "memory", "identity", "philosoph", "politic", "justice", "history", "moral", "society", "conscience"],
+    "nostalgic": ["childhood", "memories", "reunion", "hometown", "summer", "school", "coming of age", "grow up", "remember"],
+    "scared": ["horror", "haunt", "ghost", "demon", "killer", "murder", "terror", "nightmare", "curse", "creature", "monster", "possess"],
+}
+
+# Extra per-mood eligibility, mirroring the discover filters /api/content uses
+MOOD_FILTERS = {
+    "nostalgic": lambda year: year is not None and year <= 2000,
+}
+
+
+class MoodIndex:
+    """Inverted (mood, content type) -> {(content type, id): score} index"""
+
+    def __init__(self, classifier, mood_genres):
+        self.classifier = classifier
+        self.mood_genres = {mood: set(genres) for mood, genres in mood_genres.items()}
+        self._lock = threading.Lock()
+        self._cards = {}       # (content type, id) -> (card, popularity)
+        self._postings = {}    # (mood, content type) -> {key: score}
+        self._ranked = {}      # (mood, content type) -> (built at, [key, ...])
+        self._dirty = set()
+
+    def __len__(self):
+        return len(self._cards)
+
+    def score(self, item, hits):
+        """Per-mood scores for one title given its keyword hits"""
+        genre_ids = set(item.get("genre_ids") or [g["id"] for g in item.get("genres") or []])
+        year = (item.get("release_date") or item.get("first_air_date") or "")[:4]
+        year = int(year) if year.isdigit() else None
+        scores = {}
+        for mood, genres in self.mood_genres.items():
+            eligible = MOOD_FILTERS.get(mood)
+            if eligible and not eligible(year):
+                continue
+            value = GENRE_WEIGHT * bool(genre_ids & genres) + KEYWORD_WEIGHT * (1 - math.exp(-hits[mood]))
+            if value >= MIN_SCORE:
+                scores[mood] = round(value, 3)
+        return scores
+
+    def add_many(self, items):
+        """Tag and index (content type, TMDb item) pairs"""
+        tagged = []
+        for content_type, item in items:
+            if (item.get("vote_count") or 0) < MIN_VOTES or item.get("adult"):
+                continue
+            hits = self.classifier.classify(f"{item.get('overview') or ''} {item.get('tagline') or ''}")
+            tagged.append((content_type, item, self.score(item, hits)))
+
+        with self._lock:
+            for content_type, item, scores in tagged:
+                key = (content_type, item["id"])
+                if key not in self._cards and len(self._cards) >= MAX_ITEMS:
+                    continue
+                self._cards[key] = (to_card(item, content_type), float(item.get("popularity") or 0))
+                for mood in self.mood_genres:
+                    postings = self._postings.setdefault((mood, content_type), {})
+                    if mood in scores:
+                        if postings.get(key) != scores[mood]:
+                            postings[key] = scores[mood]
+                            self._dirty.add((mood, content_type))
+                    elif postings.pop(key, None) is not None:
+                        self._dirty.add((mood, content_type))
+
+    def ranked(self, mood, content_type):
+        """Keys for a mood, best first (score, then popularity)"""
+        slot = (mood, content_type)
+        with self._lock:
+            built = self._ranked.get(slot)
+            # Cold lists (not served yet) are re-sorted on every change; warm ones at most every refresh
+            if built is None or (slot in self._dirty and (len(built[1]) < MIN_SERVE_ITEMS or
+                                                           time.monotonic() - built[0] >= RANK_REFRESH_SECONDS)):
+                postings = self._postings.get(slot, {})
+                keys = sorted(postings, key=lambda k: (postings[k], self._cards[k][1]), reverse=True)
+                self._dirty.discard(slot)
+                built = self._ranked[slot] = (time.monotonic(), keys)
+        return built[1]
+
+    def page(self, mood, content_type, page, per_page=20):
+        """(cards, total pages) for a mood page, or None while the index is too thin"""
+        keys = self.ranked(mood, content_type)
+        if len(keys) < max(MIN_SERVE_ITEMS, page * per_page):
+            return None
+        cards = [self._cards[k][0] for k in keys[(page - 1) * per_page:page * per_page]]
+        return cards, math.ceil(len(keys) / per_page)
+
+    def backfill(self, payloads):
+        """Batch-tag (path, payload) pairs, e.g. a whole snapshot; returns titles indexed"""
+        for path, data in payloads:
+            self.add_many(payload_items(path, data))
+        return len(self._cards)
+
+
+mood_classifier = MoodClassifier(MOOD_LEXICON)
+mood_index = None
+
+
+def init_index(mood_genres):
+    """Create the index for the app's mood -> genre mapping and start harvesting"""
+    global mood_index
+    mood_index = MoodIndex(mood_classifier, mood_genres)
+    add_payload_listener(harvest_moods)
+    _start_backfill()
+    os.register_at_fork(after_in_child=_reset_after_fork)
+    return mood_index
+
+
+def _backfill_snapshot():
+    try:
+        count = mood_index.backfill(snapshot_payloads())
+    except Exception as e:
+        print(f"⚠️ Mood index backfill failed: {e}")
+        return
+    if count:
+        print(f"🎭 Mood index backfilled: {count} titles")
+
+
+def _start_backfill():
+    threading.Thread(target=_backfill_snapshot, name="mood-backfill", daemon=True).start()
+
+
+def _reset_after_fork():
+    # The parent's backfill thread doesn't survive the fork; adds are idempotent, so rerun it
+    mood_index._lock = threading.Lock()
+    _start_backfill()
+
+
+def harvest_moods(path, data):
+    mood_index.add_many(payload_items(path, data))
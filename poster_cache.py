@@ -0,0 +1,205 @@
+"""
+Poster proxy: fetches TMDb originals once and serves resized JPEG/WebP
+variants out of a content-addressed, size-bounded LRU disk cache.
+
+Layout under POSTER_CACHE_DIR:
+    refs/<sha1(poster_path)>         -> sha256 of the original's bytes
+    blobs/<sha256>                   -> original image
+    blobs/<sha256>_<width>.<format>  -> resized variant
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from PIL import Image
+
+import metrics
+
+POSTER_CACHE_DIR = os.getenv("POSTER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "moviemood-posters"))
+POSTER_CACHE_MAX_BYTES = int(os.getenv("POSTER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_BASE_URL = os.getenv("TMDB_IMAGE_BASE_URL", "https://image.tmdb.org/t/p")
+ORIGINAL_URL = f"{IMAGE_BASE_URL}/original"
+
+# TMDb-style size names → target width in pixels
+POSTER_WIDTHS = {
+    "w92": 92,
+    "w154": 154,
+    "w185": 185,
+    "w342": 342,
+    "w500": 500,
+}
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+
+class PosterCache:
+    """Disk-backed poster variant cache with size-bounded LRU eviction"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.refs_dir = os.path.join(root, "refs")
+        self.blobs_dir = os.path.join(root, "blobs")
+        os.makedirs(self.refs_dir, exist_ok=True)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Striped locks so concurrent misses for one variant build it once
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        self._sizes = OrderedDict()   # blob name → size, least recently used first
+        self._total = 0
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.blobs_dir):
+            try:
+                st = os.stat(os.path.join(self.blobs_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_atime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._sizes[name] = size
+            self._total += size
+        # The budget may have shrunk, or other workers overfilled it, since the last run
+        with self._lock:
+            self._evict()
+
+    def _key_lock(self, key):
+        return self._key_locks[hash(key) % len(self._key_locks)]
+
+    def _touch(self, name):
+        with self._lock:
+            if name in self._sizes:
+                self._sizes.move_to_end(name)
+
+    def _write_blob(self, name, data):
+        path = os.path.join(self.blobs_dir, name)
+        fd, tmp = tempfile.mkstemp(dir=self.blobs_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._total += len(data) - self._sizes.pop(name, 0)
+            self._sizes[name] = len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        """Drop least recently used blobs until under budget (lock held)"""
+        while self._total > self.max_bytes and len(self._sizes) > 1:
+            name, size = self._sizes.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.blobs_dir, name))
+            except OSError:
+                pass
+
+    def _open_blob(self, name):
+        """Open a cached blob for reading, or None if it was evicted.
+
+        Eviction unlinks under the same lock, and an open file stays readable
+        after its unlink, so the caller can always serve what it got.
+        """
+        with self._lock:
+            if name not in self._sizes:
+                return None
+            try:
+                f = open(os.path.join(self.blobs_dir, name), "rb")
+            except OSError:
+                return None
+            self._sizes.move_to_end(name)
+            return f
+
+    def _read_blob(self, name):
+        try:
+            with open(os.path.join(self.blobs_dir, name), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(name)
+        return data
+
+    def _original(self, poster_path, refetch=False):
+        """Return (content digest, bytes or None) of the original, fetching it if
+        needed; the bytes come back only when they were just fetched"""
+        ref = os.path.join(self.refs_dir, hashlib.sha1(poster_path.encode("utf-8")).hexdigest())
+        try:
+            with open(ref) as f:
+                digest = f.read().strip()
+            if digest in self._sizes and not refetch:
+                self._touch(digest)
+                return digest, None
+        except OSError:
+            pass
+
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = requests.get(f"{ORIGINAL_URL}{poster_path}", timeout=10)
+            status = response.status_code
+        finally:
+            metrics.record_upstream("tmdb_images", "original", status, time.perf_counter() - start)
+        response.raise_for_status()
+        data = response.content
+        digest = hashlib.sha256(data).hexdigest()
+        self._write_blob(digest, data)
+        with open(ref, "w") as f:
+            f.write(digest)
+        return digest, data
+
+    def get_variant(self, poster_path, size, fmt):
+        """Return (open binary file, blob name) of the resized variant, building it on a miss"""
+        with self._key_lock(f"{poster_path}|{size}|{fmt}"):
+            digest, original = self._original(poster_path)
+            name = f"{digest}_{POSTER_WIDTHS[size]}.{fmt}"
+            f = self._open_blob(name)
+            if f is not None:
+                metrics.record_cache("poster", True)
+                return f, name
+            metrics.record_cache("poster", False)
+
+            if original is None:
+                original = self._read_blob(digest)
+            if original is None:
+                # Original was evicted underneath us; drop it and refetch, keeping
+                # the fetched bytes so another eviction can't take them again
+                with self._lock:
+                    self._total -= self._sizes.pop(digest, 0)
+                digest, original = self._original(poster_path, refetch=True)
+                name = f"{digest}_{POSTER_WIDTHS[size]}.{fmt}"
+
+            data = resize_image(original, POSTER_WIDTHS[size], fmt)
+            self._write_blob(name, data)
+            return self._open_blob(name) or io.BytesIO(data), name
+
+
+def resize_image(data, width, fmt):
+    """Resize image bytes to the given width and encode in fmt"""
+    pil_format, _, options = FORMATS[fmt]
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGB")
+        if img.width > width:
+            img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, pil_format, **options)
+        return out.getvalue()
+
+
+def negotiate_format(req):
+    """Pick an output format from ?format= or the Accept header"""
+    fmt = req.args.get("format")
+    if fmt in FORMATS:
+        return fmt
+    return "webp" if req.accept_mimetypes["image/webp"] else "jpeg"
+
+
+poster_cache = PosterCache(POSTER_CACHE_DIR, POSTER_CACHE_MAX_BYTES)
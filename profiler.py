@@ -0,0 +1,327 @@
+"""
+On-demand sampling profiler and slow-request capture.
+
+One sampler thread reads every thread's current stack with
+sys._current_frames() PROFILE_SAMPLE_HZ times a second, and only while there
+is something to sample. Stacks are kept as collapsed lines
+("root;outer;...;inner count"), the input format of flamegraph.pl, speedscope
+and most other flamegraph viewers. The root frame is the request route
+("GET /movie/<int:movie_id>") or, for other threads, the thread name.
+
+Profiles are started from the admin API, for `seconds` at a time:
+    window    every thread in the process is sampled
+    percent   only a random `percent` of the requests started in the window
+
+Slow-request capture is always on unless SLOW_REQUEST_SECONDS is 0. Each
+request registers itself and totals its timings per stage (MongoDB, TMDb,
+bcrypt, JSON encoding, ... see metrics.track_stages). The sampler checks
+in-flight requests every SLOW_CHECK_INTERVAL. Once a request passes the
+threshold its thread is sampled until it finishes, and the request is kept
+with its stage breakdown and stacks (streamed responses count until their
+body has been sent). The last SLOW_REQUEST_KEEP captures and
+PROFILE_KEEP profiles are kept in memory, per worker process.
+
+With no profile running and capture disabled, requests pay one attribute
+check and the sampler thread sleeps.
+"""
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import g, request
+
+import metrics
+
+PROFILE_SAMPLE_HZ = float(os.getenv("PROFILE_SAMPLE_HZ", "100"))
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "2"))   # 0 disables capture
+SLOW_REQUEST_KEEP = int(os.getenv("SLOW_REQUEST_KEEP", "50"))
+PROFILE_KEEP = 10
+PROFILE_MAX_SECONDS = 600
+SLOW_CHECK_INTERVAL = 0.05
+MAX_STACK_DEPTH = 128
+
+metrics.describe("slow_requests_total", "counter", "Requests captured by the slow-request profiler")
+metrics.describe("profiler_samples_total", "counter", "Stack samples taken by the profiler")
+
+
+class Profile:
+    """A sampling window; mode is "window" or "percent\""""
+
+    def __init__(self, profile_id, seconds, percent=None):
+        self.id = profile_id
+        self.mode = "percent" if percent is not None else "window"
+        self.percent = percent
+        self.seconds = seconds
+        self.started_at = datetime.utcnow()
+        self.ends = time.monotonic() + seconds
+        self.stacks = Counter()
+        self.requests = 0
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "percent": self.percent,
+            "seconds": self.seconds,
+            "started_at": self.started_at,
+            "samples": sum(self.stacks.values()),
+            "requests": self.requests if self.mode == "percent" else None,
+        }
+
+
+class _Trace:
+    __slots__ = ("ident", "root", "start", "stages", "status", "profile", "stacks")
+
+    def __init__(self, root, stages, profile):
+        self.ident = threading.get_ident()
+        self.root = root
+        self.start = time.monotonic()
+        self.stages = stages
+        self.status = None
+        self.profile = profile    # percent profile this request was picked for
+        self.stacks = None        # set once the request is slow
+
+
+_labels = {}    # code object -> frame label
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = "/".join(code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:])
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return label
+
+
+def collapse(frame, root):
+    """One collapsed stack line (without the count), outermost frame first"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    names.append(root)
+    names.reverse()
+    return ";".join(names)
+
+
+def render_collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+class Profiler:
+    """Sampler thread, the active profile and the kept results"""
+
+    def __init__(self, hz=PROFILE_SAMPLE_HZ, slow_seconds=SLOW_REQUEST_SECONDS):
+        self.interval = 1.0 / hz
+        self.slow_seconds = slow_seconds
+        self.active = None
+        self.profiles = deque(maxlen=PROFILE_KEEP)
+        self.slow_requests = deque(maxlen=SLOW_REQUEST_KEEP)
+        self._traces = {}          # thread ident -> _Trace
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # Request hooks
+
+    def begin_request(self, root):
+        """Register the current request; a no-op while nothing is being profiled"""
+        profile = self.active
+        if not self.slow_seconds and profile is None:
+            return None
+        picked = None
+        if profile is not None and profile.mode == "percent" and random.random() * 100 < profile.percent:
+            picked = profile
+            profile.requests += 1
+        stages = {} if self.slow_seconds else None
+        trace = _Trace(root, stages, picked)
+        if stages is not None:
+            metrics.track_stages(stages)
+        self._traces[trace.ident] = trace
+        return trace
+
+    def end_request(self, trace, path):
+        self._traces.pop(trace.ident, None)
+        if trace.stages is not None:
+            metrics.track_stages(None)
+        duration = time.monotonic() - trace.start
+        if not self.slow_seconds or duration < self.slow_seconds:
+            return
+        trace.stages.pop("http_request_duration", None)
+        stages = {name: {"count": count, "ms": round(seconds * 1000, 1)}
+                  for name, (count, seconds) in sorted(trace.stages.items(), key=lambda s: -s[1][1])}
+        accounted = sum(seconds for _, seconds in trace.stages.values())
+        stages["unaccounted"] = {"count": 1, "ms": round(max(0.0, duration - accounted) * 1000, 1)}
+        with self._lock:
+            stacks = trace.stacks or Counter()
+            self.slow_requests.append({
+                "id": next(self._ids),
+                "at": datetime.utcnow(),
+                "route": trace.root,
+                "path": path,
+                "status": trace.status,
+                "duration_ms": round(duration * 1000, 1),
+                "stages": stages,
+                "samples": sum(stacks.values()),
+                "stacks": stacks,
+            })
+        metrics.inc("slow_requests_total", route=trace.root)
+
+    # Profiles
+
+    def start(self, seconds, percent=None):
+        """Start a profile; returns None if one is already running"""
+        with self._lock:
+            if self.active is not None:
+                return None
+            self.active = Profile(next(self._ids), seconds, percent)
+        self._ensure_sampler()
+        self._wake.set()
+        return self.active
+
+    def stop(self):
+        """Finish the running profile early; returns it (or None)"""
+        with self._lock:
+            profile, self.active = self.active, None
+            if profile is not None:
+                self.profiles.append(profile)
+        return profile
+
+    def stacks(self, capture_id):
+        """Copy of a kept profile's or slow request's stacks, or None"""
+        with self._lock:
+            for profile in itertools.chain(self.profiles, [self.active] if self.active else []):
+                if profile.id == capture_id:
+                    return dict(profile.stacks)
+            for capture in self.slow_requests:
+                if capture["id"] == capture_id:
+                    return dict(capture["stacks"])
+        return None
+
+    def status(self):
+        with self._lock:
+            return {
+                "sample_hz": round(1 / self.interval, 1),
+                "slow_request_seconds": self.slow_seconds or None,
+                "active": self.active.summary() if self.active else None,
+                "profiles": [p.summary() for p in reversed(self.profiles)],
+                "slow_requests": [{k: v for k, v in c.items() if k != "stacks"}
+                                  for c in reversed(self.slow_requests)],
+            }
+
+    # Sampler
+
+    def _ensure_sampler(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            profile = self.active
+            if profile is not None and time.monotonic() >= profile.ends:
+                self.stop()
+                profile = None
+            if profile is None and not self.slow_seconds:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            sampled = self._sample(me, profile)
+            # Between samples, only idle at the slower watchdog pace
+            if sampled or profile is not None:
+                time.sleep(self.interval)
+            else:
+                self._wake.wait(SLOW_CHECK_INTERVAL)
+                self._wake.clear()
+
+    def _sample(self, me, profile):
+        now = time.monotonic()
+        due = []
+        for trace in list(self._traces.values()):
+            if trace.stacks is None and self.slow_seconds and now - trace.start >= self.slow_seconds:
+                trace.stacks = Counter()
+            if trace.stacks is not None or trace.profile is not None:
+                due.append(trace)
+        window = profile is not None and profile.mode == "window"
+        if not due and not window:
+            return False
+
+        frames = sys._current_frames()
+        samples = 0
+        with self._lock:
+            for trace in due:
+                frame = frames.get(trace.ident)
+                if frame is None:
+                    continue
+                stack = collapse(frame, trace.root)
+                if trace.stacks is not None:
+                    trace.stacks[stack] += 1
+                if trace.profile is not None and trace.profile is self.active:
+                    trace.profile.stacks[stack] += 1
+                samples += 1
+            if window and profile is self.active:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in frames.items():
+                    if ident == me:
+                        continue
+                    trace = self._traces.get(ident)
+                    root = trace.root if trace else re.sub(r"\d+", "N", names.get(ident, "thread"))
+                    profile.stacks[collapse(frame, root)] += 1
+                    samples += 1
+        del frames
+        metrics.inc("profiler_samples_total", samples)
+        return True
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._traces.clear()
+        self._thread = None
+        self.active = None
+        if self.slow_seconds:
+            self._ensure_sampler()
+
+
+profiler = Profiler()
+os.register_at_fork(after_in_child=profiler._reset_after_fork)
+
+
+def init_app(app):
+    """Register requests with the profiler; call before other request hooks
+    so admission queueing is part of the stage breakdown"""
+    if profiler.slow_seconds:
+        profiler._ensure_sampler()
+
+    @app.before_request
+    def begin_profiled_request():
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        trace = profiler.begin_request(f"{request.method} {rule}")
+        if trace is not None:
+            g.profile_trace = trace
+
+    @app.after_request
+    def note_profiled_status(response):
+        trace = g.get("profile_trace")
+        if trace is not None:
+            trace.status = response.status_code
+            if response.is_streamed:
+                # Teardown runs when the view returns; a streamed body is timed until it's sent
+                g.pop("profile_trace")
+                path = request.full_path.rstrip("?")
+                response.call_on_close(lambda: profiler.end_request(trace, path))
+        return response
+
+    @app.teardown_request
+    def end_profiled_request(exc):
+        trace = g.pop("profile_trace", None)
+        if trace is not None:
+            profiler.end_request(trace, request.full_path.rstrip("?"))
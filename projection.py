@@ -0,0 +1,146 @@
+"""
+Projection of raw TMDb payloads onto the card/detail schema the UI reads.
+
+Detail payloads keep TMDb's field names so existing clients keep working,
+but only the fields below survive, watch providers are narrowed to one
+region and videos to trailers.
+"""
+
+# Cards point at the local poster proxy, sized for grid tiles
+CARD_POSTER_URL = "/poster/w342"
+
+DEFAULT_REGION = "US"
+MAX_SIMILAR = 12
+MAX_TRAILERS = 3
+
+# Fields copied verbatim from the TMDb detail payload
+DETAIL_SCALAR_FIELDS = {
+    "movie": [
+        "id", "title", "original_title", "overview", "tagline", "status",
+        "poster_path", "backdrop_path", "release_date", "runtime",
+        "vote_average", "vote_count", "popularity", "imdb_id", "homepage",
+    ],
+    "tv": [
+        "id", "name", "original_name", "overview", "tagline", "status",
+        "poster_path", "backdrop_path", "first_air_date", "last_air_date",
+        "episode_run_time", "number_of_seasons", "number_of_episodes",
+        "vote_average", "vote_count", "popularity", "homepage",
+    ],
+}
+
+# Derived/nested fields built by the projectors below
+DETAIL_NESTED_FIELDS = ["genres", "videos", "watch/providers", "similar"]
+
+SIMILAR_FIELDS = [
+    "id", "title", "name", "poster_path", "release_date", "first_air_date",
+    "vote_average",
+]
+
+
+def detail_fields(content_type):
+    """All field names a detail projection can return"""
+    return DETAIL_SCALAR_FIELDS[content_type] + DETAIL_NESTED_FIELDS
+
+
+def parse_fields(raw, content_type):
+    """Parse a comma-separated fields= value.
+
+    Returns (fields, unknown) where fields is None when no selection was made.
+    """
+    if not raw:
+        return None, []
+    requested = [f.strip() for f in raw.split(",") if f.strip()]
+    allowed = set(detail_fields(content_type))
+    unknown = [f for f in requested if f not in allowed]
+    return requested, unknown
+
+
+def region_from_request(req):
+    """Pick the watch-provider region from ?region= or Accept-Language"""
+    region = req.args.get("region")
+    if region:
+        return region.upper()
+    for lang, _ in req.accept_languages:
+        parts = lang.replace("_", "-").split("-")
+        if len(parts) > 1 and len(parts[1]) == 2:
+            return parts[1].upper()
+    return DEFAULT_REGION
+
+
+def payload_items(path, data):
+    """Yield (content_type, item) for every title in a TMDb payload.
+
+    Handles detail payloads (/movie/{id}, /tv/{id}, including "similar") and
+    result pages from /search and /discover; people are skipped.
+    """
+    parts = path.strip("/").split("/")
+    default_type = parts[1] if parts[0] in ("search", "discover") and len(parts) > 1 else parts[0]
+    if parts[0] in ("movie", "tv") and len(parts) == 2 and "id" in data:
+        yield parts[0], data
+        data = data.get("similar") or {}
+    for item in data.get("results") or []:
+        content_type = item.get("media_type", default_type)
+        if content_type in ("movie", "tv") and item.get("id"):
+            yield content_type, item
+
+
+def to_card(m, content_type):
+    """Compact card used by listing pages"""
+    poster = m.get("poster_path")
+    return {
+        "id": m.get("id"),
+        "title": m.get("title") or m.get("name"),
+        "overview": m.get("overview") or "",
+        "poster": f"{CARD_POSTER_URL}{poster}" if poster else "",
+        "year": (m.get("release_date") or m.get("first_air_date") or "N/A")[:4],
+        "rating": m.get("vote_average", 0),
+        "type": content_type
+    }
+
+
+def project_trailers(videos):
+    """Keep YouTube trailers only (teasers if there is no trailer), official first"""
+    results = (videos or {}).get("results", [])
+    youtube = [v for v in results if v.get("site") == "YouTube"]
+    picked = [v for v in youtube if v.get("type") == "Trailer"] or \
+        [v for v in youtube if v.get("type") == "Teaser"]
+    picked.sort(key=lambda v: not v.get("official", False))
+    return {"results": [
+        {k: v.get(k) for k in ("key", "name", "site", "type", "official")}
+        for v in picked[:MAX_TRAILERS]
+    ]}
+
+
+def project_providers(providers, region):
+    """Narrow watch/providers to a single region"""
+    by_region = (providers or {}).get("results", {})
+    entry = by_region.get(region)
+    return {"results": {region: entry} if entry else {}}
+
+
+def project_similar(similar):
+    results = (similar or {}).get("results", [])[:MAX_SIMILAR]
+    return {"results": [
+        {k: m[k] for k in SIMILAR_FIELDS if k in m} for m in results
+    ]}
+
+
+def project_detail(details, content_type, region=DEFAULT_REGION, fields=None):
+    """Trim a TMDb detail payload (with appended videos/providers/similar)"""
+    wanted = fields or detail_fields(content_type)
+    projected = {}
+    for field in wanted:
+        if field == "genres":
+            projected["genres"] = [
+                {"id": g.get("id"), "name": g.get("name")}
+                for g in details.get("genres", [])
+            ]
+        elif field == "videos":
+            projected["videos"] = project_trailers(details.get("videos"))
+        elif field == "watch/providers":
+            projected["watch/providers"] = project_providers(details.get("watch/providers"), region)
+        elif field == "similar":
+            projected["similar"] = project_similar(details.get("similar"))
+        elif field in details:
+            projected[field] = details[field]
+    return projected
@@ -0,0 +1,194 @@
+"""
+Watch-provider availability index: which titles stream where.
+
+TMDb only reports providers per title, inside detail payloads
+(append_to_response=watch/providers). Every detail payload that passes
+through tmdb_client is harvested here (payload listener, plus a backfill
+from the response cache at startup). Each title gets a bit position and each
+(region, provider) keeps an int bitset of the titles it offers, so "available
+on any of my services" for a page of results is a couple of ORs and ANDs.
+
+Only subscription, free and ad-supported offers count (flatrate, free, ads);
+rent/buy is available nearly everywhere and would make the filter useless.
+A title's availability is known once its detail payload has been seen.
+Titles shown in listings whose availability is unknown or older than
+PROVIDER_MAX_AGE are queued for a background detail fetch at prefetch
+priority, at most PROVIDER_REFRESH_PER_MINUTE per process (0 disables).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from projection import payload_items
+from tmdb_client import add_payload_listener, response_cache
+
+MAX_ITEMS = int(os.getenv("PROVIDER_INDEX_MAX_ITEMS", "100000"))
+PROVIDER_MAX_AGE = float(os.getenv("PROVIDER_MAX_AGE", str(24 * 3600)))
+PROVIDER_REFRESH_PER_MINUTE = float(os.getenv("PROVIDER_REFRESH_PER_MINUTE", "20"))
+MAX_WANTED = 5000
+OFFER_TYPES = ("flatrate", "free", "ads")
+
+metrics.describe("provider_refresh_total", "counter", "Background provider refreshes by outcome")
+
+
+class ProviderIndex:
+    """(region, provider id) -> bitset over catalog titles"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._positions = {}      # (content type, id) -> bit position
+        self._offers = []         # position -> frozenset of (region, provider id)
+        self._checked = []        # position -> monotonic time of the last detail seen
+        self._bits = {}           # (region, provider id) -> int bitset
+        self._known = 0           # titles whose providers have been seen
+        self._providers = {}      # provider id -> {"id", "name", "logo_path"}
+        self._wanted = OrderedDict()
+        self._wanted_ready = threading.Condition(self._lock)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def update(self, content_type, tmdb_id, watch_providers):
+        """Record a title's watch/providers block (all regions)"""
+        offers = set()
+        names = {}
+        for region, entry in ((watch_providers or {}).get("results") or {}).items():
+            for offer_type in OFFER_TYPES:
+                for provider in entry.get(offer_type) or []:
+                    offers.add((region, provider["provider_id"]))
+                    names[provider["provider_id"]] = provider
+        offers = frozenset(offers)
+        key = (content_type, tmdb_id)
+
+        with self._lock:
+            pos = self._positions.get(key)
+            if pos is None:
+                if len(self._positions) >= MAX_ITEMS:
+                    return
+                pos = self._positions[key] = len(self._offers)
+                self._offers.append(frozenset())
+                self._checked.append(0.0)
+            bit = 1 << pos
+            for slot in self._offers[pos] - offers:
+                self._bits[slot] &= ~bit
+            for slot in offers - self._offers[pos]:
+                self._bits[slot] = self._bits.get(slot, 0) | bit
+            self._offers[pos] = offers
+            self._checked[pos] = time.monotonic()
+            self._known |= bit
+            self._wanted.pop(key, None)
+            for provider_id, provider in names.items():
+                if provider_id not in self._providers:
+                    self._providers[provider_id] = {
+                        "id": provider_id,
+                        "name": provider.get("provider_name"),
+                        "logo_path": provider.get("logo_path"),
+                    }
+
+    def available(self, region, provider_ids):
+        """Bitset of titles on any of the providers in a region"""
+        bits = 0
+        for provider_id in provider_ids:
+            bits |= self._bits.get((region, provider_id), 0)
+        return bits
+
+    def filter(self, items, region, provider_ids):
+        """Split items ({"id", "type"} dicts) by availability on provider_ids.
+
+        Returns (available, unknown_count). Available items are copies with
+        "available_on" set to the matching provider ids; titles nobody has
+        looked up yet are queued for a refresh and left out.
+        """
+        wanted = set(provider_ids)
+        bits = self.available(region, wanted)
+        known = self._known
+        kept, unknown, stale = [], 0, []
+        now = time.monotonic()
+        for item in items:
+            key = (item.get("type"), item.get("id"))
+            pos = self._positions.get(key)
+            if pos is None or not (known >> pos) & 1:
+                unknown += 1
+                stale.append(key)
+                continue
+            if now - self._checked[pos] > PROVIDER_MAX_AGE:
+                stale.append(key)
+            if (bits >> pos) & 1:
+                on = sorted(p for r, p in self._offers[pos] if r == region and p in wanted)
+                kept.append(dict(item, available_on=on))
+        self.want(stale)
+        return kept, unknown
+
+    def providers(self, region):
+        """Providers seen in a region with their title counts, most titles first"""
+        counts = [(provider_id, bits.bit_count()) for (r, provider_id), bits in list(self._bits.items())
+                  if r == region and bits]
+        counts.sort(key=lambda c: c[1], reverse=True)
+        return [dict(self._providers[provider_id], titles=n) for provider_id, n in counts]
+
+    def want(self, keys):
+        """Queue titles for a background provider refresh"""
+        keys = [k for k in keys if k[0] in ("movie", "tv") and k[1]]
+        if not keys or not PROVIDER_REFRESH_PER_MINUTE:
+            return
+        with self._lock:
+            for key in keys:
+                self._wanted[key] = None
+                self._wanted.move_to_end(key)
+            while len(self._wanted) > MAX_WANTED:
+                self._wanted.popitem(last=False)
+            self._wanted_ready.notify()
+
+    def next_wanted(self):
+        """Block until a title needs refreshing; most recently wanted first"""
+        with self._lock:
+            while not self._wanted:
+                self._wanted_ready.wait()
+            return self._wanted.popitem(last=True)[0]
+
+    def harvest(self, path, data):
+        for content_type, item in payload_items(path, data):
+            if "watch/providers" in item:
+                self.update(content_type, item["id"], item["watch/providers"])
+
+
+provider_index = ProviderIndex()
+_fetch = None
+
+
+def _refresh_loop():
+    interval = 60 / PROVIDER_REFRESH_PER_MINUTE
+    while True:
+        content_type, tmdb_id = provider_index.next_wanted()
+        try:
+            data = _fetch(content_type, tmdb_id)
+            provider_index.harvest(f"/{content_type}/{tmdb_id}", data)
+            metrics.inc("provider_refresh_total", outcome="ok")
+        except Exception:
+            metrics.inc("provider_refresh_total", outcome="error")
+        time.sleep(interval)
+
+
+def _start_refresher():
+    threading.Thread(target=_refresh_loop, name="provider-refresh", daemon=True).start()
+
+
+def _reset_after_fork():
+    provider_index._lock = threading.Lock()
+    provider_index._wanted_ready = threading.Condition(provider_index._lock)
+    _start_refresher()
+
+
+def init_index(fetch):
+    """Backfill from cached details, harvest new ones, and refresh via fetch(content_type, id)"""
+    global _fetch
+    for path, data in response_cache.payloads():
+        provider_index.harvest(path, data)
+    add_payload_listener(provider_index.harvest)
+    if PROVIDER_REFRESH_PER_MINUTE > 0:
+        _fetch = fetch
+        _start_refresher()
+        os.register_at_fork(after_in_child=_reset_after_fork)
+    return provider_index
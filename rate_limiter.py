@@ -0,0 +1,152 @@
+"""
+Global TMDb rate limiting shared by every worker process on the host.
+
+A token bucket lives in a small shared-memory file (/dev/shm when available)
+and is updated under flock, so all gunicorn workers draw from one budget.
+Inside a worker, callers queue by priority class: interactive requests
+(search, details, listings) are always served before prefetch/warming work,
+and prefetch may not dip into the reserve kept for interactive traffic in
+other workers. Callers wait up to their deadline instead of failing.
+"""
+import fcntl
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import metrics
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_PREFETCH: "prefetch"}
+
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", "40"))     # tokens per second
+TMDB_RATE_BURST = float(os.getenv("TMDB_RATE_BURST", "40"))
+# Fraction of the bucket only interactive requests may use
+PREFETCH_RESERVE = float(os.getenv("TMDB_PREFETCH_RESERVE", "0.25"))
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+RATE_LIMIT_STATE_PATH = os.getenv("TMDB_RATE_LIMIT_STATE", os.path.join(_SHM_DIR, "moviemood-tmdb-bucket"))
+
+_STATE = struct.Struct("<dd")   # tokens, CLOCK_MONOTONIC timestamp of last update
+
+metrics.describe("upstream_queue_wait_seconds", "histogram", "Time spent queued for an upstream rate-limit token")
+metrics.describe("upstream_queue_timeouts_total", "counter", "Requests whose deadline expired while queued")
+
+
+class RateLimitTimeout(Exception):
+    """No token could be obtained before the caller's deadline"""
+
+
+class SharedTokenBucket:
+    """Token bucket whose state is shared between processes via mmap + flock"""
+
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _open(self):
+        # flock is per open file description, so every process needs its own
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < _STATE.size:
+            os.ftruncate(fd, _STATE.size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, _STATE.size)
+        self._pid = os.getpid()
+
+    def _update(self, fn):
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                tokens, stamp = _STATE.unpack_from(self._map)
+                now = time.monotonic()
+                if stamp == 0:
+                    tokens = self.burst
+                else:
+                    tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+                tokens, result = fn(tokens)
+                _STATE.pack_into(self._map, 0, tokens, now)
+                return result
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def try_take(self, reserve=0.0):
+        """Take one token, leaving at least reserve behind.
+
+        Returns 0 on success, otherwise the seconds until one would be available.
+        """
+        def take(tokens):
+            if tokens >= 1 + reserve:
+                return tokens - 1, 0.0
+            return tokens, (1 + reserve - tokens) / self.rate
+        return self._update(take)
+
+    def penalize(self, seconds):
+        """Upstream said slow down: empty the bucket for every worker"""
+        self._update(lambda tokens: (min(tokens, -seconds * self.rate), None))
+
+
+class UpstreamScheduler:
+    """Per-process priority queue in front of a shared token bucket"""
+
+    def __init__(self, bucket, prefetch_reserve=PREFETCH_RESERVE):
+        self.bucket = bucket
+        self.prefetch_reserve = prefetch_reserve * bucket.burst
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """Block until a token is granted; returns seconds spent queued.
+
+        deadline is an absolute time.monotonic() value; RateLimitTimeout is
+        raised once it passes.
+        """
+        start = time.monotonic()
+        ticket = (priority, next(self._seq))
+        reserve = self.prefetch_reserve if priority > PRIORITY_INTERACTIVE else 0.0
+        label = PRIORITY_NAMES.get(priority, str(priority))
+
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    wait = 0.05
+                    if self._waiters[0] == ticket:
+                        wait = self.bucket.try_take(reserve)
+                        if wait == 0:
+                            heapq.heappop(self._waiters)
+                            self._cond.notify_all()
+                            waited = time.monotonic() - start
+                            metrics.observe("upstream_queue_wait_seconds", waited, priority=label)
+                            return waited
+                    now = time.monotonic()
+                    if deadline is not None and now >= deadline:
+                        metrics.inc("upstream_queue_timeouts_total", priority=label)
+                        raise RateLimitTimeout(f"no upstream token within deadline ({label})")
+                    if deadline is not None:
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def penalize(self, seconds):
+        self.bucket.penalize(seconds)
+
+
+tmdb_scheduler = UpstreamScheduler(
+    SharedTokenBucket(RATE_LIMIT_STATE_PATH, TMDB_RATE_LIMIT, TMDB_RATE_BURST)
+)
@@ -0,0 +1,228 @@
+"""
+Community rating aggregates: per-title sum, count and 1-10 histogram.
+
+One document per title in the rating_aggregates collection:
+    {tmdb_id, content_type, sum, count, hist: {"1": n, ..., "10": n}}
+
+Every saved rating is reported as a delta (a first rating adds to count, a
+changed one moves sum and at most two histogram buckets), applied with $inc.
+The previous rating always comes from MongoDB's find_one_and_update, so two
+workers editing the same rating can't both count it as new. With
+WRITE_BEHIND=1 that happens when the rating is flushed, and the $inc goes
+through the aggregates' own queue. Listing pages read a whole page of titles
+with get_many(): hits come from a per-process cache, misses from a single
+query. Local deltas update cached entries in place (a fill that raced one is
+not cached); other workers' deltas show up once an entry is older than
+AGGREGATE_CACHE_TTL seconds.
+
+rebuild() recomputes everything from the ratings collection with a $group
+pipeline, streamed through a cursor and written back in bulk batches. Run
+`python rating_aggregates.py` after importing ratings or if counters drift;
+deltas recorded while it runs may be overwritten, so run it when quiet.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo import ReplaceOne
+
+import metrics
+from write_behind import apply_op
+
+AGGREGATE_CACHE_TTL = float(os.getenv("AGGREGATE_CACHE_TTL", "60"))
+AGGREGATE_CACHE_MAX_ENTRIES = int(os.getenv("AGGREGATE_CACHE_MAX_ENTRIES", "50000"))
+REBUILD_BATCH = 1000
+
+KEY_FIELDS = ("tmdb_id", "content_type")
+BUCKETS = range(1, 11)
+EMPTY = (0, 0, (0,) * len(BUCKETS))     # (sum, count, histogram)
+
+
+def bucket(rating):
+    """Histogram bucket (1-10) for a rating"""
+    return min(10, max(1, round(rating)))
+
+
+def aggregate_key(tmdb_id, content_type):
+    """(tmdb_id, content_type) with an int id, or None; ratings may carry string ids"""
+    try:
+        return int(tmdb_id), content_type
+    except (TypeError, ValueError):
+        return None
+
+
+def summary(aggregate, histogram=False):
+    """JSON shape for cards ({average, count}) and details (+ histogram, counts for 1..10)"""
+    total, count, hist = aggregate
+    result = {"average": round(total / count, 1) if count else None, "count": count}
+    if histogram:
+        result["histogram"] = list(hist)
+    return result
+
+
+def _from_doc(doc):
+    if not doc:
+        return EMPTY
+    hist = doc.get("hist") or {}
+    return doc.get("sum", 0), doc.get("count", 0), tuple(hist.get(str(b), 0) for b in BUCKETS)
+
+
+def _delta(old, new):
+    """$inc amounts for a rating going from old (None: first rating) to new"""
+    amounts = {"sum": new - (old or 0)}
+    if old is None:
+        amounts["count"] = 1
+    if old is None or bucket(old) != bucket(new):
+        amounts[f"hist.{bucket(new)}"] = 1
+        if old is not None:
+            amounts[f"hist.{bucket(old)}"] = -1
+    return amounts
+
+
+def _apply_delta(aggregate, old, new):
+    total, count, hist = aggregate
+    hist = list(hist)
+    hist[bucket(new) - 1] += 1
+    if old is None:
+        count += 1
+    else:
+        hist[bucket(old) - 1] -= 1
+    return total + new - (old or 0), count, tuple(hist)
+
+
+class RatingAggregates:
+    """Materialized per-title aggregates with a read-through cache"""
+
+    def __init__(self, collection, writes=None):
+        self.collection = collection
+        self.writes = writes          # write_behind.WriteBehindQueue keyed by KEY_FIELDS
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # key -> (expires at, aggregate)
+        self._version = 0             # bumped by every local delta
+
+    def record(self, tmdb_id, content_type, old, new):
+        """Apply one user's rating change (old is None for a first rating)"""
+        key = aggregate_key(tmdb_id, content_type)
+        if key is None or old == new:
+            return
+        amounts = _delta(old, new)
+        if self.writes is not None:
+            self.writes.increment(key, amounts)
+        else:
+            self.collection.update_one(dict(zip(KEY_FIELDS, key)), {"$inc": amounts}, upsert=True)
+        with self._lock:
+            self._version += 1
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache[key] = (entry[0], _apply_delta(entry[1], old, new))
+
+    def get_many(self, keys):
+        """{key: (sum, count, histogram)} for (tmdb_id, content_type) keys.
+
+        Cache misses are fetched with one query; titles nobody rated map to
+        EMPTY. On a database error only cached entries are returned.
+        """
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            version = self._version
+            for key in dict.fromkeys(keys):
+                entry = self._cache.get(key)
+                if entry is not None and entry[0] > now:
+                    self._cache.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    missing.append(key)
+        for key in found:
+            metrics.record_cache("rating_aggregates", True)
+        if not missing:
+            return found
+
+        by_type = {}
+        for tmdb_id, content_type in missing:
+            by_type.setdefault(content_type, []).append(tmdb_id)
+        query = {"$or": [{"content_type": ct, "tmdb_id": {"$in": ids}} for ct, ids in by_type.items()]}
+        fetch = lambda: {(d["tmdb_id"], d["content_type"]): d for d in self.collection.find(query, {"_id": 0})}
+        try:
+            docs, ops = self.writes.read(fetch) if self.writes is not None else (fetch(), {})
+        except Exception as e:
+            print(f"⚠️ Could not load rating aggregates: {e}")
+            return found
+
+        fetched = {}
+        for key in missing:
+            metrics.record_cache("rating_aggregates", False)
+            fetched[key] = _from_doc(apply_op(docs.get(key), ops.get(key)))
+        with self._lock:
+            if self._version != version:
+                # A delta landed mid-read; it may or may not be in what was fetched
+                found.update(fetched)
+                return found
+            expires = now + AGGREGATE_CACHE_TTL
+            for key, aggregate in fetched.items():
+                self._cache[key] = (expires, aggregate)
+                self._cache.move_to_end(key)
+            while len(self._cache) > AGGREGATE_CACHE_MAX_ENTRIES:
+                self._cache.popitem(last=False)
+        found.update(fetched)
+        return found
+
+    def get(self, tmdb_id, content_type):
+        key = aggregate_key(tmdb_id, content_type)
+        return self.get_many([key]).get(key, EMPTY) if key else EMPTY
+
+    def rebuild(self, ratings_collection, batch_size=REBUILD_BATCH):
+        """Recompute every title's aggregate from ratings; returns titles written"""
+        if self.writes is not None:
+            self.writes.flush()
+        rounded = {"$toInt": {"$round": ["$rating", 0]}}
+        pipeline = [
+            {"$match": {"rating": {"$gte": 1, "$lte": 10}}},
+            {"$set": {"tmdb_id": {"$convert": {"input": "$tmdb_id", "to": "int", "onError": None, "onNull": None}}}},
+            {"$match": {"tmdb_id": {"$ne": None}}},
+            {"$group": {
+                "_id": {"tmdb_id": "$tmdb_id", "content_type": "$content_type",
+                        "bucket": {"$min": [10, {"$max": [1, rounded]}]}},
+                "sum": {"$sum": "$rating"},
+                "count": {"$sum": 1},
+            }},
+            {"$group": {
+                "_id": {"tmdb_id": "$_id.tmdb_id", "content_type": "$_id.content_type"},
+                "sum": {"$sum": "$sum"},
+                "count": {"$sum": "$count"},
+                "hist": {"$push": {"k": {"$toString": "$_id.bucket"}, "v": "$count"}},
+            }},
+            {"$project": {
+                "_id": 0, "tmdb_id": "$_id.tmdb_id", "content_type": "$_id.content_type",
+                "sum": 1, "count": 1, "hist": {"$arrayToObject": "$hist"},
+            }},
+        ]
+        stamp = datetime.utcnow()
+        written, batch = 0, []
+        for doc in ratings_collection.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+            doc["rebuilt_at"] = stamp
+            batch.append(ReplaceOne({k: doc[k] for k in KEY_FIELDS}, doc, upsert=True))
+            if len(batch) >= batch_size:
+                self.collection.bulk_write(batch, ordered=False)
+                written, batch = written + len(batch), []
+        if batch:
+            self.collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+        # Titles that no longer have any ratings
+        self.collection.delete_many({"rebuilt_at": {"$ne": stamp}})
+        with self._lock:
+            self._cache.clear()
+        return written
+
+
+if __name__ == "__main__":
+    import database
+
+    if database.rating_aggregates is None:
+        print("❌ MongoDB is not available; nothing to rebuild")
+        raise SystemExit(1)
+    started = time.monotonic()
+    count = database.rating_aggregates.rebuild(database.ratings_collection)
+    print(f"✅ Rebuilt rating aggregates for {count} titles in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,228 @@
+"""
+Server-side sessions: the cookie carries only a random session id.
+
+Session data lives in two tiers:
+    local   per-process LRU of serialized sessions, trusted for a few seconds
+    shared  MongoDB "sessions" collection (TTL-indexed), seen by every worker
+
+Sessions are msgpack-encoded (flask-session's serializer) and loaded lazily:
+requests that never touch `session` (search, details, posters) never hit
+either tier. A session is written back only when it was modified, or when a
+long-lived session is past half its lifetime and its expiry needs sliding.
+Clearing a session deletes it from both tiers, so sign-out is server-side.
+
+Other workers may keep serving a cleared/changed session from their local tier
+for up to SESSION_LOCAL_TTL seconds.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+
+import metrics
+
+SESSION_LOCAL_MAX_ENTRIES = int(os.getenv("SESSION_LOCAL_MAX_ENTRIES", "10000"))
+SESSION_LOCAL_TTL = float(os.getenv("SESSION_LOCAL_TTL", "5"))
+SESSION_KEY_PREFIX = "session:"
+
+
+class LazySession(ServerSideSession):
+    """Session whose data is fetched from the store on first access"""
+
+    def __init__(self, sid, loader):
+        super().__init__(sid=sid)
+        self._loader = loader
+        self.loaded = False
+
+    def _load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        data = self._loader(self)
+        if data:
+            dict.update(self, data)
+
+    def __getitem__(self, key):
+        self._load()
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self._load()
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self._load()
+        return super().setdefault(key, default)
+
+    def __setitem__(self, key, value):
+        self._load()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._load()
+        super().__delitem__(key)
+
+    def pop(self, *args):
+        self._load()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._load()
+        return super().popitem()
+
+    def update(self, *args, **kwargs):
+        self._load()
+        super().update(*args, **kwargs)
+
+    def clear(self):
+        self._load()
+        super().clear()
+
+    def __contains__(self, key):
+        self._load()
+        return super().__contains__(key)
+
+    def __iter__(self):
+        self._load()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load()
+        return super().__len__()
+
+    def __bool__(self):
+        self._load()
+        return super().__bool__()
+
+    def keys(self):
+        self._load()
+        return super().keys()
+
+    def values(self):
+        self._load()
+        return super().values()
+
+    def items(self):
+        self._load()
+        return super().items()
+
+    def copy(self):
+        self._load()
+        return dict(self)
+
+
+class TieredSessionInterface(ServerSideSessionInterface):
+    """flask-session backend with a local LRU in front of MongoDB"""
+
+    session_class = ServerSideSession
+    ttl = True   # MongoDB expires documents itself
+
+    def __init__(self, app, collection=None, max_entries=SESSION_LOCAL_MAX_ENTRIES, local_ttl=SESSION_LOCAL_TTL):
+        super().__init__(app, key_prefix=SESSION_KEY_PREFIX, permanent=app.config.get("SESSION_PERMANENT", True),
+                         serialization_format="msgpack")
+        self.store = collection
+        self.max_entries = max_entries
+        # Without a shared tier the local one is all there is, so trust it until expiry
+        self.local_ttl = local_ttl if collection is not None else float("inf")
+        self._local = OrderedDict()     # store_id -> (serialized, expires_at, trusted_until)
+        self._lock = threading.Lock()
+
+    # local tier
+
+    def _local_get(self, store_id):
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(store_id)
+            if entry is None:
+                return None
+            if entry[1] <= now or entry[2] <= now:
+                del self._local[store_id]
+                return None
+            self._local.move_to_end(store_id)
+            return entry
+
+    def _local_set(self, store_id, serialized, expires_at):
+        with self._lock:
+            self._local[store_id] = (serialized, expires_at, time.time() + self.local_ttl)
+            self._local.move_to_end(store_id)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    # flask-session storage hooks
+
+    def _retrieve_session_data(self, store_id):
+        entry = self._local_get(store_id)
+        metrics.record_cache("session_local", entry is not None)
+        if entry is None and self.store is not None:
+            document = self.store.find_one({"id": store_id}, {"val": 1, "expiration": 1})
+            if document and document["expiration"] > datetime.utcnow():
+                # expiration is naive UTC (pymongo default); convert without tz shifts
+                expires_at = (document["expiration"] - datetime(1970, 1, 1)).total_seconds()
+                entry = (bytes(document["val"]), expires_at, 0)
+                self._local_set(store_id, entry[0], expires_at)
+        if entry is None:
+            return None
+        data = self.serializer.decode(entry[0])
+        data["_expires_at"] = entry[1]
+        return data
+
+    def _delete_session(self, store_id):
+        with self._lock:
+            self._local.pop(store_id, None)
+        if self.store is not None:
+            self.store.delete_one({"id": store_id})
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        expiration = datetime.utcnow() + session_lifetime
+        serialized = self.serializer.encode(session)
+        self._local_set(store_id, serialized, time.time() + session_lifetime.total_seconds())
+        if self.store is not None:
+            self.store.update_one(
+                {"id": store_id},
+                {"$set": {"id": store_id, "val": serialized, "expiration": expiration}},
+                upsert=True,
+            )
+
+    # session interface
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.config["SESSION_COOKIE_NAME"])
+        if not sid:
+            return self.session_class(sid=self._generate_sid(self.sid_length), permanent=self.permanent)
+        return LazySession(sid, self._load_session)
+
+    def _load_session(self, session):
+        data = self._retrieve_session_data(self._get_store_id(session.sid))
+        if data is None:
+            # Unknown or expired id: start a fresh session under a new id
+            session.sid = self._generate_sid(self.sid_length)
+            if self.permanent:
+                dict.__setitem__(session, "_permanent", True)
+            return None
+        session.expires_at = data.pop("_expires_at")
+        return data
+
+    def should_set_storage(self, app, session):
+        if session.modified:
+            return True
+        if not app.config["SESSION_REFRESH_EACH_REQUEST"]:
+            return False
+        # Slide the expiry, but at most once per half lifetime
+        expires_at = getattr(session, "expires_at", None)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        return expires_at is None or expires_at - time.time() < lifetime / 2
+
+    def save_session(self, app, session, response):
+        if isinstance(session, LazySession) and not session.loaded:
+            return   # never accessed: nothing to write, cookie stays as it is
+        super().save_session(app, session, response)
+
+
+def init_app(app, collection=None):
+    """Install the tiered session interface on app"""
+    app.config.setdefault("PERMANENT_SESSION_LIFETIME", timedelta(hours=24))
+    app.session_interface = TieredSessionInterface(app, collection)
+    return app.session_interface
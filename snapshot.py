@@ -0,0 +1,152 @@
+"""
+Append-only, indexed snapshot of TMDb traffic for record/replay.
+
+Two files make up a snapshot:
+    <path>      data file, memory-mapped on replay; a magic header followed by
+                records of [header][normalized request key][response body]
+    <path>.idx  fixed-size entries of [key digest][record offset][record length]
+
+Only the index is read into memory (28 bytes per request); bodies are sliced
+out of the mapped data file on demand, so lookups are O(1) and large
+snapshots never have to fit in RAM. Later records for the same key win.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+MAGIC = b"MMSNAP1\n"
+RECORD_HEADER = struct.Struct("<IIHB")     # key length, body length, status, flags
+INDEX_ENTRY = struct.Struct("<16sQI")      # key digest, offset, record length
+FLAG_ZLIB = 1
+
+
+def key_digest(key):
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+class SnapshotWriter:
+    """Appends records; safe across threads and worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._recorded = {}       # key digest -> status of the record replay will use
+        self._data = open(path, "ab")
+        self._index = open(path + ".idx", "ab")
+        with self._locked():
+            if self._data.tell() == 0:
+                self._data.write(MAGIC)
+                self._data.flush()
+        if os.path.exists(path + ".idx"):
+            with open(path + ".idx", "rb") as f, open(path, "rb") as data:
+                while True:
+                    entry = f.read(INDEX_ENTRY.size)
+                    if len(entry) < INDEX_ENTRY.size:
+                        break
+                    digest, offset, _ = INDEX_ENTRY.unpack(entry)
+                    data.seek(offset)
+                    header = data.read(RECORD_HEADER.size)
+                    if len(header) == RECORD_HEADER.size:
+                        self._recorded[digest] = RECORD_HEADER.unpack(header)[2]
+
+    def _locked(self):
+        return _FileLock(self._data)
+
+    def record(self, key, status, body):
+        """Append one response unless the key is already recorded; a recorded
+        error is superseded by a later success (replay uses the last record)"""
+        digest = key_digest(key)
+        previous = self._recorded.get(digest)
+        if previous is not None and (_is_success(previous) or not _is_success(status)):
+            return
+        key_bytes = key.encode("utf-8")
+        packed = zlib.compress(body, 6)
+        flags = FLAG_ZLIB
+        if len(packed) >= len(body):
+            packed, flags = body, 0
+        record = RECORD_HEADER.pack(len(key_bytes), len(packed), status, flags) + key_bytes + packed
+
+        with self._lock, self._locked():
+            self._data.seek(0, os.SEEK_END)
+            offset = self._data.tell()
+            self._data.write(record)
+            self._data.flush()
+            self._index.write(INDEX_ENTRY.pack(digest, offset, len(record)))
+            self._index.flush()
+            self._recorded[digest] = status
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class SnapshotReader:
+    """Memory-mapped, read-only view of a snapshot"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a TMDb snapshot")
+
+        self._offsets = {}
+        with open(path + ".idx", "rb") as f:
+            index = f.read()
+        usable = len(index) - len(index) % INDEX_ENTRY.size
+        for digest, offset, length in INDEX_ENTRY.iter_unpack(index[:usable]):
+            # Ignore entries whose record was not fully written
+            if offset + length <= len(self._map):
+                self._offsets[digest] = (offset, length)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def lookup(self, key):
+        """Return (status, body bytes) for key, or None if it was never recorded"""
+        location = self._offsets.get(key_digest(key))
+        if location is None:
+            return None
+        offset, length = location
+        key_len, body_len, status, flags = RECORD_HEADER.unpack_from(self._map, offset)
+        start = offset + RECORD_HEADER.size
+        if self._map[start:start + key_len] != key.encode("utf-8"):
+            return None   # digest collision
+        body = self._map[start + key_len:start + key_len + body_len]
+        if flags & FLAG_ZLIB:
+            body = zlib.decompress(body)
+        return status, body
+
+    def records(self):
+        """Yield (key, status, body bytes) for every request in the snapshot"""
+        for offset, _ in self._offsets.values():
+            key_len, body_len, status, flags = RECORD_HEADER.unpack_from(self._map, offset)
+            start = offset + RECORD_HEADER.size
+            body = self._map[start + key_len:start + key_len + body_len]
+            if flags & FLAG_ZLIB:
+                body = zlib.decompress(body)
+            yield self._map[start:start + key_len].decode("utf-8"), status, body
+
+    def close(self):
+        self._map.close()
+
+
+def _is_success(status):
+    return 200 <= status < 300
+
+
+class _FileLock:
+    """Exclusive flock held while appending, so workers don't interleave records"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
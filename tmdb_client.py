@@ -0,0 +1,342 @@
+"""
+TMDb API client with a small in-process response cache.
+
+TMDB_SNAPSHOT_MODE=record appends every upstream response to the snapshot at
+TMDB_SNAPSHOT_PATH; TMDB_SNAPSHOT_MODE=replay serves requests from that
+snapshot only and never calls TMDb.
+
+Calls go through a circuit breaker: while it is open, or when TMDb fails,
+expired cache entries are served stale instead. With TMDB_HEDGE=1 a second
+request is fired once the first has run longer than the recent p95.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait
+
+import requests
+from dotenv import load_dotenv
+
+import metrics
+from circuit_breaker import tmdb_breaker
+from rate_limiter import PRIORITY_INTERACTIVE, RateLimitTimeout, tmdb_scheduler
+from snapshot import SnapshotReader, SnapshotWriter
+
+load_dotenv()
+
+API_KEY = os.getenv("TMDB_API_KEY")
+BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+CACHE_MAX_ENTRIES = int(os.getenv("TMDB_CACHE_MAX_ENTRIES", "2048"))
+SNAPSHOT_MODE = os.getenv("TMDB_SNAPSHOT_MODE", "off")    # off | record | replay
+SNAPSHOT_PATH = os.getenv("TMDB_SNAPSHOT_PATH", "tmdb_snapshot.bin")
+TMDB_HEDGE = os.getenv("TMDB_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("TMDB_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = 0.05
+# 404s and empty result pages are remembered for this long (capped by the caller's ttl)
+NEGATIVE_TTL = float(os.getenv("TMDB_NEGATIVE_TTL", "120"))
+
+_payload_listeners = []
+
+metrics.describe("upstream_hedged_requests_total", "counter", "Second requests fired after the p95 hedge delay")
+
+
+class NotFound:
+    """Negative cache entry for an upstream 404"""
+
+    def __init__(self, body):
+        self.body = body
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of upstream JSON payloads with per-entry TTL.
+
+    Expired entries stay around (until LRU eviction) so they can be served
+    stale when TMDb is unavailable.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pinned = frozenset()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached payload for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at < time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def get_stale(self, key):
+        """Return the cached payload for key even if it has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def set(self, key, payload, ttl):
+        """Store payload under key for ttl seconds"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                if oldest in self._pinned and len(self._pinned) < self.max_entries:
+                    # Pinned entries go back to the fresh end instead of out
+                    self._entries.move_to_end(oldest)
+                    continue
+                self._entries.popitem(last=False)
+
+    def pin(self, keys):
+        """Replace the set of keys LRU eviction must skip (hot entries)"""
+        with self._lock:
+            self._pinned = frozenset(keys)
+
+    def expires_in(self, key):
+        """Seconds until key expires (negative once stale), or None if not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else entry[0] - time.monotonic()
+
+    def payloads(self):
+        """Snapshot of (path, payload) for every cached JSON payload, fresh or stale"""
+        with self._lock:
+            entries = list(self._entries.items())
+        return [(key.split("?", 1)[0], payload) for key, (_, payload) in entries
+                if not isinstance(payload, NotFound)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES)
+_hedge_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TMDB_HEDGE_WORKERS", "64")),
+    thread_name_prefix="tmdb-hedge"
+) if TMDB_HEDGE else None
+
+snapshot_writer = SnapshotWriter(SNAPSHOT_PATH) if SNAPSHOT_MODE == "record" else None
+snapshot_reader = SnapshotReader(SNAPSHOT_PATH) if SNAPSHOT_MODE == "replay" else None
+if SNAPSHOT_MODE in ("record", "replay"):
+    print(f"🎞️ TMDb snapshot {SNAPSHOT_MODE} mode ({SNAPSHOT_PATH})")
+
+
+def snapshot_payloads():
+    """Yield (path, payload) for every successful response in the snapshot file.
+
+    Reads the replay snapshot, or in record mode what earlier runs recorded;
+    nothing when snapshots are off.
+    """
+    reader = snapshot_reader
+    if reader is None:
+        if snapshot_writer is None or not os.path.exists(SNAPSHOT_PATH + ".idx"):
+            return
+        reader = SnapshotReader(SNAPSHOT_PATH)
+    try:
+        for key, status, body in reader.records():
+            if 200 <= status < 300:
+                yield key.split("?", 1)[0], json.loads(body)
+    finally:
+        if reader is not snapshot_reader:
+            reader.close()
+
+
+def endpoint_label(path):
+    """Low-cardinality metrics label for a TMDb path (/movie/123 → /movie/{id})"""
+    return re.sub(r"/\d+", "/{id}", path)
+
+
+def cache_key(path, params=None):
+    """Build a stable cache key from a TMDb path and its query params"""
+    items = sorted((params or {}).items())
+    return path + "?" + "&".join(f"{k}={v}" for k, v in items)
+
+
+def _http_error(status, body, path):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    response.url = f"{BASE_URL}{path}"
+    return requests.HTTPError(f"{status} Error for TMDb {path}", response=response)
+
+
+def _replay(key, path):
+    """Serve a request from the snapshot, mirroring raise_for_status()"""
+    found = snapshot_reader.lookup(key)
+    metrics.record_cache("tmdb_snapshot", found is not None)
+    if found is None:
+        raise _http_error(503, b'{"status_message": "Not in snapshot"}', path)
+    status, body = found
+    if status >= 400:
+        raise _http_error(status, body, path)
+    return json.loads(body)
+
+
+def _retry_after(response):
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", 1)))
+    except ValueError:
+        return 1.0
+
+
+def _send(path, params, timeout):
+    """One upstream attempt, reported to metrics and the circuit breaker"""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = requests.get(
+            f"{BASE_URL}{path}",
+            params={**params, "api_key": API_KEY},
+            timeout=timeout
+        )
+        status = response.status_code
+        return response
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.record_upstream("tmdb", endpoint_label(path), status, seconds)
+        tmdb_breaker.record(status != "error" and status < 500, seconds)
+
+
+def _send_hedged(path, params, timeout, priority):
+    """Send, and if the reply is slower than recent p95, race a second copy.
+
+    Only used for idempotent GETs; the hedge needs a rate-limit token that is
+    available immediately, so hedging never queues behind real traffic.
+    """
+    delay = tmdb_breaker.latency_percentile(HEDGE_PERCENTILE) if _hedge_pool else None
+    if delay is None:
+        return _send(path, params, timeout)
+
+    # Pool threads don't see the request's stage breakdown, so time the wait here
+    with metrics.stage("tmdb"):
+        primary = _hedge_pool.submit(_send, path, params, timeout)
+        try:
+            return primary.result(timeout=max(HEDGE_MIN_DELAY, delay))
+        except FuturesTimeout:
+            pass
+        try:
+            tmdb_scheduler.acquire(priority, deadline=time.monotonic())
+        except RateLimitTimeout:
+            return primary.result()
+
+        metrics.inc("upstream_hedged_requests_total", service="tmdb")
+        secondary = _hedge_pool.submit(_send, path, params, timeout)
+        done, _ = wait([primary, secondary], return_when=FIRST_COMPLETED)
+    first = done.pop()
+    if first.exception() is None:
+        return first.result()
+    return (secondary if first is primary else primary).result()
+
+
+def _serve_stale(key, path, error):
+    """Fallback when TMDb is unavailable: stale cache entry or re-raise"""
+    stale = response_cache.get_stale(key)
+    metrics.record_cache("tmdb_stale", stale is not None)
+    if isinstance(stale, NotFound):
+        raise _http_error(404, stale.body, path)
+    if stale is not None:
+        return stale
+    raise error
+
+
+def _is_empty(data):
+    return isinstance(data, dict) and "results" in data and not data["results"]
+
+
+def _fetch(path, params, timeout, priority):
+    """Issue the upstream GET through the shared rate-limit scheduler.
+
+    The timeout doubles as the queueing deadline. A 429 from TMDb drains the
+    shared bucket for Retry-After seconds and the request is retried while
+    the deadline allows.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with metrics.stage("tmdb_rate_limit_wait"):
+                tmdb_scheduler.acquire(priority, deadline)
+        except RateLimitTimeout:
+            raise _http_error(429, b'{"status_message": "Upstream rate limit queue timeout"}', path)
+
+        response = _send_hedged(path, params, max(0.1, deadline - time.monotonic()), priority)
+        if response.status_code != 429:
+            return response
+        retry_after = _retry_after(response)
+        tmdb_scheduler.penalize(retry_after)
+        if time.monotonic() + retry_after >= deadline:
+            return response
+
+
+def add_payload_listener(fn):
+    """Call fn(path, data) for every payload freshly fetched (or replayed) from TMDb.
+
+    Listeners run on the request thread and must be quick and must not mutate data.
+    """
+    _payload_listeners.append(fn)
+    return fn
+
+
+def _notify(path, data):
+    for fn in _payload_listeners:
+        try:
+            fn(path, data)
+        except Exception as e:
+            print(f"⚠️ TMDb payload listener {fn.__name__} failed: {e}")
+
+
+def tmdb_get(path, params=None, ttl=0, timeout=10, priority=PRIORITY_INTERACTIVE, refresh=False):
+    """GET a TMDb endpoint and return its JSON, served from cache while fresh.
+
+    Cached payloads are shared between requests and must not be mutated.
+    refresh=True skips the cache read (the new payload is still cached).
+    Raises requests.HTTPError for non-2xx upstream responses (429 when the
+    rate-limit queue deadline expires).
+    """
+    params = dict(params or {})
+    key = cache_key(path, params)
+
+    if ttl and not refresh:
+        cached = response_cache.get(key)
+        metrics.record_cache("tmdb", cached is not None)
+        if isinstance(cached, NotFound):
+            raise _http_error(404, cached.body, path)
+        if cached is not None:
+            return cached
+
+    if snapshot_reader is not None:
+        data = _replay(key, path)
+        if ttl:
+            response_cache.set(key, data, ttl)
+        _notify(path, data)
+        return data
+
+    if not tmdb_breaker.allow():
+        return _serve_stale(key, path, _http_error(503, b'{"status_message": "TMDb circuit open"}', path))
+
+    try:
+        response = _fetch(path, params, timeout, priority)
+    except requests.RequestException as e:
+        return _serve_stale(key, path, e)
+    if response.status_code >= 500 or response.status_code == 429:
+        return _serve_stale(key, path, _http_error(response.status_code, response.content, path))
+
+    # Only answers worth replaying: successes and 404s, not auth or client errors
+    if snapshot_writer is not None and (response.ok or response.status_code == 404):
+        snapshot_writer.record(key, response.status_code, response.content)
+    if response.status_code == 404 and ttl:
+        response_cache.set(key, NotFound(response.content), min(ttl, NEGATIVE_TTL))
+    response.raise_for_status()
+    data = response.json()
+
+    if ttl:
+        response_cache.set(key, data, min(ttl, NEGATIVE_TTL) if _is_empty(data) else ttl)
+    _notify(path, data)
+    return data
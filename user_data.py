@@ -0,0 +1,251 @@
+"""
+Streaming export and import of a user's watchlist, ratings and preferences.
+
+Exports read MongoDB cursors EXPORT_BATCH documents at a time and write them
+out record by record as NDJSON or CSV, so memory stays flat however long the
+lists are. Every record has a "record" field (preferences, watchlist or
+rating). CSV uses the fixed CSV_COLUMNS and stores preferences as a JSON
+cell.
+
+Imports take the same formats and parse the request body as it arrives.
+Valid records are buffered per kind and written IMPORT_BATCH at a time with
+one unordered bulk upsert. A progress event follows every batch. Invalid
+lines are reported (up to MAX_REPORTED_ERRORS) and the import carries on.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+import database
+
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "500"))
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "500"))
+IMPORT_MAX_RECORDS = int(os.getenv("IMPORT_MAX_RECORDS", "100000"))
+MAX_LINE_BYTES = 64 * 1024
+MAX_REPORTED_ERRORS = 20
+READ_CHUNK = 64 * 1024
+
+KINDS = ("preferences", "watchlist", "rating")
+CSV_COLUMNS = [
+    "record", "tmdb_id", "content_type", "title", "poster_path",
+    "rating", "review", "date", "preferences",
+]
+CSV_MIMETYPE = "text/csv"
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+class RecordError(ValueError):
+    """A line that can't be imported; the import carries on"""
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def export_records(user_id, kinds=KINDS):
+    """Yield a user's records as flat dicts, streaming from cursors"""
+    database.flush_pending_writes()
+    if "preferences" in kinds:
+        user = database.get_user_by_id(user_id)
+        if user:
+            yield {"record": "preferences", "preferences": user.get("preferences", {})}
+    if "watchlist" in kinds:
+        for item in database.iter_watchlist(user_id, EXPORT_BATCH):
+            yield {
+                "record": "watchlist",
+                "tmdb_id": item.get("tmdb_id"),
+                "content_type": item.get("content_type"),
+                "title": item.get("title", ""),
+                "poster_path": item.get("poster_path", ""),
+                "date": _iso(item.get("added_date")),
+            }
+    if "rating" in kinds:
+        for item in database.iter_ratings(user_id, EXPORT_BATCH):
+            yield {
+                "record": "rating",
+                "tmdb_id": item.get("tmdb_id"),
+                "content_type": item.get("content_type"),
+                "rating": item.get("rating"),
+                "review": item.get("review", ""),
+                "date": _iso(item.get("created_date")),
+            }
+
+
+def to_ndjson(records, dumps):
+    for record in records:
+        yield dumps(record) + "\n"
+
+
+def to_csv(records):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, CSV_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for record in records:
+        if "preferences" in record:
+            record = dict(record, preferences=json.dumps(record["preferences"]))
+        writer.writerow(record)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def iter_lines(chunks, max_line=MAX_LINE_BYTES):
+    """Split a byte stream into decoded lines (newline kept) without buffering it all"""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace") + "\n"
+        if len(pending) > max_line:
+            raise RecordError(f"Line longer than {max_line} bytes")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def parse_ndjson(lines):
+    """Yield (line number, dict or RecordError) for each non-blank line"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, RecordError(f"Invalid JSON: {e}")
+            continue
+        yield number, record if isinstance(record, dict) else RecordError("Expected a JSON object")
+
+
+def parse_csv(lines):
+    """Yield (row number, dict or RecordError); the first row is the header"""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        if "preferences" in row and row.get("record") == "preferences":
+            try:
+                row["preferences"] = json.loads(row["preferences"] or "{}")
+            except ValueError:
+                yield reader.line_num, RecordError("preferences is not valid JSON")
+                continue
+        yield reader.line_num, row
+
+
+def _parse_date(value):
+    if not value:
+        return datetime.utcnow()
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise RecordError(f"Invalid date: {value!r}")
+
+
+def normalize(record):
+    """(kind, fields) for an import record; raises RecordError"""
+    kind = record.get("record")
+    if kind not in KINDS:
+        raise RecordError(f"record must be one of: {', '.join(KINDS)}")
+    if kind == "preferences":
+        preferences = record.get("preferences")
+        if not isinstance(preferences, dict):
+            raise RecordError("preferences must be an object")
+        return kind, preferences
+
+    try:
+        tmdb_id = int(record.get("tmdb_id"))
+    except (TypeError, ValueError):
+        raise RecordError(f"Invalid tmdb_id: {record.get('tmdb_id')!r}")
+    content_type = record.get("content_type") or "movie"
+    if content_type not in ("movie", "tv"):
+        raise RecordError("content_type must be movie or tv")
+    fields = {"tmdb_id": tmdb_id, "content_type": content_type}
+
+    if kind == "watchlist":
+        fields.update(
+            title=str(record.get("title") or ""),
+            poster_path=str(record.get("poster_path") or ""),
+            added_date=_parse_date(record.get("date")),
+        )
+        return kind, fields
+
+    try:
+        rating = float(record.get("rating"))
+    except (TypeError, ValueError):
+        raise RecordError(f"Invalid rating: {record.get('rating')!r}")
+    if not 1 <= rating <= 10:
+        raise RecordError("rating must be between 1 and 10")
+    fields.update(
+        rating=int(rating) if rating.is_integer() else rating,
+        review=str(record.get("review") or ""),
+        created_date=_parse_date(record.get("date")),
+    )
+    return kind, fields
+
+
+def import_records(user_id, parsed):
+    """Apply parsed (line, record) pairs in batches; yields progress events.
+
+    Events: {"progress": {...}} after each batch, {"error": ..., "line": n}
+    for rejected lines, and a final {"done": true, ...} summary.
+    """
+    database.flush_pending_writes()
+    counts = {"processed": 0, "watchlist": 0, "rating": 0, "preferences": 0, "errors": 0}
+    batches = {"watchlist": {}, "rating": {}}
+    writers = {"watchlist": database.bulk_upsert_watchlist, "rating": database.bulk_upsert_ratings}
+
+    def flush(kind):
+        batch = batches[kind]
+        if not batch:
+            return None
+        batches[kind] = {}
+        counts[kind] += writers[kind](user_id, list(batch.values()))
+        return {"progress": dict(counts)}
+
+    try:
+        for line, record in parsed:
+            if counts["processed"] >= IMPORT_MAX_RECORDS:
+                yield {"error": f"Stopped after {IMPORT_MAX_RECORDS} records", "line": line}
+                break
+            counts["processed"] += 1
+            try:
+                if isinstance(record, RecordError):
+                    raise record
+                kind, fields = normalize(record)
+            except RecordError as e:
+                counts["errors"] += 1
+                if counts["errors"] <= MAX_REPORTED_ERRORS:
+                    yield {"error": str(e), "line": line}
+                continue
+
+            if kind == "preferences":
+                if database.update_user_preferences(user_id, fields):
+                    counts["preferences"] += 1
+                continue
+            # Last record for a title wins within a batch, as it would one by one
+            batches[kind][(fields["tmdb_id"], fields["content_type"])] = fields
+            if len(batches[kind]) >= IMPORT_BATCH:
+                yield flush(kind)
+    except RecordError as e:
+        counts["errors"] += 1
+        yield {"error": str(e)}
+
+    for kind in batches:
+        progress = flush(kind)
+        if progress:
+            yield progress
+    yield dict(counts, done=True)
+
+
+if __name__ == "__main__":
+    # Support export: python user_data.py <email> [csv] > export.ndjson
+    import sys
+
+    user = database.get_user_by_email(sys.argv[1]) if len(sys.argv) > 1 else None
+    if user is None:
+        print("❌ Usage: python user_data.py <email> [csv] (user must exist)", file=sys.stderr)
+        raise SystemExit(1)
+    records = export_records(str(user["_id"]))
+    lines = to_csv(records) if sys.argv[2:] == ["csv"] else to_ndjson(records, lambda r: json.dumps(r, default=str))
+    sys.stdout.writelines(lines)
@@ -0,0 +1,281 @@
+"""
+Streaming speech-to-text for voice search.
+
+Clients POST audio to /api/voice-search while it is being recorded (chunked
+transfer encoding is fine). WAV and raw audio/L16 streams are decoded as
+they arrive: PCM is downmixed and resampled to 16 kHz with NumPy chunk by
+chunk and fed to an offline Vosk recognizer, so partial transcripts stream
+back while the user is still talking. Compressed uploads (webm, ogg, mp3,
+m4a) only decode as a whole container, so they are buffered and converted
+with pydub/ffmpeg once the upload ends.
+
+Recognition runs on a small dedicated pool (VOICE_WORKERS threads) and at
+most VOICE_MAX_STREAMS streams are admitted at once; further requests are
+turned away instead of tying up web workers. The Vosk model at
+VOSK_MODEL_PATH is loaded on first use.
+"""
+import io
+import json
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+
+try:
+    from vosk import KaldiRecognizer, Model, SetLogLevel
+    SetLogLevel(-1)
+except ImportError:
+    KaldiRecognizer = Model = None
+    print("⚠️ vosk not available (voice search disabled)")
+
+try:
+    from pydub import AudioSegment
+except ImportError:
+    AudioSegment = None
+    print("⚠️ pydub not available (voice search limited to WAV/L16 audio)")
+
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk-model-small-en-us-0.15")
+SAMPLE_RATE = 16000
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", "2"))
+VOICE_MAX_STREAMS = int(os.getenv("VOICE_MAX_STREAMS", "4"))
+VOICE_MAX_SECONDS = float(os.getenv("VOICE_MAX_SECONDS", "20"))
+VOICE_MAX_UPLOAD_BYTES = 5 * 1024 * 1024   # buffered (compressed) uploads
+READ_CHUNK = 8192
+
+WAV_TYPES = {"audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave"}
+COMPRESSED_FORMATS = {
+    "audio/webm": "webm", "audio/ogg": "ogg", "audio/mpeg": "mp3",
+    "audio/mp4": "mp4", "audio/x-m4a": "mp4", "audio/aac": "aac",
+}
+
+metrics.describe("voice_streams_total", "counter", "Voice search streams by outcome")
+metrics.describe("voice_recognize_seconds", "histogram", "Recognizer time per audio chunk")
+
+_model = None
+_model_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=VOICE_WORKERS, thread_name_prefix="voice")
+_slots = threading.BoundedSemaphore(VOICE_MAX_STREAMS)
+
+
+class AudioFormatError(ValueError):
+    """Upload is not in a format we can decode"""
+
+
+def is_available():
+    return KaldiRecognizer is not None and os.path.isdir(VOSK_MODEL_PATH)
+
+
+def get_model():
+    """Load the Vosk model once, on first use"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = Model(VOSK_MODEL_PATH)
+                print(f"✅ Loaded Vosk model from {VOSK_MODEL_PATH}")
+    return _model
+
+
+def try_admit():
+    """Reserve a stream slot without waiting; pair with release()"""
+    if _slots.acquire(blocking=False):
+        return True
+    metrics.inc("voice_streams_total", outcome="rejected")
+    return False
+
+
+def release():
+    _slots.release()
+
+
+class Resampler:
+    """Streaming linear-interpolation resampler (float32 mono in, out)"""
+
+    def __init__(self, src_rate, dst_rate=SAMPLE_RATE):
+        self.step = src_rate / dst_rate
+        self.pos = 0.0                          # next output position, in input samples
+        self.tail = np.zeros(0, dtype=np.float32)
+
+    def __call__(self, samples):
+        if self.step == 1:
+            return samples
+        x = np.concatenate([self.tail, samples])
+        if len(x) < 2:
+            self.tail = x
+            return np.zeros(0, dtype=np.float32)
+        positions = np.arange(self.pos, len(x) - 1, self.step)
+        out = np.interp(positions, np.arange(len(x)), x).astype(np.float32)
+        self.pos = (positions[-1] + self.step if len(positions) else self.pos) - (len(x) - 1)
+        self.tail = x[-1:]
+        return out
+
+
+class PCMDecoder:
+    """Incremental decoder for 16-bit PCM: returns 16 kHz mono s16le bytes"""
+
+    def __init__(self, rate, channels=1, big_endian=False):
+        if channels < 1 or not 8000 <= rate <= 192000:
+            raise AudioFormatError(f"Unsupported PCM layout: {rate} Hz, {channels} channels")
+        self.channels = channels
+        self.dtype = np.dtype(">i2" if big_endian else "<i2")
+        self.frame_bytes = 2 * channels
+        self.resample = Resampler(rate)
+        self._pending = b""
+
+    def feed(self, chunk):
+        data = self._pending + chunk
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        if not usable:
+            return b""
+        samples = np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        out = self.resample(samples)
+        return np.clip(out, -32768, 32767).astype("<i2").tobytes()
+
+    def finish(self):
+        return b""
+
+
+class WavDecoder:
+    """Parses the RIFF header from the first chunks, then streams PCM"""
+
+    def __init__(self):
+        self._header = b""
+        self._pcm = None
+
+    def feed(self, chunk):
+        if self._pcm is not None:
+            return self._pcm.feed(chunk)
+        self._header += chunk
+        pcm_start = self._parse_header()
+        if pcm_start is None:
+            if len(self._header) > 64 * 1024:
+                raise AudioFormatError("No data chunk in WAV header")
+            return b""
+        rest, self._header = self._header[pcm_start:], b""
+        return self._pcm.feed(rest)
+
+    def _parse_header(self):
+        buf = self._header
+        if len(buf) >= 12 and (buf[:4] != b"RIFF" or buf[8:12] != b"WAVE"):
+            raise AudioFormatError("Not a RIFF/WAVE stream")
+        pos, fmt = 12, None
+        while pos + 8 <= len(buf):
+            chunk_id, size = struct.unpack_from("<4sI", buf, pos)
+            if chunk_id == b"data":
+                if fmt is None:
+                    raise AudioFormatError("WAV data before fmt chunk")
+                self._pcm = PCMDecoder(rate=fmt[1], channels=fmt[0])
+                return pos + 8
+            if pos + 8 + size > len(buf):
+                return None
+            if chunk_id == b"fmt ":
+                audio_format, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", buf, pos + 8)
+                if audio_format != 1 or bits != 16:
+                    raise AudioFormatError("Only 16-bit PCM WAV is supported")
+                fmt = (channels, rate)
+            pos += 8 + size + (size & 1)
+        return None
+
+    def finish(self):
+        return b""
+
+
+class BufferedDecoder:
+    """Compressed containers: collect the upload, decode with pydub at the end"""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self._buf = io.BytesIO()
+
+    def feed(self, chunk):
+        if self._buf.tell() + len(chunk) > VOICE_MAX_UPLOAD_BYTES:
+            raise AudioFormatError("Audio upload too large")
+        self._buf.write(chunk)
+        return b""
+
+    def finish(self):
+        self._buf.seek(0)
+        try:
+            segment = AudioSegment.from_file(self._buf, format=self.fmt)
+        except Exception as e:
+            raise AudioFormatError(f"Could not decode {self.fmt} audio: {e}")
+        return segment.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(2).raw_data
+
+
+def open_decoder(mimetype, params):
+    """Decoder for a request's Content-Type; raises AudioFormatError"""
+    mimetype = (mimetype or "").lower()
+    if mimetype in WAV_TYPES:
+        return WavDecoder()
+    if mimetype == "audio/l16":
+        try:
+            rate, channels = int(params.get("rate", SAMPLE_RATE)), int(params.get("channels", 1))
+        except ValueError:
+            raise AudioFormatError("Invalid audio/L16 parameters")
+        return PCMDecoder(rate, channels, big_endian=True)   # RFC 2586: network byte order
+    if mimetype in COMPRESSED_FORMATS and AudioSegment is not None:
+        return BufferedDecoder(COMPRESSED_FORMATS[mimetype])
+    raise AudioFormatError(f"Unsupported audio type: {mimetype or 'none'}")
+
+
+class _Recognizer:
+    """One utterance's Vosk state; calls run on the voice pool"""
+
+    def __init__(self):
+        self._rec = KaldiRecognizer(get_model(), SAMPLE_RATE)
+
+    def accept(self, pcm):
+        with metrics.timer("voice_recognize_seconds"):
+            if self._rec.AcceptWaveform(pcm):
+                return "final", json.loads(self._rec.Result()).get("text", "")
+            return "partial", json.loads(self._rec.PartialResult()).get("partial", "")
+
+    def finish(self):
+        return json.loads(self._rec.FinalResult()).get("text", "")
+
+
+def transcribe(chunks, decoder):
+    """Yield {"partial"}, {"final"} events as audio arrives, then {"transcript"}.
+
+    chunks is an iterable of raw upload bytes; audio past VOICE_MAX_SECONDS
+    is ignored.
+    """
+    recognizer = _pool.submit(_Recognizer).result()
+    budget = int(VOICE_MAX_SECONDS * SAMPLE_RATE * 2)
+    segments, last_partial = [], ""
+
+    def run(pcm):
+        nonlocal budget, last_partial
+        pcm = pcm[:budget]
+        budget -= len(pcm)
+        for start in range(0, len(pcm), 2 * SAMPLE_RATE // 4):       # 250 ms steps
+            kind, text = _pool.submit(recognizer.accept, pcm[start:start + 2 * SAMPLE_RATE // 4]).result()
+            if kind == "final":
+                last_partial = ""
+                if text:
+                    segments.append(text)
+                    yield {"final": text}
+            elif text and text != last_partial:
+                last_partial = text
+                yield {"partial": text}
+
+    try:
+        for chunk in chunks:
+            if budget > 0:
+                yield from run(decoder.feed(chunk))
+        yield from run(decoder.finish())
+        tail = _pool.submit(recognizer.finish).result()
+    except AudioFormatError:
+        metrics.inc("voice_streams_total", outcome="bad_audio")
+        raise
+    if tail:
+        segments.append(tail)
+    metrics.inc("voice_streams_total", outcome="ok")
+    yield {"transcript": " ".join(segments)}
@@ -0,0 +1,257 @@
+"""
+Write-behind buffering for per-user MongoDB documents (ratings, watchlist).
+
+With WRITE_BEHIND=1, database.py acknowledges upserts and deletes as soon as
+they are queued here. Operations are keyed by (user_id, tmdb_id,
+content_type) and coalesced, last write wins, so a burst of rating edits or
+watchlist toggles on one title becomes a single write; $inc counters (the
+rating aggregates) are summed instead. A flusher thread sends everything
+queued every WRITE_BEHIND_INTERVAL seconds as one unordered bulk_write per
+collection; where upserts need the documents they replace (the rating
+aggregate deltas), those are read first in one query.
+
+Reads in the same process go through overlay_one()/overlay_many(), which
+run the MongoDB query and apply the queued operations on top of its result,
+so a user always sees their own writes. A batch that is being flushed may or
+may not be in a query's result, so a read that overlaps a flush is retried
+(the last attempt holds the flush off) and each write is applied exactly
+once. Other worker processes see a write once it is flushed. Queues are flushed at interpreter exit (gunicorn workers exit
+normally on SIGTERM); a failed flush is re-queued unless a newer write for
+the same key has arrived.
+"""
+import atexit
+import os
+import threading
+import time
+
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import metrics
+
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "1000"))
+OPTIMISTIC_READS = 2
+
+KEY_FIELDS = ("user_id", "tmdb_id", "content_type")
+
+metrics.describe("write_behind_ops_total", "counter", "Queued write-behind operations")
+metrics.describe("write_behind_coalesced_total", "counter", "Queued operations replaced by a newer one for the same key")
+metrics.describe("write_behind_flush_seconds", "histogram", "bulk_write duration per write-behind flush")
+
+_queues = []
+
+
+class WriteBehindQueue:
+    """Coalescing queue of upserts/deletes/increments for one collection"""
+
+    def __init__(self, collection, key_fields=KEY_FIELDS, on_upsert=None):
+        self.collection = collection
+        self.name = collection.name
+        self.key_fields = key_fields
+        # on_upsert(key, previous document or None, fields) runs for each upsert a flush wrote
+        self.on_upsert = on_upsert
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}     # key -> ("set", fields) | ("inc", amounts) | ("delete", None)
+        self._epoch = 0        # odd while a flush is writing
+        _queues.append(self)
+
+    def _enqueue(self, key, op):
+        with self._lock:
+            if key in self._pending:
+                metrics.inc("write_behind_coalesced_total", collection=self.name)
+            self._pending[key] = op
+            backlog = len(self._pending)
+        metrics.inc("write_behind_ops_total", collection=self.name, op=op[0])
+        if backlog >= WRITE_BEHIND_MAX_BATCH:
+            self.flush()
+
+    def upsert(self, key, fields):
+        """Queue {"$set": fields} with upsert for key"""
+        self._enqueue(key, ("set", dict(fields)))
+
+    def delete(self, key):
+        self._enqueue(key, ("delete", None))
+
+    def increment(self, key, amounts):
+        """Queue {"$inc": amounts} with upsert for key; queued increments add up"""
+        with self._lock:
+            current = self._pending.get(key)
+            if current is not None:
+                metrics.inc("write_behind_coalesced_total", collection=self.name)
+                amounts = _add_amounts(current[1], amounts)
+            self._pending[key] = ("inc", dict(amounts))
+            backlog = len(self._pending)
+        metrics.inc("write_behind_ops_total", collection=self.name, op="inc")
+        if backlog >= WRITE_BEHIND_MAX_BATCH:
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far in one bulk_write"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._epoch += 1
+            keys, requests, upserts = [], [], []
+            for key, (kind, fields) in batch.items():
+                filter_ = dict(zip(self.key_fields, key))
+                if kind == "delete":
+                    requests.append(DeleteOne(filter_))
+                elif kind == "inc":
+                    requests.append(UpdateOne(filter_, {"$inc": fields}, upsert=True))
+                else:
+                    requests.append(UpdateOne(filter_, {"$set": fields}, upsert=True))
+                    if self.on_upsert is not None:
+                        upserts.append((key, filter_, fields))
+                keys.append(key)
+            failed_keys = set(keys)
+            try:
+                with metrics.timer("write_behind_flush_seconds", collection=self.name):
+                    # The hook needs the documents the upserts replace, fetched in one query
+                    previous = {}
+                    if upserts:
+                        previous = {
+                            tuple(doc.get(f) for f in self.key_fields): doc
+                            for doc in self.collection.find({"$or": [f for _, f, _ in upserts]}, {"_id": 0})
+                        }
+                    try:
+                        self.collection.bulk_write(requests, ordered=False)
+                        failed_keys = set()
+                    except BulkWriteError as e:
+                        failed_keys = {keys[error["index"]] for error in e.details.get("writeErrors", [])}
+                        raise
+            except Exception as e:
+                print(f"⚠️ Write-behind flush to {self.name} failed, will retry: {e}")
+            finally:
+                with self._lock:
+                    if failed_keys:
+                        self._requeue({key: batch[key] for key in failed_keys})
+                    self._epoch += 1
+            if len(failed_keys) < len(keys):
+                for key, _, fields in upserts:
+                    if key not in failed_keys:
+                        self.on_upsert(key, previous.get(key), fields)
+            return len(keys) - len(failed_keys)
+
+    def _requeue(self, batch):
+        """Put a failed batch back unless a newer write for the key arrived (lock held)"""
+        for key, op in batch.items():
+            newer = self._pending.get(key)
+            if newer is None:
+                self._pending[key] = op
+            elif op[0] == newer[0] == "inc":
+                self._pending[key] = ("inc", _add_amounts(op[1], newer[1]))
+
+    def read(self, fetch):
+        """(fetch(), queued ops by key), where none of the ops is in fetch()'s result yet.
+
+        fetch runs the MongoDB query. If a flush starts while it runs, the
+        result may or may not include that batch, so the read is retried; the
+        last attempt holds off flushes.
+        """
+        for _ in range(OPTIMISTIC_READS):
+            with self._lock:
+                epoch, ops = self._epoch, dict(self._pending)
+            if epoch % 2:
+                continue
+            result = fetch()
+            if self._epoch == epoch:
+                return result, ops
+        with self._flush_lock:
+            with self._lock:
+                ops = dict(self._pending)
+            return fetch(), ops
+
+    def overlay_one(self, key, fetch):
+        """fetch()'s document for key (or None) as it will be once queued writes land"""
+        doc, ops = self.read(fetch)
+        return apply_op(doc, ops.get(key))
+
+    def overlay_many(self, user_id, fetch, sort_field=None):
+        """fetch()'s list of a user's documents with their queued writes applied"""
+        docs, ops = self.read(fetch)
+        ops = {key: op for key, op in ops.items() if key[0] == user_id}
+        if not ops:
+            return docs
+        merged = {}
+        for doc in docs:
+            merged[tuple(doc.get(f) for f in self.key_fields)] = doc
+        for key, op in ops.items():
+            doc = apply_op(merged.get(key), op)
+            if doc is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = doc
+        result = list(merged.values())
+        if sort_field:
+            result.sort(key=lambda d: (d.get(sort_field) is not None, d.get(sort_field)), reverse=True)
+        return result
+
+
+def apply_op(doc, op):
+    """doc (or None) with one queued operation (or None) applied"""
+    if op is None:
+        return doc
+    kind, fields = op
+    if kind == "delete":
+        return None
+    if kind == "inc":
+        return _apply_amounts(doc, fields)
+    return dict(doc or {}, **fields)
+
+
+def _add_amounts(a, b):
+    total = dict(a)
+    for field, amount in b.items():
+        total[field] = total.get(field, 0) + amount
+    return total
+
+
+def _apply_amounts(doc, amounts):
+    """Copy of doc with $inc amounts applied (dotted paths into subdocuments)"""
+    doc = dict(doc or {})
+    for path, amount in amounts.items():
+        target = doc
+        *parents, leaf = path.split(".")
+        for part in parents:
+            target[part] = dict(target.get(part) or {})
+            target = target[part]
+        target[leaf] = target.get(leaf, 0) + amount
+    return doc
+
+
+def flush_all():
+    for queue in _queues:
+        queue.flush()
+
+
+def _flusher():
+    while True:
+        time.sleep(WRITE_BEHIND_INTERVAL)
+        try:
+            flush_all()
+        except Exception as e:
+            print(f"⚠️ Write-behind flusher error: {e}")
+
+
+def _start_flusher():
+    threading.Thread(target=_flusher, name="write-behind", daemon=True).start()
+
+
+def _reset_after_fork():
+    # The parent's queued writes are the parent's to flush; children start empty
+    for queue in _queues:
+        queue._lock = threading.Lock()
+        queue._flush_lock = threading.Lock()
+        queue._pending, queue._epoch = {}, 0
+    _start_flusher()
+
+
+if WRITE_BEHIND:
+    _start_flusher()
+    atexit.register(flush_all)
+    os.register_at_fork(after_in_child=_reset_after_fork)